@@ -0,0 +1,128 @@
+import numpy as np
+from game.profiling import profiler
+from game.qtable import DenseQTable
+from game.replay_buffer import ReplayBuffer, batched_td_update
+from game.trace import DECISION, Q_UPDATE, tracer
+
+# get_state clamps each axis to this range
+STATE_LIMIT = 5
+
+class QLearningAI:
+    STATE_ENCODING = "base-dxdy-clamped-5"  # Checkpoints from another encoding are rejected
+
+    def __init__(self, grid_size):
+        # 5 actions: stay, up, down, left, right, for every clamped (dx, dy) state
+        self.q_table = DenseQTable((-STATE_LIMIT, -STATE_LIMIT), (STATE_LIMIT, STATE_LIMIT), 5)
+        self.visits = DenseQTable(self.q_table.low, self.q_table.high, 5)  # Updates per state/action, for merging tables
+        self.grid_size = grid_size
+        self.last_state = None
+        self.last_action = None
+        self.learning_rate = 0.8  # Increased learning rate
+        self.discount_factor = 0.95  # Increased discount factor
+        self.exploration_rate = 0.2  # Balanced exploration rate
+        self.memory = ReplayBuffer(10000)  # Store recent experiences for better learning
+        self.replay_batch_size = 10
+        self.prioritized_replay = False
+
+    def get_state(self, unit, player_base):
+        dx = player_base[0] - unit.x
+        dy = player_base[1] - unit.y
+        # Normalize distances to make state space smaller
+        dx = max(min(dx, STATE_LIMIT), -STATE_LIMIT)
+        dy = max(min(dy, STATE_LIMIT), -STATE_LIMIT)
+        return (dx, dy)
+
+    def choose_action(self, state, epsilon=None):
+        if epsilon is None:
+            epsilon = self.exploration_rate
+            
+        if np.random.rand() < epsilon:
+            # Weighted random choice based on Q-values
+            q_values = self.q_table[state]
+            exp_q = np.exp(q_values - q_values.max())  # Subtract max for numerical stability
+            cumulative = np.cumsum(exp_q)
+            action = int(np.searchsorted(cumulative, np.random.rand() * cumulative[-1], side="right"))
+            if tracer.enabled & DECISION:
+                tracer.emit(DECISION, state[0], state[1], action, 0)
+            return action
+            
+        # Get Q-values for current state
+        q_values = self.q_table[state]
+        
+        # Add small random noise to break ties
+        noise = np.random.randn(5) * 0.1
+        q_values = q_values + noise
+        
+        action = int(q_values.argmax())
+        if tracer.enabled & DECISION:
+            tracer.emit(DECISION, state[0], state[1], action, 1)
+        return action
+
+    def choose_actions(self, states, epsilon=None):
+        """Vectorized choose_action for an (n, 2) array of states."""
+        if epsilon is None:
+            epsilon = self.exploration_rate
+        q_values = self.q_table.values[self.q_table.indices(states)]
+        count = len(q_values)
+
+        # Greedy with small noise to break ties
+        greedy = (q_values + np.random.randn(count, 5) * 0.1).argmax(axis=1)
+
+        # Weighted random choice based on Q-values
+        exp_q = np.exp(q_values - q_values.max(axis=1, keepdims=True))
+        cumulative = np.cumsum(exp_q, axis=1)
+        draws = np.random.rand(count, 1) * cumulative[:, -1:]
+        weighted = (cumulative <= draws).sum(axis=1)
+
+        return np.where(np.random.rand(count) < epsilon, weighted, greedy)
+
+    def move(self, unit, player_base, grid):
+        state = self.get_state(unit, player_base)
+        action = self.choose_action(state)
+        
+        # Calculate potential moves
+        moves = [(0, 0), (0, -1), (0, 1), (-1, 0), (1, 0)]  # stay, up, down, left, right
+        dx, dy = moves[action]
+        
+        new_x, new_y = unit.x + dx, unit.y + dy
+        
+        # Blocked moves and moves off the grid leave the unit where it is
+        if 0 <= new_x < self.grid_size and 0 <= new_y < self.grid_size:
+            if grid.is_valid_position(new_x, new_y):
+                grid.move_unit(unit, new_x, new_y)
+            
+        self.last_state = state
+        self.last_action = action
+        return (unit.x, unit.y)
+
+    @profiler.timed()
+    def update_q(self, unit, player_base, reward, alpha=None, gamma=None):
+        if self.last_state is None or self.last_action is None:
+            return
+            
+        if alpha is None:
+            alpha = self.learning_rate
+        if gamma is None:
+            gamma = self.discount_factor
+            
+        next_state = self.get_state(unit, player_base)
+        best_next = self.q_table[next_state].max()
+        old_value = self.q_table[self.last_state][self.last_action]
+        
+        # Q-learning update with higher learning rate
+        new_value = old_value + alpha * (reward + gamma * best_next - old_value)
+        self.q_table[self.last_state][self.last_action] = new_value
+        self.visits[self.last_state][self.last_action] += 1
+        
+        # Store experience in memory
+        self.memory.add(self.q_table.index(self.last_state), self.last_action, reward, self.q_table.index(next_state))
+        
+        # Update Q-values from a minibatch of past experiences
+        if len(self.memory) > self.replay_batch_size:
+            slots = self.memory.sample(self.replay_batch_size, self.prioritized_replay)
+            td_errors = batched_td_update(self.q_table.values, self.memory.states[slots], self.memory.actions[slots],
+                                          self.memory.rewards[slots], self.memory.next_states[slots], alpha, gamma)
+            self.memory.update_priorities(slots, td_errors)
+        
+        if tracer.enabled & Q_UPDATE:
+            tracer.emit(Q_UPDATE, self.last_state[0], self.last_state[1], self.last_action, reward, new_value)
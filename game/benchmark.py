@@ -0,0 +1,349 @@
+"""
+Benchmarks for the game logic, the AI and drawing, at sizes well beyond a normal match.
+
+Every (grid size, unit count) case builds a seeded map, so the same options
+time the same positions on every commit. Each benchmark times its operation
+one call at a time and reports microseconds per call. Results are written
+as JSON, and --compare prints how each median moved against an earlier run.
+
+Run with: python -m game.benchmark --sizes 10 100 1000 --units 2 100 10000 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import numpy as np
+# Draw off-screen, and keep pygame's banner out of JSON written to stdout
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+from game.engine import GameEngine
+from game.grid import EMPTY
+from game.mapgen import generate_map
+from game.pathfinding import find_path
+from game.units import Corvette, Dreadnought
+
+BENCHMARKS = {}  # name -> function(scene, repeat) returning seconds per call
+PATH_UNITS = 100  # Player units the pathing benchmarks route to the AI base
+DRAW_SURFACE_LIMIT = 2000  # Largest whole-map drawing, in pixels per side; cells shrink to fit
+VIEWPORT = (800, 600)  # Camera view for the viewport drawing benchmark, as in the game window
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+class Scene:
+    """A seeded engine with units Corvettes, split between the sides, spread over the map.
+
+    A player Dreadnought next to a few AI Dreadnoughts is added for the
+    combat benchmarks.
+    """
+    def __init__(self, grid_size, units, seed):
+        random.seed(seed)
+        np.random.seed(seed)
+        self.grid_size = grid_size
+        self.engine = GameEngine(grid_size, seed=seed)
+        self.grid = self.engine.grid
+        free = np.flatnonzero((self.grid.terrain == EMPTY).ravel() & self.grid.passable_mask().ravel())
+        # The engine already placed one Corvette per side
+        cells = np.random.choice(free, size=min(max(units - 2, 0), len(free)), replace=False)
+        for index, cell in enumerate(cells.tolist()):
+            y, x = divmod(cell, grid_size)
+            self.grid.add_unit(Corvette(x, y, "player" if index % 2 else "ai"))
+        self.units = list(self.grid.units)
+        self.cluster = self._place_cluster()
+
+    def _free_cells_near(self, x, y, distance):
+        return [(cx, cy) for cx in range(x - distance, x + distance + 1) for cy in range(y - distance, y + distance + 1)
+                if abs(cx - x) + abs(cy - y) <= distance and (cx, cy) != (x, y)
+                and 0 <= cx < self.grid_size and 0 <= cy < self.grid_size
+                and self.grid.is_valid_position(cx, cy) and self.grid.terrain[cy, cx] == EMPTY]
+
+    def _place_cluster(self):
+        """A player Dreadnought with AI Dreadnoughts in its attack range, for combat benchmarks."""
+        cells = np.argwhere(self.grid.passable_mask() & (self.grid.terrain == EMPTY))
+        for y, x in cells[np.random.permutation(len(cells))].tolist():
+            near = self._free_cells_near(x, y, 2)
+            adjacent = [cell for cell in near if abs(cell[0] - x) + abs(cell[1] - y) == 1]
+            if adjacent and len(near) >= 3:
+                attacker = Dreadnought(x, y, "player")
+                self.grid.add_unit(attacker)
+                targets = []
+                for cx, cy in [adjacent[0]] + [cell for cell in near if cell != adjacent[0]][:4]:
+                    target = Dreadnought(cx, cy, "ai")
+                    self.grid.add_unit(target)
+                    targets.append(target)
+                return attacker, targets
+        raise ValueError(f"no room for a combat cluster on a {self.grid_size}x{self.grid_size} map")
+
+def _time_calls(repeat, call, setup=None):
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        call()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+@benchmark("generate_map")
+def bench_generate_map(scene, repeat):
+    seeds = iter(range(repeat))
+    return _time_calls(max(1, repeat // 10), lambda: generate_map(scene.grid_size, scene.grid_size, next(seeds)))
+
+@benchmark("calculate_valid_moves")
+def bench_valid_moves(scene, repeat):
+    grid = scene.grid
+    units = iter(scene.units * (repeat // len(scene.units) + 1))
+
+    def setup():
+        grid.version += 1  # Drop cached reachability so every call runs the flood fill
+    return _time_calls(repeat, lambda: grid.calculate_valid_moves(next(units)), setup)
+
+@benchmark("move_unit")
+def bench_move_unit(scene, repeat):
+    grid = scene.grid
+    unit = next((unit for unit in scene.units if scene._free_cells_near(unit.x, unit.y, 1)), None)
+    if unit is None:
+        return []
+    # Step back and forth between the unit's cell and a free neighbour
+    cells = [scene._free_cells_near(unit.x, unit.y, 1)[0], (unit.x, unit.y)]
+    steps = iter(cells * (repeat // 2 + 1))
+    return _time_calls(repeat, lambda: grid.move_unit(unit, *next(steps)))
+
+@benchmark("handle_combat")
+def bench_handle_combat(scene, repeat):
+    attacker, targets = scene.cluster
+    target = targets[0]
+
+    def setup():
+        attacker.has_attacked = False
+        target.health = target.max_health
+    return _time_calls(repeat, lambda: scene.grid.handle_combat(attacker, target.x, target.y), setup)
+
+@benchmark("area_attack")
+def bench_area_attack(scene, repeat):
+    attacker, targets = scene.cluster
+
+    def setup():
+        attacker.has_attacked = False
+        for target in targets:
+            target.health = target.max_health
+    return _time_calls(repeat, lambda: scene.grid.use_ability(attacker, "Area Attack"), setup)
+
+@benchmark("remove_dead_units")
+def bench_remove_dead_units(scene, repeat):
+    grid = scene.grid
+    victims = [unit for unit in scene.units[:max(1, len(scene.units) // 100)] if unit in grid.units]
+
+    def setup():
+        # Put last call's victims back, then kill them again
+        for unit in victims:
+            unit.health = unit.max_health
+            if unit not in grid.units:
+                grid.add_unit(unit)
+        for unit in victims:
+            unit.health = 0
+    durations = _time_calls(repeat, grid.remove_dead_units, setup)
+    for unit in victims:
+        unit.health = unit.max_health
+        grid.add_unit(unit)
+    return durations
+
+@benchmark("update_q")
+def bench_update_q(scene, repeat):
+    ai = scene.engine.ai_rl
+    unit = scene.units[0]
+
+    def setup():
+        ai.last_state = ai.get_state(unit, scene.engine.player_base)
+        ai.last_action = 0
+    return _time_calls(repeat, lambda: ai.update_q(unit, scene.engine.player_base, 1), setup)
+
+@benchmark("distance_field_build")
+def bench_distance_field_build(scene, repeat):
+    field = scene.engine.base_distances[scene.engine.player_base]
+    return _time_calls(max(1, repeat // 10), field.refresh, field.invalidate)
+
+@benchmark("distance_field_update")
+def bench_distance_field_update(scene, repeat):
+    grid = scene.grid
+    field = scene.engine.base_distances[scene.engine.player_base]
+    unit = next((unit for unit in scene.units if scene._free_cells_near(unit.x, unit.y, 1)), None)
+    if unit is None:
+        return []
+    field.refresh()
+    # Repair the field after the unit steps back and forth, as rewards read it
+    cells = [scene._free_cells_near(unit.x, unit.y, 1)[0], (unit.x, unit.y)]
+    steps = iter(cells * (repeat // 2 + 1))
+    return _time_calls(repeat, field.refresh, lambda: grid.move_unit(unit, *next(steps)))
+
+def _path_starts(scene):
+    return [(unit.x, unit.y) for unit in scene.units if unit.owner == "player"][:PATH_UNITS]
+
+@benchmark("team_paths")
+def bench_team_paths(scene, repeat):
+    # Full paths for up to PATH_UNITS units in one hierarchical query, once the clusters are built
+    pathfinder = scene.engine.pathfinder
+    pathfinder.refresh()
+    starts = _path_starts(scene)
+    return _time_calls(max(1, repeat // 10), lambda: pathfinder.paths(starts, scene.engine.ai_base))
+
+@benchmark("unit_path_flat")
+def bench_unit_path_flat(scene, repeat):
+    # A* over the whole grid for one of the same units per call; a team costs this times its size
+    grid = scene.grid
+    starts = iter(_path_starts(scene) * repeat)
+    return _time_calls(max(1, repeat // 10),
+                       lambda: find_path(grid.is_valid_position, next(starts), scene.engine.ai_base))
+
+@benchmark("hpa_update")
+def bench_hpa_update(scene, repeat):
+    grid = scene.grid
+    pathfinder = scene.engine.pathfinder
+    unit = next((unit for unit in scene.units if scene._free_cells_near(unit.x, unit.y, 1)), None)
+    if unit is None:
+        return []
+    pathfinder.refresh()
+    # Rebuild the clusters around a unit stepping back and forth
+    cells = [scene._free_cells_near(unit.x, unit.y, 1)[0], (unit.x, unit.y)]
+    steps = iter(cells * (repeat // 2 + 1))
+    return _time_calls(repeat, pathfinder.refresh, lambda: grid.move_unit(unit, *next(steps)))
+
+@benchmark("ai_turn")
+def bench_ai_turn(scene, repeat):
+    engine = scene.engine
+    # A whole turn is heavy at scale; time fewer of them
+    return _time_calls(max(1, repeat // 20), engine.ai_turn, engine.grid.reset_turn_flags)
+
+def _draw_setup(scene):
+    import pygame
+    from game.camera import Camera
+    from game.ui import UI
+    pygame.init()
+    grid = scene.grid
+    camera = Camera(VIEWPORT[0], VIEWPORT[1], grid.width, grid.height, grid.cell_size)
+    camera.center_on(scene.cluster[0].x, scene.cluster[0].y)
+    # Whole-map drawing shrinks the cells so the map fits on one surface
+    grid.cell_size = max(1, min(grid.cell_size, DRAW_SURFACE_LIMIT // scene.grid_size))
+    map_width, map_height = grid.width * grid.cell_size, grid.height * grid.cell_size
+    screen = pygame.Surface((max(map_width, VIEWPORT[0]) + 250, max(map_height, VIEWPORT[1]) + 100))
+    return screen, UI(screen, grid, scene.engine.game_state, camera), camera
+
+@benchmark("grid_draw")
+def bench_grid_draw(scene, repeat):
+    screen, _, _ = _draw_setup(scene)
+    return _time_calls(max(1, repeat // 10), lambda: scene.grid.draw(screen))
+
+@benchmark("grid_draw_viewport")
+def bench_grid_draw_viewport(scene, repeat):
+    screen, _, camera = _draw_setup(scene)
+    return _time_calls(max(1, repeat // 10), lambda: scene.grid.draw(screen, camera=camera))
+
+@benchmark("ui_draw")
+def bench_ui_draw(scene, repeat):
+    _, ui, _ = _draw_setup(scene)
+    ui.draw()
+    return _time_calls(repeat, ui.draw)
+
+@benchmark("ui_draw_panel")
+def bench_ui_draw_panel(scene, repeat):
+    screen, ui, _ = _draw_setup(scene)
+    return _time_calls(repeat, lambda: ui.draw_panel(screen))
+
+def summarize(durations):
+    micros = np.asarray(durations) * 1e6
+    return {
+        "calls": len(micros),
+        "mean_us": float(micros.mean()),
+        "median_us": float(np.median(micros)),
+        "p95_us": float(np.percentile(micros, 95)),
+        "min_us": float(micros.min()),
+    }
+
+def environment():
+    """What the numbers were measured on, so runs from different commits can be told apart."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    try:
+        import pygame
+        pygame_version = pygame.version.ver
+    except ImportError:
+        pygame_version = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pygame": pygame_version,
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+def run(sizes, unit_counts, names, repeat=200, seed=0):
+    """Run the named benchmarks on every case that fits and return the result rows."""
+    results = []
+    for grid_size in sizes:
+        for units in unit_counts:
+            # Leave the map at least three quarters empty
+            if units > grid_size * grid_size // 4:
+                continue
+            for name in names:
+                scene = Scene(grid_size, units, seed)
+                durations = BENCHMARKS[name](scene, repeat)
+                if not durations:
+                    continue
+                row = {"benchmark": name, "grid_size": grid_size, "units": units, **summarize(durations)}
+                results.append(row)
+                print(f"{name:<22} {grid_size:>5}x{grid_size:<5} {units:>6} units  "
+                      f"median {row['median_us']:10.1f} us  p95 {row['p95_us']:10.1f} us", file=sys.stderr)
+    return results
+
+def compare(results, baseline):
+    """Print each case's median against the same case in a baseline run."""
+    old = {(row["benchmark"], row["grid_size"], row["units"]): row for row in baseline["results"]}
+    for row in results:
+        before = old.get((row["benchmark"], row["grid_size"], row["units"]))
+        if before is None:
+            continue
+        ratio = row["median_us"] / before["median_us"]
+        print(f"{row['benchmark']:<22} {row['grid_size']:>5}x{row['grid_size']:<5} {row['units']:>6} units  "
+              f"{before['median_us']:10.1f} -> {row['median_us']:10.1f} us  ({ratio:.2f}x)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark game logic, AI and drawing at scale.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="grid sizes")
+    parser.add_argument("--units", type=int, nargs="+", default=[2, 100, 10000], help="total unit counts")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), default=list(BENCHMARKS),
+                        help="benchmarks to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=200, help="timed calls per benchmark and case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results to this JSON file instead of stdout")
+    parser.add_argument("--compare", help="JSON file from an earlier run to compare medians against")
+    args = parser.parse_args()
+
+    report = {
+        "environment": environment(),
+        "options": {"sizes": args.sizes, "units": args.units, "repeat": args.repeat, "seed": args.seed},
+        "results": run(args.sizes, args.units, args.only, args.repeat, args.seed),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    elif not args.compare:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report["results"], json.load(f))
+
+if __name__ == "__main__":
+    main()
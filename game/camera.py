@@ -0,0 +1,91 @@
+class Camera:
+    """The part of the map shown in the viewport, and the zoom it is shown at.
+
+    Positions on the map are measured in pixels at the current zoom, with
+    (x, y) the map pixel at the viewport's top left. Drawing code works from
+    origin (where cell (0, 0) lands on screen), cell_size and visible_cells.
+    version changes whenever any of them do.
+    """
+    ZOOM_LEVELS = (6, 8, 10, 13, 16, 20, 25, 32, 40, 50, 64, 80)  # Cell sizes in pixels
+
+    def __init__(self, viewport_width, viewport_height, grid_width, grid_height, cell_size=50):
+        self.viewport_width = viewport_width
+        self.viewport_height = viewport_height
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.zoom_levels = sorted(set(self.ZOOM_LEVELS) | {cell_size})
+        self.cell_size = cell_size
+        self.x = 0
+        self.y = 0
+        self.version = 0
+
+    @property
+    def origin(self):
+        """Screen position of the top left corner of cell (0, 0)."""
+        return (-self.x, -self.y)
+
+    def _clamp(self):
+        self.x = max(0, min(self.x, self.grid_width * self.cell_size - self.viewport_width))
+        self.y = max(0, min(self.y, self.grid_height * self.cell_size - self.viewport_height))
+
+    def pan(self, dx, dy):
+        """Scroll the view by (dx, dy) screen pixels, stopping at the edges of the map."""
+        old = (self.x, self.y)
+        self.x += dx
+        self.y += dy
+        self._clamp()
+        if (self.x, self.y) != old:
+            self.version += 1
+
+    def center_on(self, cell_x, cell_y):
+        """Scroll so the given cell is in the middle of the view, as far as the map edges allow."""
+        self.pan(int((cell_x + 0.5) * self.cell_size - self.viewport_width / 2) - self.x,
+                 int((cell_y + 0.5) * self.cell_size - self.viewport_height / 2) - self.y)
+
+    def zoom(self, steps, anchor=None):
+        """Move steps zoom levels in (positive) or out, keeping the map point under anchor in place.
+
+        anchor is a screen position inside the viewport, the middle of the viewport by default.
+        """
+        index = self.zoom_levels.index(self.cell_size)
+        new_size = self.zoom_levels[max(0, min(len(self.zoom_levels) - 1, index + steps))]
+        if new_size == self.cell_size:
+            return
+        anchor_x, anchor_y = anchor if anchor is not None else (self.viewport_width // 2, self.viewport_height // 2)
+        scale = new_size / self.cell_size
+        self.x = int((self.x + anchor_x) * scale - anchor_x)
+        self.y = int((self.y + anchor_y) * scale - anchor_y)
+        self.cell_size = new_size
+        self._clamp()
+        self.version += 1
+
+    def contains_point(self, screen_x, screen_y):
+        return 0 <= screen_x < self.viewport_width and 0 <= screen_y < self.viewport_height
+
+    def overlaps_view(self, rect):
+        """Whether any of a screen rect (anything with left, top, width and height) is inside the viewport."""
+        return (rect.left < self.viewport_width and rect.left + rect.width > 0
+                and rect.top < self.viewport_height and rect.top + rect.height > 0)
+
+    def screen_to_cell(self, screen_x, screen_y):
+        """The map cell under a screen position, or None if it isn't over the map."""
+        if not self.contains_point(screen_x, screen_y):
+            return None
+        cell_x = (screen_x + self.x) // self.cell_size
+        cell_y = (screen_y + self.y) // self.cell_size
+        if 0 <= cell_x < self.grid_width and 0 <= cell_y < self.grid_height:
+            return (cell_x, cell_y)
+        return None
+
+    def cell_to_screen(self, cell_x, cell_y):
+        """Screen position of a cell's top left corner; fractional cells are allowed."""
+        return (int(cell_x * self.cell_size) - self.x, int(cell_y * self.cell_size) - self.y)
+
+    def visible_cells(self):
+        """(x0, y0, x1, y1) bounds of the cells at least partly in view, with x1 and y1 exclusive."""
+        size = self.cell_size
+        x0 = self.x // size
+        y0 = self.y // size
+        x1 = min(self.grid_width, -(-(self.x + self.viewport_width) // size))
+        y1 = min(self.grid_height, -(-(self.y + self.viewport_height) // size))
+        return (x0, y0, x1, y1)
@@ -0,0 +1,148 @@
+"""
+Binary Q-table checkpoints.
+
+A checkpoint file is a fixed header followed by the raw table values:
+
+    magic (4s) | format version (H) | encoding length (H) | width (I) | height (I)
+    | rows (Q) | columns (Q) | dtype (8s) | data offset (Q) | encoding (utf-8) | padding | values
+
+Tables are loaded as private copy-on-write maps of the file, so nothing is
+parsed or read up front and training writes never reach the file. Saves
+write a new file and rename it over the old one, which leaves existing maps
+of the old file intact. Windows can't replace a mapped file, so there the
+table is read into memory instead.
+"""
+import os
+import queue
+import struct
+import threading
+import numpy as np
+
+MAGIC = b"NDQT"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHIIQQ8sQ")
+ALIGNMENT = 64
+WRITE_CHUNK = 1 << 20  # Bytes of a table written per write call, so saving never makes a second copy of it
+
+class CheckpointError(ValueError):
+    """Raised when a checkpoint is unreadable or doesn't match the table it should fill."""
+
+def write_table(path, values, encoding, grid_size):
+    """Write a Q-table to path, replacing any existing file atomically."""
+    values = np.ascontiguousarray(values)
+    encoded = encoding.encode("utf-8")
+    offset = -(-(HEADER.size + len(encoded)) // ALIGNMENT) * ALIGNMENT
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(encoded), grid_size[0], grid_size[1],
+                         values.shape[0], values.shape[1], values.dtype.str.encode("ascii"), offset)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(encoded)
+        f.write(b"\0" * (offset - HEADER.size - len(encoded)))
+        rows_per_chunk = max(1, WRITE_CHUNK // max(1, values[:1].nbytes))
+        for start in range(0, len(values), rows_per_chunk):
+            f.write(values[start:start + rows_per_chunk].data)
+    os.replace(temp_path, path)
+
+def load_table(path, encoding, grid_size, shape):
+    """Map a Q-table written by write_table copy-on-write, or read it into memory on Windows.
+
+    Raises CheckpointError if the file was written for a different state
+    encoding, grid size or table shape.
+    """
+    with open(path, "rb") as f:
+        raw = f.read(HEADER.size)
+        if len(raw) < HEADER.size:
+            raise CheckpointError(f"{path} is too short to be a checkpoint")
+        magic, version, encoding_length, width, height, rows, columns, dtype, offset = HEADER.unpack(raw)
+        stored_encoding = f.read(encoding_length).decode("utf-8", errors="replace")
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise CheckpointError(f"{path} is not a version {FORMAT_VERSION} checkpoint")
+    if stored_encoding != encoding:
+        raise CheckpointError(f"{path} uses state encoding {stored_encoding!r}, expected {encoding!r}")
+    if (width, height) != tuple(grid_size):
+        raise CheckpointError(f"{path} was trained on a {width}x{height} grid, expected {grid_size[0]}x{grid_size[1]}")
+    if (rows, columns) != tuple(shape):
+        raise CheckpointError(f"{path} holds a {rows}x{columns} table, expected {shape[0]}x{shape[1]}")
+    dtype = np.dtype(dtype.rstrip(b"\0").decode("ascii"))
+    if os.path.getsize(path) < offset + rows * columns * dtype.itemsize:
+        raise CheckpointError(f"{path} is truncated")
+    if os.name == "nt":
+        return np.fromfile(path, dtype=dtype, count=rows * columns, offset=offset).reshape(rows, columns)
+    return np.memmap(path, dtype=dtype, mode="c", offset=offset, shape=(rows, columns))
+
+class CheckpointWriter:
+    """Writes checkpoints on a background thread so the caller never waits on disk I/O.
+
+    submit() copies the whole table at once into a buffer kept per path, so
+    every checkpoint holds the table as it was at one moment of training,
+    then hands the buffer to the thread to write. The buffer is reused by
+    the path's next checkpoint unless it is still waiting to be written.
+    """
+    def __init__(self):
+        self._buffers = {}  # path -> buffer its values are copied into
+        self._queued = {}  # path -> checkpoints of it the thread hasn't finished writing
+        self._lock = threading.Lock()  # Guards _queued
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, path, values, encoding, grid_size):
+        """Snapshot a table and queue it for writing."""
+        buffer = self._buffers.get(path)
+        with self._lock:
+            busy = self._queued.get(path, 0) > 0
+            self._queued[path] = self._queued.get(path, 0) + 1
+        if busy or buffer is None or buffer.shape != values.shape or buffer.dtype != values.dtype:
+            buffer = self._buffers[path] = np.empty(values.shape, dtype=values.dtype)
+        np.copyto(buffer, values)
+        self._jobs.put((path, buffer, encoding, grid_size))
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            try:
+                write_table(*job)
+            except OSError as error:
+                print(f"Failed to write checkpoint {job[0]}: {error}")
+            finally:
+                with self._lock:
+                    self._queued[job[0]] -= 1
+
+    def close(self):
+        """Write every queued table and stop the thread."""
+        self._jobs.put(None)
+        self._thread.join()
+
+def engine_tables(engine):
+    """Name, DenseQTable and state encoding of every Q-table in a GameEngine."""
+    tables = [("ai", engine.ai_rl.q_table, engine.ai_rl.STATE_ENCODING)]
+    for index, obstacle in enumerate(engine.grid.live_obstacles):
+        tables.append((f"live_obstacle_{index}", obstacle.q_table, obstacle.STATE_ENCODING))
+    return tables
+
+def load_engine_checkpoint(engine, directory):
+    """Fill an engine's Q-tables from a checkpoint directory, skipping missing or incompatible files."""
+    grid_size = (engine.grid.width, engine.grid.height)
+    for name, table, encoding in engine_tables(engine):
+        path = os.path.join(directory, f"{name}.qtable")
+        if not os.path.exists(path):
+            continue
+        try:
+            table.values = load_table(path, encoding, grid_size, table.values.shape)
+            print(f"Loaded {name} Q-table from {path}")
+        except CheckpointError as error:
+            print(f"Ignoring checkpoint: {error}")
+
+def save_engine_checkpoint(engine, directory, writer=None):
+    """Save an engine's Q-tables, in the background if a CheckpointWriter is given."""
+    os.makedirs(directory, exist_ok=True)
+    grid_size = (engine.grid.width, engine.grid.height)
+    for name, table, encoding in engine_tables(engine):
+        path = os.path.join(directory, f"{name}.qtable")
+        if writer is not None:
+            writer.submit(path, table.values, encoding, grid_size)
+        else:
+            write_table(path, table.values, encoding, grid_size)
@@ -0,0 +1,186 @@
+import heapq
+import numpy as np
+from game.grid import NO_ENTITY, WALL
+from game.pathfinding import UNREACHABLE, fill_distances
+
+UNCLAIMED_RESOURCES = "unclaimed resources"  # DistanceField goals: every resource node nobody has captured
+# A repair gives up and rebuilds with the vectorized BFS once it has visited this share of the cells
+REPAIR_SHARE = 32
+MIN_REPAIR_LIMIT = 256
+
+class DistanceField:
+    """Walking distance from every cell of a grid to the nearest goal, kept up to date as the grid changes.
+
+    goals is a list of (x, y) cells, or UNCLAIMED_RESOURCES. Paths go four
+    ways around walls, units and live obstacles. An occupied cell still gets
+    the distance it would have if it were free to leave, so a unit can read
+    the distance from its own cell.
+
+    The first read builds the field with one BFS. After that the grid
+    reports every cell whose occupancy or resource owner changes, and the
+    next read repairs only what those changes affect: freed cells and new
+    goals spread shorter distances outwards, and cells that lost every
+    shortest path are cleared and filled in again from their neighbours.
+    A terrain change or a snapshot restore rebuilds the field, as does a
+    repair that reaches too much of the map, such as a unit stepping into
+    the only way out of a base.
+    """
+    def __init__(self, grid, goals):
+        self.grid = grid
+        self.goals = goals if goals == UNCLAIMED_RESOURCES else frozenset(map(tuple, goals))
+        self.stride = grid.width + 2  # Layers are padded with a wall border, so neighbours never leave them
+        size = (grid.height + 2) * self.stride
+        self.distances = np.full(size, UNREACHABLE, dtype=np.int32)
+        self.walls = np.ones(size, dtype=bool)
+        self.blocked = np.ones(size, dtype=bool)  # Walls and occupied cells, which paths don't go through
+        self.is_goal = np.zeros(size, dtype=bool)
+        self.repair_limit = max(size // REPAIR_SHARE, MIN_REPAIR_LIMIT)
+        self.changed = set()  # (x, y) cells the grid reported changed since the last read
+        self._terrain_version = None  # Terrain the field was built for, or None to rebuild on the next read
+        self._resource_at = {}
+        grid.change_listeners.append(self)
+
+    def invalidate(self):
+        """Rebuild from scratch on the next read, e.g. after the grid's layers were replaced."""
+        self._terrain_version = None
+
+    def distance(self, x, y):
+        """Steps from a cell to the nearest goal, or UNREACHABLE."""
+        self.refresh()
+        return self.distances.item((y + 1) * self.stride + x + 1)
+
+    def layer(self):
+        """All distances as a [y, x] array view, valid until the grid changes."""
+        self.refresh()
+        return self.distances.reshape(-1, self.stride)[1:-1, 1:-1]
+
+    def refresh(self):
+        if self._terrain_version != self.grid.terrain_version:
+            self.rebuild()
+        elif self.changed:
+            self._update()
+
+    def rebuild(self):
+        grid = self.grid
+        self.walls = np.pad(grid.terrain == WALL, 1, constant_values=True).ravel()
+        self.blocked = np.pad(grid.entity_ids != NO_ENTITY, 1).ravel() | self.walls
+        self._resource_at = {(resource.x, resource.y): resource for resource in grid.resources}
+        goals = np.zeros((grid.height, grid.width), dtype=bool)
+        if self.goals == UNCLAIMED_RESOURCES:
+            goals = grid.resource_mask()
+            for resource in grid.owned_resources:
+                goals[resource.y, resource.x] = False
+        else:
+            for x, y in self.goals:
+                goals[y, x] = True
+        self.is_goal = np.pad(goals, 1).ravel()
+        fill_distances(self.distances, self.stride, self.is_goal, self.walls, self.blocked)
+        self.changed.clear()
+        self._terrain_version = grid.terrain_version
+
+    def _cell_is_goal(self, x, y):
+        if self.goals == UNCLAIMED_RESOURCES:
+            resource = self._resource_at.get((x, y))
+            return resource is not None and resource.owner is None
+        return (x, y) in self.goals
+
+    def _update(self):
+        """Bring the distances up to date with the changed cells."""
+        stride = self.stride
+        distances, blocked, is_goal = self.distances, self.blocked, self.is_goal
+        entity_ids = self.grid.entity_ids
+        raised = []  # Cells whose distance may have gone up
+        lowered = []  # Cells paths may now go through more cheaply
+        for x, y in self.changed:
+            cell = (y + 1) * stride + x + 1
+            if self.walls.item(cell):
+                continue
+            was_goal = is_goal.item(cell)
+            was_open = was_goal or not blocked.item(cell)
+            goal = self._cell_is_goal(x, y)
+            is_open = goal or entity_ids.item(y, x) == NO_ENTITY
+            blocked[cell] = entity_ids.item(y, x) != NO_ENTITY
+            is_goal[cell] = goal
+            if was_goal and not goal:
+                raised.append(cell)
+            if was_open and not is_open:
+                raised.extend((cell - 1, cell + 1, cell - stride, cell + stride))
+            if goal and not was_goal:
+                distances[cell] = 0
+                lowered.append(cell)
+            elif is_open and not was_open:
+                lowered.append(cell)
+        self.changed.clear()
+        # Spread shorter distances first, so cells the changes leave supported aren't cleared and filled in again
+        if lowered and not self._spread(lowered):
+            self.rebuild()
+            return
+        if raised:
+            sources = self._clear_unsupported(raised)
+            if sources is None or sources and not self._spread(sources):
+                self.rebuild()
+
+    def _is_open(self, cell):
+        return self.is_goal.item(cell) or not self.blocked.item(cell)
+
+    def _clear_unsupported(self, cells):
+        """Clear cells, and everything downhill of them, that no longer have a neighbour one step closer.
+
+        Returns the cleared cells that border the rest of the field, with the
+        distance they get from it, to spread from again; None if too many
+        cells were visited.
+        """
+        stride = self.stride
+        distances = self.distances
+        heap = [(distances.item(cell), cell) for cell in cells]
+        heapq.heapify(heap)
+        seen = set()
+        cleared = set()
+        # Cells come off the heap nearest first, so every neighbour one step closer is settled before them
+        while heap:
+            distance, cell = heapq.heappop(heap)
+            if cell in seen or distance >= UNREACHABLE or self.is_goal.item(cell):
+                continue
+            seen.add(cell)
+            if len(seen) > self.repair_limit:
+                return None
+            neighbours = (cell - 1, cell + 1, cell - stride, cell + stride)
+            if any(distances.item(n) == distance - 1 and n not in cleared and self._is_open(n) for n in neighbours):
+                continue
+            cleared.add(cell)
+            for n in neighbours:
+                if distances.item(n) == distance + 1:
+                    heapq.heappush(heap, (distance + 1, n))
+        for cell in cleared:
+            distances[cell] = UNREACHABLE
+        sources = []
+        for cell in cleared:
+            best = min((distances.item(n) for n in (cell - 1, cell + 1, cell - stride, cell + stride)
+                        if n not in cleared and self._is_open(n)), default=UNREACHABLE)
+            if best < UNREACHABLE:
+                distances[cell] = best + 1
+                sources.append(cell)
+        return sources
+
+    def _spread(self, cells):
+        """Dijkstra outwards from cells, lowering every distance a path through them shortens.
+
+        Returns False, leaving the field half repaired, if too many cells were visited.
+        """
+        stride = self.stride
+        distances, walls = self.distances, self.walls
+        heap = [(distances.item(cell), cell) for cell in cells]
+        heapq.heapify(heap)
+        visits = 0
+        while heap:
+            distance, cell = heapq.heappop(heap)
+            if distance != distances.item(cell) or distance >= UNREACHABLE or not self._is_open(cell):
+                continue
+            visits += 1
+            if visits > self.repair_limit:
+                return False
+            for n in (cell - 1, cell + 1, cell - stride, cell + stride):
+                if distances.item(n) > distance + 1 and not walls.item(n):
+                    distances[n] = distance + 1
+                    heapq.heappush(heap, (distance + 1, n))
+        return True
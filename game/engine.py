@@ -0,0 +1,201 @@
+from game.ai import QLearningAI
+from game.distances import UNCLAIMED_RESOURCES, DistanceField
+from game.grid import Grid
+from game.game_state import GameState
+from game.hpa import HierarchicalPathfinder
+from game.units import Corvette
+
+class GameEngine:
+    """Runs the rules of a match with no display, no delays and no rendering."""
+    def __init__(self, grid_size=10, ai=None, seed=None, layout=None):
+        self.grid_size = grid_size
+        self.grid = Grid(grid_size, grid_size, seed, layout)
+        self.game_state = GameState(self.grid)
+
+        # Base locations
+        self.player_base = (0, 0)
+        self.ai_base = (grid_size - 1, grid_size - 1)
+        # Walking distances to each base and to the resource nodes nobody holds, for RL rewards
+        self.base_distances = {base: DistanceField(self.grid, [base]) for base in (self.player_base, self.ai_base)}
+        self.resource_distances = DistanceField(self.grid, UNCLAIMED_RESOURCES)
+        self.pathfinder = HierarchicalPathfinder(self.grid)  # Built on its first query
+
+        self.game_over = False
+        self.winner = None
+        self.ai_rl = ai if ai is not None else QLearningAI(grid_size)
+        self.ai_search = None  # SearchAI that plays the AI's turns instead of ai_rl, if set
+        self.initialize_units()
+
+    def initialize_units(self):
+        # Player unit - placed next to the player base
+        player_unit = Corvette(self.player_base[0] + 1, self.player_base[1] + 1, "player")
+        self.grid.add_unit(player_unit)
+
+        # AI unit - placed next to the AI base
+        ai_unit = Corvette(self.ai_base[0] - 1, self.ai_base[1] - 1, "ai")
+        self.grid.add_unit(ai_unit)
+
+        # Select player's unit at start
+        self.game_state.select_unit(player_unit)
+        self.grid.calculate_valid_moves(player_unit)
+
+    def ai_turn(self, on_unit_acted=None):
+        """AI's turn logic, with RL or with ai_search if set.
+
+        on_unit_acted, if given, is called with each AI unit after it acts.
+        """
+        for unit, _ in self.ai_turn_steps():
+            if on_unit_acted is not None:
+                on_unit_acted(unit)
+
+    def ai_turn_steps(self):
+        """AI's turn as a generator, so a caller can spread it over several frames.
+
+        Yields (unit, (old_x, old_y)) after each AI unit acts.
+        """
+        if self.ai_search is not None:
+            yield from self.ai_search.turn_steps(self, "ai")
+        else:
+            yield from self.rl_side_steps("ai", self.ai_rl, self.player_base)
+        self.game_state.next_turn()
+
+    def play_rl_side(self, owner, ai, target_base, on_unit_acted=None):
+        """Let a QLearningAI act for every unit of one side, heading for target_base."""
+        for unit, _ in self.rl_side_steps(owner, ai, target_base):
+            if on_unit_acted is not None:
+                on_unit_acted(unit)
+
+    def rl_side_steps(self, owner, ai, target_base):
+        """Generator behind play_rl_side, yielding (unit, (old_x, old_y)) after each unit acts."""
+        enemy = "player" if owner == "ai" else "ai"
+        units = self.grid.units.owned_by(owner)
+        base_distances = self.base_distances[target_base]
+
+        # AI gets 2 moves per turn
+        for move in range(2):
+            for unit in units:
+                # Skip units destroyed earlier this turn
+                if unit.is_dead():
+                    continue
+                # RL move
+                old_position = (unit.x, unit.y)
+                old_distance = base_distances.distance(unit.x, unit.y)
+
+                # Try to attack first if possible
+                attacked = False
+                for enemy_unit in self.grid.get_units_in_range(unit.x, unit.y, unit.attack_range, owner=enemy):
+                    if unit.can_attack(enemy_unit):
+                        if self.grid.handle_combat(unit, enemy_unit.x, enemy_unit.y):
+                            ai.update_q(unit, target_base, 15)  # Higher reward for attacking
+                            attacked = True
+                            break
+
+                if not attacked:
+                    # Move if didn't attack
+                    old_resource_distance = self.resource_distances.distance(unit.x, unit.y)
+                    ai.move(unit, target_base, self.grid)
+                    new_distance = base_distances.distance(unit.x, unit.y)
+
+                    # Calculate reward based on movement
+                    reward = 0
+                    if new_distance < old_distance:
+                        reward += 4  # Higher reward for getting closer
+                    elif new_distance > old_distance:
+                        reward -= 3  # Higher penalty for moving away
+                    else:
+                        reward -= 1  # Penalty for not moving
+
+                    # Additional rewards
+                    if self.grid.is_resource(unit.x, unit.y):
+                        reward += 8  # Higher reward for capturing resource nodes
+                    elif self.resource_distances.distance(unit.x, unit.y) < old_resource_distance:
+                        reward += 1  # Small reward for heading to a resource node nobody holds
+
+                    # Reward for being in a good position (near enemy base but not too close)
+                    if 2 <= new_distance <= 4:
+                        reward += 3
+
+                    # Penalty for being too close to enemy base (vulnerable position)
+                    if new_distance <= 1:
+                        reward -= 2
+
+                    ai.update_q(unit, target_base, reward)
+
+                yield unit, old_position
+
+    def end_player_turn(self):
+        """Reset every unit's turn flags and hand the turn to the AI."""
+        self.grid.reset_turn_flags()
+        self.game_state.next_turn()
+        self.grid.valid_moves = set()
+        self.game_state.selected_unit = None
+
+    def move_live_obstacles(self):
+        """Let the live obstacles react to the first player unit, which is heading for the AI base."""
+        player_units = self.grid.units.owned_by("player")
+        if player_units:
+            self.grid.move_live_obstacles(player_units[0], self.base_distances[self.ai_base].distance)
+
+    def check_win_condition(self):
+        # Player wins if any player unit reaches AI base
+        for unit in self.grid.units:
+            if unit.owner == "player" and (unit.x, unit.y) == self.ai_base:
+                self.game_over = True
+                self.winner = "Player"
+                return
+            if unit.owner == "ai" and (unit.x, unit.y) == self.player_base:
+                self.game_over = True
+                self.winner = "AI"
+                return
+
+    def play_round(self, player_policy=None):
+        """Play one player turn, one AI turn and one live obstacle step."""
+        if player_policy is None:
+            player_policy = greedy_player_policy
+        player_policy(self)
+        self.check_win_condition()
+        if self.game_over:
+            return
+        self.end_player_turn()
+        self.ai_turn()
+        self.check_win_condition()
+        if not self.game_over:
+            self.move_live_obstacles()
+
+    def play_match(self, player_policy=None, max_rounds=200):
+        """Play rounds until someone wins. Returns the winner, or None if max_rounds ran out."""
+        for _ in range(max_rounds):
+            self.play_round(player_policy)
+            if self.game_over:
+                break
+        return self.winner
+
+def greedy_player_policy(engine):
+    """Scripted player: attack anything in range, otherwise walk towards the AI base.
+
+    Every unit's path is planned at once at the start of the turn; a unit
+    moves to the furthest cell along its path that it can still reach, and
+    otherwise to the reachable cell nearest the base in a straight line.
+    """
+    grid = engine.grid
+    target_x, target_y = engine.ai_base
+    units = grid.units.owned_by("player")
+    paths = engine.pathfinder.team_paths("player", engine.ai_base,
+                                         max((unit.movement_range for unit in units), default=0))
+    for unit in units:
+        if unit.is_dead():
+            continue
+        for enemy in grid.get_units_in_range(unit.x, unit.y, unit.attack_range, owner="ai"):
+            if grid.handle_combat(unit, enemy.x, enemy.y):
+                break
+        if unit.is_dead() or unit.has_moved:
+            continue
+        moves = grid.get_reachable_cells(unit)
+        path = paths.get(unit) or []
+        along = [cell for cell in path[:unit.movement_range] if cell in moves]
+        if along:
+            grid.move_unit(unit, *along[-1])
+        elif moves:
+            best = min(moves, key=lambda cell: abs(cell[0] - target_x) + abs(cell[1] - target_y))
+            if abs(best[0] - target_x) + abs(best[1] - target_y) < abs(unit.x - target_x) + abs(unit.y - target_y):
+                grid.move_unit(unit, best[0], best[1])
@@ -1,3 +1,6 @@
+from game.trace import INCOME, TURN, tracer
+from game.unit_store import OWNER_CODES
+
 class GameState:
     def __init__(self, grid):
         self.grid = grid
@@ -8,17 +11,21 @@ class GameState:
         self.selected_unit = None
         self.game_over = False
         self.winner = None
-        print(f"Game started - Turn {self.current_turn}: {self.current_player}'s turn")
+        tracer.turn = self.current_turn
+        if tracer.enabled & TURN:
+            tracer.emit(TURN, OWNER_CODES[self.current_player], self.player_resources)
     
     def update(self):
         # Update game state logic here
         pass
     
     def next_turn(self):
+        if self.grid.recorder is not None:
+            self.grid.recorder.end_turn()
         self.current_turn += 1
         self.current_player = "ai" if self.current_player == "player" else "player"
         self.selected_unit = None
-        print(f"Turn {self.current_turn}: {self.current_player}'s turn")
+        tracer.turn = self.current_turn
         
         # Add resources at the start of each turn
         if self.current_player == "player":
@@ -27,9 +34,12 @@ class GameState:
             for resource in self.grid.resources:
                 if resource.owner == "player":
                     self.player_resources += resource.value
-                    print(f"Player collected {resource.value} resources from a node")
+                    if tracer.enabled & INCOME:
+                        tracer.emit(INCOME, OWNER_CODES["player"], resource.value)
+            if tracer.enabled & TURN:
+                tracer.emit(TURN, OWNER_CODES["player"], self.player_resources)
             # Auto-select player's unit at the start of player's turn
-            player_units = [unit for unit in self.grid.units if unit.owner == "player"]
+            player_units = self.grid.units.owned_by("player")
             if player_units:
                 self.select_unit(player_units[0])
                 self.grid.calculate_valid_moves(player_units[0])
@@ -39,14 +49,16 @@ class GameState:
             for resource in self.grid.resources:
                 if resource.owner == "ai":
                     self.ai_resources += resource.value
-                    print(f"AI collected {resource.value} resources from a node")
+                    if tracer.enabled & INCOME:
+                        tracer.emit(INCOME, OWNER_CODES["ai"], resource.value)
+            if tracer.enabled & TURN:
+                tracer.emit(TURN, OWNER_CODES["ai"], self.ai_resources)
     
     def select_unit(self, unit):
         if unit and unit.owner == self.current_player:
             self.selected_unit = unit
-            print(f"Selected {unit.__class__.__name__} for {self.current_player}")
             # Reset valid moves when selecting a new unit
-            self.grid.valid_moves = []
+            self.grid.valid_moves = set()
             return True
         return False
     
@@ -1,7 +1,31 @@
-import pygame
 import numpy as np
 import random
-import collections
+from game.mapgen import MapLayout, generate_map
+from game.pathfinding import bounded_flood_fill
+from game.profiling import profiler
+from game.qtable import DenseQTable
+from game.recording import ABILITY, ADD_UNIT, COMBAT, MOVE_OBSTACLE, MOVE_UNIT, NO_TARGET, UNIT_TYPES
+from game.spatial import SpatialIndex
+from game.trace import CAPTURE, DEATH, HAZARD, MOVE, SPAWN, tracer
+from game.unit_store import OWNER_CODES, OWNER_NAMES, UnitStore
+from game.zobrist import OBSTACLE_FEATURE, RESOURCE_FEATURE, UNIT_FEATURE, zobrist_key
+
+# Terrain layer codes
+EMPTY = 0
+WALL = 1
+MINE = 2
+RESOURCE = 3
+
+# Entity layer value for cells with no unit or live obstacle
+NO_ENTITY = -1
+
+# Undo journal entry kinds
+UNDO_UNIT = 0  # (UNDO_UNIT, unit, x, y, health, has_moved, has_attacked)
+UNDO_CAPTURE = 1  # (UNDO_CAPTURE, resource, previous owner, whether it was captured before)
+UNDO_REMOVE = 2  # (UNDO_REMOVE, unit, row, position among its owner's units)
+
+# LiveObstacle.get_state clamps each axis to this range, so its Q-table has the same size on every map
+OBSTACLE_STATE_LIMIT = 10
 
 class Obstacle:
     def __init__(self, x, y):
@@ -10,8 +34,9 @@ class Obstacle:
         self.type = "wall"
         self.color = (100, 100, 100)  # Gray
     
-    def draw(self, screen, cell_size):
-        rect = pygame.Rect(self.x * cell_size, self.y * cell_size, cell_size, cell_size)
+    def draw(self, screen, cell_size, origin=(0, 0)):
+        import pygame
+        rect = pygame.Rect(origin[0] + self.x * cell_size, origin[1] + self.y * cell_size, cell_size, cell_size)
         pygame.draw.rect(screen, self.color, rect)
 
 class Hazard:
@@ -22,9 +47,10 @@ class Hazard:
         self.color = (255, 0, 0)  # Red
         self.damage = 50
     
-    def draw(self, screen, cell_size):
-        center_x = self.x * cell_size + cell_size // 2
-        center_y = self.y * cell_size + cell_size // 2
+    def draw(self, screen, cell_size, origin=(0, 0)):
+        import pygame
+        center_x = origin[0] + self.x * cell_size + cell_size // 2
+        center_y = origin[1] + self.y * cell_size + cell_size // 2
         radius = cell_size // 3
         pygame.draw.circle(screen, self.color, (center_x, center_y), radius)
 
@@ -37,9 +63,10 @@ class ResourceNode:
         self.value = 20
         self.owner = None
     
-    def draw(self, screen, cell_size):
-        center_x = self.x * cell_size + cell_size // 2
-        center_y = self.y * cell_size + cell_size // 2
+    def draw(self, screen, cell_size, origin=(0, 0)):
+        import pygame
+        center_x = origin[0] + self.x * cell_size + cell_size // 2
+        center_y = origin[1] + self.y * cell_size + cell_size // 2
         points = []
         for i in range(5):
             angle = i * 72
@@ -49,6 +76,8 @@ class ResourceNode:
         pygame.draw.polygon(screen, self.color, points)
 
 class LiveObstacle:
+    STATE_ENCODING = "player-dxdy-clamped-10"  # Checkpoints from another encoding are rejected
+
     def __init__(self, x, y, grid_width, grid_height):
         self.x = x
         self.y = y
@@ -56,7 +85,8 @@ class LiveObstacle:
         self.color = (255, 140, 0)  # Orange
         self.grid_width = grid_width
         self.grid_height = grid_height
-        self.q_table = collections.defaultdict(lambda: np.zeros(5))  # 5 actions: stay, up, down, left, right
+        # 5 actions: stay, up, down, left, right, for every clamped (dx, dy) state
+        self.q_table = DenseQTable((-OBSTACLE_STATE_LIMIT, -OBSTACLE_STATE_LIMIT), (OBSTACLE_STATE_LIMIT, OBSTACLE_STATE_LIMIT), 5)
         self.last_state = None
         self.last_action = None
         self.owner = None
@@ -64,12 +94,15 @@ class LiveObstacle:
     def get_state(self, player_unit):
         dx = player_unit.x - self.x
         dy = player_unit.y - self.y
+        # A far-away player only needs a direction
+        dx = max(min(dx, OBSTACLE_STATE_LIMIT), -OBSTACLE_STATE_LIMIT)
+        dy = max(min(dy, OBSTACLE_STATE_LIMIT), -OBSTACLE_STATE_LIMIT)
         return (dx, dy)
 
     def choose_action(self, state, epsilon=0.3):  # More random
         if random.random() < epsilon:
             return random.randint(0, 4)
-        return np.argmax(self.q_table[state])
+        return int(self.q_table[state].argmax())
 
     def move(self, player_unit, occupied_positions):
         state = self.get_state(player_unit)
@@ -96,217 +129,467 @@ class LiveObstacle:
         if self.last_state is None or self.last_action is None:
             return
         next_state = self.get_state(player_unit)
-        best_next = np.max(self.q_table[next_state])
+        best_next = self.q_table[next_state].max()
         old_value = self.q_table[self.last_state][self.last_action]
         self.q_table[self.last_state][self.last_action] = old_value + alpha * (reward + gamma * best_next - old_value)
 
-    def draw(self, screen, cell_size):
-        rect = pygame.Rect(self.x * cell_size, self.y * cell_size, cell_size, cell_size)
+    def draw(self, screen, cell_size, origin=(0, 0)):
+        import pygame
+        rect = pygame.Rect(origin[0] + self.x * cell_size, origin[1] + self.y * cell_size, cell_size, cell_size)
         pygame.draw.rect(screen, self.color, rect)
 
+def layout_from_terrain(terrain, live_obstacles, seed):
+    """The MapLayout of a terrain layer and the live obstacles' (x, y) cells, e.g. one read back from a file."""
+    cells = {code: np.argwhere(terrain == code)[:, ::-1] for code in (WALL, MINE, RESOURCE)}
+    height, width = terrain.shape
+    return MapLayout(width, height, seed, cells[WALL], cells[MINE], cells[RESOURCE], np.asarray(live_obstacles))
+
 class Grid:
-    def __init__(self, width, height):
+    def __init__(self, width, height, seed=None, layout=None, **map_options):
+        """Lay out a new map from seed, or use a ready-made MapLayout.
+
+        map_options are passed on to generate_map: feature densities and the live obstacle count.
+        """
         self.width = width
         self.height = height
         self.cell_size = 50
-        self.grid = np.full((height, width), None, dtype=object)  # [y, x]
-        self.units = []
+        # Parallel cell layers, all indexed [y, x]
+        self.terrain = np.zeros((height, width), dtype=np.int8)
+        self.entity_ids = np.full((height, width), NO_ENTITY, dtype=np.int32)
+        self.owners = np.zeros((height, width), dtype=np.int8)
+        self.entities = {}  # entity id -> unit or live obstacle
+        self._next_entity_id = 0
+        self._obstacle_at = {}  # (x, y) -> Obstacle
+        self._hazard_at = {}  # (x, y) -> Hazard
+        self._resource_at = {}  # (x, y) -> ResourceNode
+        self.owned_resources = {}  # ResourceNode -> None, for every node that has been captured
+        self.units = UnitStore()
+        self.units.owner_listeners.append(self._unit_owner_changed)
+        self.spatial_index = SpatialIndex()
         self.obstacles = []
         self.hazards = []
         self.resources = []
-        self.valid_moves = []
+        self.valid_moves = set()
         self.live_obstacles = []
+        # Bumped whenever cell occupancy changes, so cached reachability can be dropped
+        self.version = 0
+        # Bumped whenever the terrain layer changes, so cached map drawings can be dropped
+        self.terrain_version = 0
+        self._reachability_cache = {}
+        self._reachability_version = 0
+        # Recorder writing this match's commands, if it is being recorded
+        self.recorder = None
+        # Layer name -> (layer version, read-only copy equal to the layer then), shared by snapshots
+        self.layer_snapshots = {}
+        # Undo entries while a search tries actions in place, or None; see undo()
+        self.journal = None
+        # Zobrist hash of the units, live obstacles and captured resources, kept up to date by every change
+        self.hash = 0
+        # DistanceFields and pathfinders told about every cell whose occupancy or resource owner changes:
+        # each has a set of changed (x, y) cells and an invalidate() for when whole layers are replaced
+        self.change_listeners = []
         
-        # Initialize obstacles and hazards
-        self.initialize_obstacles()
-        self.initialize_hazards()
-        self.initialize_resources()
-        self.initialize_live_obstacles()
+        # Lay out the map; the same seed always gives the same one
+        self.layout = layout if layout is not None else generate_map(width, height, seed, **map_options)
+        self.seed = self.layout.seed
+        self.apply_layout(self.layout)
     
     def add_unit(self, unit):
         """Add a unit to the grid."""
         if 0 <= unit.x < self.width and 0 <= unit.y < self.height:
             if self.is_valid_position(unit.x, unit.y):
-                self.grid[unit.y, unit.x] = unit
-                self.units.append(unit)
+                self._place_entity(unit, unit.x, unit.y)
+                self.units.add(unit)
+                self.spatial_index.insert(unit)
+                self.hash ^= self._unit_key(unit)
+                self.version += 1
+                if tracer.enabled & SPAWN:
+                    tracer.emit(SPAWN, unit.unit_id, unit.x, unit.y, OWNER_CODES[unit.owner])
+                if self.recorder is not None:
+                    self.recorder.record(ADD_UNIT, UNIT_TYPES.index(type(unit).__name__), OWNER_CODES[unit.owner],
+                                         unit.x, unit.y)
                 return True
         return False
     
-    def initialize_obstacles(self):
-        # Add some random walls/asteroids
-        num_obstacles = 5
-        for _ in range(num_obstacles):
-            x = random.randint(2, self.width-3)
-            y = random.randint(2, self.height-3)
-            # Don't place obstacles near bases
-            if abs(x - 0) + abs(y - 0) > 2 and abs(x - (self.width-1)) + abs(y - (self.height-1)) > 2:
-                obstacle = Obstacle(x, y)
-                self.obstacles.append(obstacle)
-                self.grid[y, x] = obstacle
-    
-    def initialize_hazards(self):
-        # Add some space mines
-        num_hazards = 3
-        for _ in range(num_hazards):
-            x = random.randint(2, self.width-3)
-            y = random.randint(2, self.height-3)
-            # Don't place hazards near bases
-            if abs(x - 0) + abs(y - 0) > 2 and abs(x - (self.width-1)) + abs(y - (self.height-1)) > 2:
-                hazard = Hazard(x, y)
-                self.hazards.append(hazard)
-                self.grid[y, x] = hazard
-    
-    def initialize_resources(self):
-        # Add resource nodes
-        num_resources = 4
-        for _ in range(num_resources):
-            x = random.randint(2, self.width-3)
-            y = random.randint(2, self.height-3)
-            # Don't place resources near bases
-            if abs(x - 0) + abs(y - 0) > 2 and abs(x - (self.width-1)) + abs(y - (self.height-1)) > 2:
-                resource = ResourceNode(x, y)
-                self.resources.append(resource)
-                self.grid[y, x] = resource
-    
-    def initialize_live_obstacles(self):
-        # Add 2 live obstacles
-        for _ in range(2):
-            while True:
-                x = random.randint(2, self.width-3)
-                y = random.randint(2, self.height-3)
-                if self.grid[y, x] is None:
-                    live_obs = LiveObstacle(x, y, self.width, self.height)
-                    self.live_obstacles.append(live_obs)
-                    self.grid[y, x] = live_obs
-                    break
+    def _place_entity(self, entity, x, y):
+        """Write an entity into the entity and owner layers, assigning it an id if needed."""
+        if getattr(entity, "entity_id", None) is None:
+            entity.entity_id = self._next_entity_id
+            self._next_entity_id += 1
+        self.entities[entity.entity_id] = entity
+        self.entity_ids[y, x] = entity.entity_id
+        self.owners[y, x] = OWNER_CODES[entity.owner]
+        for listener in self.change_listeners:
+            listener.changed.add((x, y))
+    
+    def _clear_entity(self, x, y):
+        """Remove whatever entity occupies a cell from the entity and owner layers."""
+        self.entities.pop(int(self.entity_ids[y, x]), None)
+        self.entity_ids[y, x] = NO_ENTITY
+        self.owners[y, x] = OWNER_CODES[None]
+        for listener in self.change_listeners:
+            listener.changed.add((x, y))
+    
+    def _unit_owner_changed(self, unit, old_owner):
+        """Keep the spatial index and owner layer in step when a unit on the grid changes hands."""
+        self.spatial_index.change_owner(unit, old_owner)
+        self.owners[unit.y, unit.x] = OWNER_CODES[unit.owner]
+        self.version += 1
+    
+    def _unit_key(self, unit):
+        """Zobrist key of a unit as it is now: its id, cell, health and turn flags."""
+        return zobrist_key(UNIT_FEATURE, unit.unit_id, unit.y * self.width + unit.x, unit.health,
+                           unit.has_moved | unit.has_attacked << 1)
+    
+    def _obstacle_key(self, obs):
+        return zobrist_key(OBSTACLE_FEATURE, obs.entity_id, obs.y * self.width + obs.x)
+    
+    def _resource_key(self, resource):
+        return zobrist_key(RESOURCE_FEATURE, resource.y * self.width + resource.x, OWNER_CODES[resource.owner])
+    
+    def _begin_unit_change(self, *units):
+        """Call before changing units' position, health or flags: journals them and takes them out of the hash."""
+        for unit in units:
+            if self.journal is not None:
+                self.journal.append((UNDO_UNIT, unit, unit.x, unit.y, unit.health, unit.has_moved, unit.has_attacked))
+            self.hash ^= self._unit_key(unit)
+    
+    def _end_unit_change(self, *units):
+        """Call after changing units begun with _begin_unit_change: puts them back in the hash."""
+        for unit in units:
+            self.hash ^= self._unit_key(unit)
+    
+    def _set_resource_owner(self, resource, owner):
+        """Capture a resource node for owner, keeping the hash and journal up to date."""
+        if self.journal is not None:
+            self.journal.append((UNDO_CAPTURE, resource, resource.owner, resource in self.owned_resources))
+        if resource.owner is not None:
+            self.hash ^= self._resource_key(resource)
+        resource.owner = owner
+        self.hash ^= self._resource_key(resource)
+        self.owned_resources[resource] = None
+        for listener in self.change_listeners:
+            listener.changed.add((resource.x, resource.y))
+    
+    def compute_hash(self):
+        """The Zobrist hash of the grid worked out from scratch; always equal to self.hash."""
+        value = 0
+        for unit in self.units:
+            value ^= self._unit_key(unit)
+        for obs in self.live_obstacles:
+            value ^= self._obstacle_key(obs)
+        for resource in self.owned_resources:
+            value ^= self._resource_key(resource)
+        return value
+    
+    def undo(self, mark):
+        """Take back every change journaled since the journal was mark entries long, newest first."""
+        journal = self.journal
+        if len(journal) == mark:
+            return
+        while len(journal) > mark:
+            entry = journal.pop()
+            kind = entry[0]
+            if kind == UNDO_UNIT:
+                _, unit, x, y, health, has_moved, has_attacked = entry
+                self.hash ^= self._unit_key(unit)
+                if unit.x != x or unit.y != y:
+                    self._clear_entity(unit.x, unit.y)
+                    unit.x = x
+                    unit.y = y
+                    self._place_entity(unit, x, y)
+                    self.spatial_index.move(unit)
+                unit.health = health
+                unit.has_moved = has_moved
+                unit.has_attacked = has_attacked
+                self.hash ^= self._unit_key(unit)
+            elif kind == UNDO_CAPTURE:
+                _, resource, owner, was_captured = entry
+                self.hash ^= self._resource_key(resource)
+                resource.owner = owner
+                if owner is not None:
+                    self.hash ^= self._resource_key(resource)
+                if not was_captured:
+                    del self.owned_resources[resource]
+                for listener in self.change_listeners:
+                    listener.changed.add((resource.x, resource.y))
+            else:
+                _, unit, row, owner_position = entry
+                self.units.reinsert(unit, row, owner_position)
+                self._place_entity(unit, unit.x, unit.y)
+                self.spatial_index.insert(unit)
+                self.hash ^= self._unit_key(unit)
+        # Versions only go up, so caches filled before the undo are still dropped
+        self.version += 1
+    
+    def reset_turn_flags(self, owner=None):
+        """Clear the turn flags of every unit, or of one owner's units."""
+        flags = self.units.column("flags")
+        if owner is not None:
+            flags = flags * (self.units.column("owner") == OWNER_CODES[owner])
+        # Only units that acted this turn change
+        acted = [self.units.views[row] for row in np.flatnonzero(flags).tolist()]
+        self._begin_unit_change(*acted)
+        self.units.reset_turn(owner)
+        self._end_unit_change(*acted)
+    
+    def reindex_entities(self):
+        """Rebuild the entity table and spatial index from the units and live obstacles, e.g. after a restore."""
+        self.entities = {unit.entity_id: unit for unit in self.units}
+        self.entities.update((obs.entity_id, obs) for obs in self.live_obstacles)
+        self.spatial_index = SpatialIndex(self.spatial_index.bucket_size)
+        for unit in self.units:
+            self.spatial_index.insert(unit)
+        self.valid_moves = set()
+        for listener in self.change_listeners:
+            listener.invalidate()
+    
+    def apply_layout(self, layout):
+        """Place a MapLayout's walls, mines, resource nodes and live obstacles on this empty grid."""
+        for cells, code in ((layout.walls, WALL), (layout.mines, MINE), (layout.resources, RESOURCE)):
+            self.terrain[cells[:, 1], cells[:, 0]] = code
+        self.obstacles = [Obstacle(x, y) for x, y in layout.walls.tolist()]
+        self.hazards = [Hazard(x, y) for x, y in layout.mines.tolist()]
+        self.resources = [ResourceNode(x, y) for x, y in layout.resources.tolist()]
+        self._obstacle_at = {(obstacle.x, obstacle.y): obstacle for obstacle in self.obstacles}
+        self._hazard_at = {(hazard.x, hazard.y): hazard for hazard in self.hazards}
+        self._resource_at = {(resource.x, resource.y): resource for resource in self.resources}
+        for x, y in layout.live_obstacles.tolist():
+            live_obs = LiveObstacle(x, y, self.width, self.height)
+            self.live_obstacles.append(live_obs)
+            self._place_entity(live_obs, x, y)
+            self.hash ^= self._obstacle_key(live_obs)
+        self.terrain_version += 1
+        self.version += 1
     
     def is_valid_position(self, x, y):
-        """Check if a position is valid (empty or contains a resource)"""
+        """Check if a position is valid (not a wall and not occupied)"""
         if not (0 <= x < self.width and 0 <= y < self.height):
             return False
-        cell_content = self.grid[y, x]
-        return cell_content is None or isinstance(cell_content, ResourceNode)
+        return self.terrain[y, x] != WALL and self.entity_ids[y, x] == NO_ENTITY
+    
+    def passable_mask(self):
+        """Boolean [y, x] mask of every cell a unit could move into."""
+        return (self.terrain != WALL) & (self.entity_ids == NO_ENTITY)
+    
+    def hazard_mask(self):
+        """Boolean [y, x] mask of every mine."""
+        return self.terrain == MINE
+    
+    def resource_mask(self):
+        """Boolean [y, x] mask of every resource node."""
+        return self.terrain == RESOURCE
+    
+    def owner_mask(self, owner):
+        """Boolean [y, x] mask of every cell occupied by the given owner's entities."""
+        return self.owners == OWNER_CODES[owner]
+    
+    def is_resource(self, x, y):
+        """Check if a cell holds a resource node."""
+        return self.terrain[y, x] == RESOURCE
+    
+    def resource_ownership(self):
+        """(x, y) cells of the captured resource nodes and their owners' codes, as arrays."""
+        cells = np.array([(resource.x, resource.y) for resource in self.owned_resources], dtype=np.int32)
+        owners = np.array([OWNER_CODES[resource.owner] for resource in self.owned_resources], dtype=np.int8)
+        return cells.reshape(-1, 2), owners
     
+    def restore_resource_ownership(self, cells, owners):
+        """Set which resource nodes are captured, and by whom, from resource_ownership arrays."""
+        for resource in self.owned_resources:
+            resource.owner = None
+        self.owned_resources = {}
+        for (x, y), owner in zip(cells.tolist(), owners.tolist()):
+            resource = self._resource_at[(x, y)]
+            resource.owner = OWNER_NAMES[owner]
+            self.owned_resources[resource] = None
+        for listener in self.change_listeners:
+            listener.invalidate()
+    
+    @profiler.timed()
     def calculate_valid_moves(self, unit):
         """Calculate valid moves for a unit based on its movement range."""
-        self.valid_moves = []
+        self.valid_moves = set()
         if not unit:
             return
-            
-        current_x, current_y = unit.x, unit.y
-        movement_range = unit.movement_range
-        
-        # Check all possible positions within movement range
-        for dx in range(-movement_range, movement_range + 1):
-            for dy in range(-movement_range, movement_range + 1):
-                # Skip the current position
-                if dx == 0 and dy == 0:
-                    continue
-                    
-                new_x, new_y = current_x + dx, current_y + dy
-                
-                # Check if the new position is within grid bounds
-                if 0 <= new_x < self.width and 0 <= new_y < self.height:
-                    # Check if the cell is empty or contains a resource
-                    cell_content = self.grid[new_y, new_x]
-                    if cell_content is None or isinstance(cell_content, ResourceNode):
-                        # Calculate Manhattan distance
-                        distance = abs(dx) + abs(dy)
-                        if distance <= movement_range:
-                            self.valid_moves.append((new_x, new_y))
-        
-        print(f"Valid moves for {unit.__class__.__name__} at ({current_x}, {current_y}): {self.valid_moves}")
+        self.valid_moves = self.get_reachable_cells(unit)
+    
+    @profiler.timed()
+    def get_reachable_cells(self, unit):
+        """Get the cells a unit can walk to, going around walls and other blockers."""
+        key = (unit.x, unit.y, unit.movement_range)
+        if self._reachability_version != self.version:
+            # Occupancy changed since the cache was filled
+            self._reachability_cache.clear()
+            self._reachability_version = self.version
+        reachable = self._reachability_cache.get(key)
+        if reachable is None:
+            reachable = bounded_flood_fill(self.is_valid_position, unit.x, unit.y, unit.movement_range)
+            self._reachability_cache[key] = reachable
+        return reachable
+    
+    def calculate_team_moves(self, owner):
+        """Get the reachable cells for every unit of a team in one call."""
+        return {unit: self.get_reachable_cells(unit) for unit in self.units.owned_by(owner)}
     
+    @profiler.timed()
     def move_unit(self, unit, new_x, new_y):
         if 0 <= new_x < self.width and 0 <= new_y < self.height:
             if self.is_valid_position(new_x, new_y):
-                self.grid[unit.y, unit.x] = None
+                if tracer.enabled & MOVE:
+                    tracer.emit(MOVE, unit.unit_id, unit.x, unit.y, new_x, new_y)
+                self._begin_unit_change(unit)
+                self._clear_entity(unit.x, unit.y)
                 unit.x = new_x
                 unit.y = new_y
-                self.grid[new_y, new_x] = unit
-                self.valid_moves = []
+                self._place_entity(unit, new_x, new_y)
+                self.spatial_index.move(unit)
+                self.valid_moves = set()
+                self.version += 1
                 unit.has_moved = True
+                if self.recorder is not None:
+                    self.recorder.record(MOVE_UNIT, unit.unit_id, new_x, new_y)
                 
                 # Check for hazards
-                for hazard in self.hazards:
-                    if hazard.x == new_x and hazard.y == new_y:
-                        unit.health -= hazard.damage
-                        print(f"Unit hit a mine! Health reduced to {unit.health}")
-                        if unit.health <= 0:
-                            print(f"{unit.__class__.__name__} was destroyed by a mine!")
-                            self.remove_dead_units()
+                terrain = self.terrain[new_y, new_x]
+                if terrain == MINE:
+                    hazard = self._hazard_at[(new_x, new_y)]
+                    unit.health -= hazard.damage
+                    self._end_unit_change(unit)
+                    if tracer.enabled & HAZARD:
+                        tracer.emit(HAZARD, unit.unit_id, new_x, new_y, hazard.damage, unit.health)
+                    if unit.health <= 0:
+                        self.remove_dead_units()
+                    return True
+                self._end_unit_change(unit)
                 
                 # Check for resources
-                for resource in self.resources:
-                    if resource.x == new_x and resource.y == new_y:
-                        resource.owner = unit.owner
-                        print(f"{unit.owner} captured a resource node!")
+                if terrain == RESOURCE:
+                    resource = self._resource_at[(new_x, new_y)]
+                    self._set_resource_owner(resource, unit.owner)
+                    if tracer.enabled & CAPTURE:
+                        tracer.emit(CAPTURE, unit.unit_id, new_x, new_y, OWNER_CODES[unit.owner])
                 
                 return True
         return False
     
     def get_unit_at(self, x, y):
         if 0 <= x < self.width and 0 <= y < self.height:
-            return self.grid[y, x]
+            return self.entities.get(int(self.entity_ids[y, x]))
         return None
     
-    def draw(self, screen):
+    def entities_in_rect(self, x0, y0, x1, y1):
+        """Units and live obstacles in the cells x0 <= x < x1, y0 <= y < y1, read off the entity layer."""
+        ids = self.entity_ids[y0:y1, x0:x1]
+        return [self.entities[entity_id] for entity_id in ids[ids != NO_ENTITY].tolist()]
+    
+    def _view(self, camera):
+        """Cell size, screen origin and (x0, y0, x1, y1) cell bounds to draw: the camera's view, or the whole map."""
+        if camera is None:
+            return self.cell_size, (0, 0), (0, 0, self.width, self.height)
+        return camera.cell_size, camera.origin, camera.visible_cells()
+    
+    def draw(self, screen, unit_positions=None, camera=None):
+        """Draw the map, or only what a Camera can see.
+
+        unit_positions optionally overrides where units appear, in fractional cells.
+        """
+        self.draw_terrain(screen, camera)
+        self.draw_valid_moves(screen, camera)
+        self.draw_units(screen, unit_positions, camera)
+    
+    def draw_terrain(self, screen, camera=None):
+        """Draw the parts of the map that only change with the terrain layer."""
+        import pygame
+        size, (origin_x, origin_y), (x0, y0, x1, y1) = self._view(camera)
         # Draw grid lines
-        for x in range(self.width + 1):
+        for x in range(x0, x1 + 1):
             pygame.draw.line(screen, (50, 50, 50),
-                           (x * self.cell_size, 0),
-                           (x * self.cell_size, self.height * self.cell_size))
-        for y in range(self.height + 1):
+                           (origin_x + x * size, origin_y + y0 * size),
+                           (origin_x + x * size, origin_y + y1 * size))
+        for y in range(y0, y1 + 1):
             pygame.draw.line(screen, (50, 50, 50),
-                           (0, y * self.cell_size),
-                           (self.width * self.cell_size, y * self.cell_size))
-        
-        # Draw obstacles
-        for obstacle in self.obstacles:
-            obstacle.draw(screen, self.cell_size)
-        
-        # Draw hazards
-        for hazard in self.hazards:
-            hazard.draw(screen, self.cell_size)
-        
-        # Draw resources
-        for resource in self.resources:
-            resource.draw(screen, self.cell_size)
+                           (origin_x + x0 * size, origin_y + y * size),
+                           (origin_x + x1 * size, origin_y + y * size))
         
-        # Draw valid moves
+        # Draw the obstacles, hazards and resources in view, found from the terrain layer
+        view = self.terrain[y0:y1, x0:x1]
+        for code, lookup in ((WALL, self._obstacle_at), (MINE, self._hazard_at), (RESOURCE, self._resource_at)):
+            ys, xs = np.nonzero(view == code)
+            for x, y in zip((xs + x0).tolist(), (ys + y0).tolist()):
+                lookup[(x, y)].draw(screen, size, (origin_x, origin_y))
+    
+    def draw_valid_moves(self, screen, camera=None):
+        import pygame
+        if not self.valid_moves:
+            return
+        size, (origin_x, origin_y), (x0, y0, x1, y1) = self._view(camera)
+        # One translucent tile, shared by every highlighted cell
+        highlight = pygame.Surface((size, size), pygame.SRCALPHA)
+        highlight.fill((0, 255, 0, 100))
         for x, y in self.valid_moves:
-            rect = pygame.Rect(x * self.cell_size, y * self.cell_size,
-                             self.cell_size, self.cell_size)
-            highlight = pygame.Surface((self.cell_size, self.cell_size), pygame.SRCALPHA)
-            highlight.fill((0, 255, 0, 100))
+            if not (x0 <= x < x1 and y0 <= y < y1):
+                continue
+            rect = pygame.Rect(origin_x + x * size, origin_y + y * size, size, size)
             screen.blit(highlight, rect)
             pygame.draw.rect(screen, (0, 255, 0), rect, 2)
-        
+    
+    def entities_in_view(self, unit_positions=None, camera=None):
+        """(entity, position) of the units and live obstacles a Camera can see, or of all of them.
+
+        unit_positions overrides where units appear, in fractional cells, as
+        for draw(); a unit moving between cells is kept if the rect it is
+        drawn at is in view, wherever its start and end cells are.
+        """
+        if unit_positions is None:
+            unit_positions = {}
+        size, origin, (x0, y0, x1, y1) = self._view(camera)
+        entities = self.entities_in_rect(x0, y0, x1, y1)
+        entities.extend(unit for unit in unit_positions
+                        if unit in self.units and not (x0 <= unit.x < x1 and y0 <= unit.y < y1))
+        found = []
+        for entity in entities:
+            position = unit_positions.get(entity)
+            if camera is not None and position is not None and not camera.overlaps_view(
+                    entity.screen_rect(size, position, origin)):
+                continue
+            found.append((entity, position))
+        return found
+    
+    def draw_units(self, screen, unit_positions=None, camera=None):
+        size, origin, _ = self._view(camera)
+        entities = self.entities_in_view(unit_positions, camera)
         # Draw units
-        for unit in self.units:
-            unit.draw(screen, self.cell_size)
+        for entity, position in entities:
+            if not isinstance(entity, LiveObstacle):
+                entity.draw(screen, size, position=position, origin=origin)
         
         # Draw live obstacles
-        for obs in self.live_obstacles:
-            obs.draw(screen, self.cell_size)
+        for entity, _ in entities:
+            if isinstance(entity, LiveObstacle):
+                entity.draw(screen, size, origin)
     
-    def get_units_in_range(self, x, y, range):
-        """Get all units within a certain range of a position."""
-        units = []
-        for unit in self.units:
-            distance = abs(unit.x - x) + abs(unit.y - y)
-            if distance <= range:
-                units.append(unit)
-        return units
+    def get_units_in_range(self, x, y, range, owner=None):
+        """Get all units within a certain range of a position, optionally only one owner's."""
+        return self.spatial_index.query(x, y, range, owner)
     
     def remove_dead_units(self):
-        """Remove dead units from the grid and units list."""
-        dead_units = [unit for unit in self.units if unit.is_dead()]
+        """Remove dead units from the grid and unit store."""
+        dead_units = self.units.dead_units()
         for unit in dead_units:
-            self.grid[unit.y, unit.x] = None
+            if tracer.enabled & DEATH:
+                tracer.emit(DEATH, unit.unit_id, unit.x, unit.y, OWNER_CODES[unit.owner])
+            if self.journal is not None:
+                self.journal.append((UNDO_REMOVE, unit, self.units.rows[unit.unit_id], self.units.owner_position(unit)))
+            self.hash ^= self._unit_key(unit)
+            self._clear_entity(unit.x, unit.y)
+            self.spatial_index.remove(unit)
             self.units.remove(unit)
+        if dead_units:
+            self.version += 1
         return len(dead_units) > 0  # Return True if any units were removed
     
+    @profiler.timed()
     def handle_combat(self, attacker, target_x, target_y):
         """Handle combat between units."""
         target = self.get_unit_at(target_x, target_y)
@@ -315,7 +598,12 @@ class Grid:
         if not (isinstance(attacker, Unit) and isinstance(target, Unit)):
             return False
         if target and attacker.can_attack(target):
-            if attacker.attack(target):
+            self._begin_unit_change(attacker, target)
+            attacked = attacker.attack(target)
+            self._end_unit_change(attacker, target)
+            if attacked:
+                if self.recorder is not None:
+                    self.recorder.record(COMBAT, attacker.unit_id, target_x, target_y)
                 # Check if target died
                 if target.is_dead():
                     self.remove_dead_units()
@@ -326,10 +614,20 @@ class Grid:
         """Use a unit's special ability."""
         if ability_name not in unit.abilities:
             return False
-            
+        if not self._apply_ability(unit, ability_name, target_x, target_y):
+            return False
+        if self.recorder is not None:
+            self.recorder.record(ABILITY, unit.unit_id, unit.abilities.index(ability_name),
+                                 NO_TARGET if target_x is None else target_x,
+                                 NO_TARGET if target_y is None else target_y)
+        return True
+    
+    def _apply_ability(self, unit, ability_name, target_x, target_y):
         if ability_name == "Quick Strike":
             # Corvette can attack twice
+            self._begin_unit_change(unit)
             unit.has_attacked = False
+            self._end_unit_change(unit)
             return True
             
         elif ability_name == "Repair":
@@ -337,15 +635,19 @@ class Grid:
             if target_x is not None and target_y is not None:
                 target = self.get_unit_at(target_x, target_y)
                 if target and target.owner == unit.owner:
+                    self._begin_unit_change(target)
                     target.health = min(target.max_health, target.health + 20)
+                    self._end_unit_change(target)
                     return True
                     
         elif ability_name == "Area Attack":
             # Dreadnought attacks all units in range
-            units_in_range = self.get_units_in_range(unit.x, unit.y, unit.attack_range)
+            enemy = "ai" if unit.owner == "player" else "player"
+            units_in_range = self.get_units_in_range(unit.x, unit.y, unit.attack_range, owner=enemy)
+            self._begin_unit_change(unit, *units_in_range)
             for target in units_in_range:
-                if target.owner != unit.owner:
-                    unit.attack(target)
+                unit.attack(target)
+            self._end_unit_change(unit, *units_in_range)
             self.remove_dead_units()
             return True
             
@@ -356,20 +658,45 @@ class Grid:
             
         return False
 
-    def move_live_obstacles(self, player_unit):
+    @profiler.timed()
+    def move_live_obstacles(self, player_unit, goal_distance):
+        """Let every live obstacle take a step and learn from where it ends up.
+
+        goal_distance(x, y) is the player's walking distance from a cell to
+        its goal. An obstacle next to the player on a cell closer to the goal
+        stands in the player's way and is rewarded for blocking.
+        """
         occupied = set((obs.x, obs.y) for obs in self.live_obstacles)
-        for obs in self.live_obstacles:
+        # Units and walls block live obstacles too, so a cell never holds two entities
+        occupied.update(zip(self.units.column("x").tolist(), self.units.column("y").tolist()))
+        occupied.update((obstacle.x, obstacle.y) for obstacle in self.obstacles)
+        for index, obs in enumerate(self.live_obstacles):
             old_x, old_y = obs.x, obs.y
-            self.grid[old_y, old_x] = None
+            self._clear_entity(old_x, old_y)
+            self.hash ^= self._obstacle_key(obs)
             new_x, new_y = obs.move(player_unit, occupied)
             occupied.add((new_x, new_y))
-            # Less reward for blocking, penalty for crowding
+            self._place_entity(obs, new_x, new_y)
+            self.hash ^= self._obstacle_key(obs)
+            # Reward for blocking the player's way, penalty for crowding
             reward = 0
-            if new_x == player_unit.x and new_y == player_unit.y:
-                reward = 2  # Lower reward for blocking
-            elif abs(new_x - player_unit.x) + abs(new_y - player_unit.y) == 1:
-                reward = -2  # Penalty for crowding
+            if abs(new_x - player_unit.x) + abs(new_y - player_unit.y) == 1:
+                if goal_distance(new_x, new_y) < goal_distance(player_unit.x, player_unit.y):
+                    reward = 2  # Lower reward for blocking
+                else:
+                    reward = -2  # Penalty for crowding
             else:
                 reward = -1  # Small penalty for not blocking
             obs.update_q(player_unit, reward)
-            self.grid[new_y, new_x] = obs 
\ No newline at end of file
+            if self.recorder is not None and (new_x, new_y) != (old_x, old_y):
+                self.recorder.record(MOVE_OBSTACLE, index, new_x, new_y)
+        self.version += 1
+    
+    def place_live_obstacle(self, obs, x, y):
+        """Put a live obstacle straight onto a cell, as replays do, without it choosing or learning."""
+        self._clear_entity(obs.x, obs.y)
+        self.hash ^= self._obstacle_key(obs)
+        obs.x, obs.y = x, y
+        self._place_entity(obs, x, y)
+        self.hash ^= self._obstacle_key(obs)
+        self.version += 1 
\ No newline at end of file
@@ -0,0 +1,361 @@
+"""
+Hierarchical pathfinding (HPA*) for large maps.
+
+The map is cut into square clusters. Wherever two neighbouring clusters
+share a run of open cells along their border, one or two entrances are
+placed on it; the cells on both sides become nodes of an abstract graph,
+linked across the border with cost 1. Each cluster keeps a BFS distance
+layer to each of its nodes, which gives the walking distance between its
+nodes and from any of its cells to them. A unit joins the abstract graph by
+looking its cell up, and a path is refined into cells by walking downhill
+on those layers, so neither needs another search.
+
+Walls, units and live obstacles all block. When cells change occupancy,
+only the clusters holding them are rebuilt, along with neighbours whose
+shared entrances moved. paths() and team_paths() route many units to one
+goal with a single Dijkstra outwards from the goal over the abstract
+graph, instead of one grid search per unit.
+"""
+import heapq
+import numpy as np
+from game.grid import NO_ENTITY, WALL
+from game.pathfinding import NEIGHBOURS, UNREACHABLE, distance_field, find_path
+
+CLUSTER_SIZE = 16
+WIDE_ENTRANCE = 6  # Open border runs this long get an entrance at each end; shorter ones get one in the middle
+LAYER_CHUNK = 2048  # Node layers computed per vectorized BFS
+NO_PATH = np.iinfo(np.int16).max  # Layer distance of cells with no path to the node inside its cluster
+GOAL = -1  # Next node of the nodes that lead straight to the goal
+
+class HierarchicalPathfinder:
+    """Paths over a grid through an abstract graph of cluster entrances, kept up to date as the grid changes.
+
+    The first query builds every cluster; later ones first rebuild the
+    clusters around cells the grid reported changed. A terrain change or
+    a snapshot restore rebuilds everything.
+    """
+    def __init__(self, grid, cluster_size=CLUSTER_SIZE):
+        self.grid = grid
+        self.size = cluster_size
+        self.columns = -(-grid.width // cluster_size)
+        self.rows = -(-grid.height // cluster_size)
+        count = self.columns * self.rows
+        # Per cluster, indexed cy * columns + cx; node cells are stored as y * width + x
+        self.nodes = [[] for _ in range(count)]
+        self.layers = [None] * count  # int16 (node, y, x) distances to each node from the cluster's cells
+        self.costs = [[] for _ in range(count)]  # costs[i][j]: walking distance from node i to node j
+        self.links = [[] for _ in range(count)]  # Node cells across a border from each node
+        self.node_index = {}  # node cell -> (cluster, index among its nodes)
+        self.entrances = {}  # (vertical, cx, cy) -> [(cell, cell)] pairs across the border after cluster (cx, cy)
+        self.changed = set()  # (x, y) cells the grid reported changed since the last query
+        self._terrain_version = None  # Terrain the clusters were built for, or None to rebuild on the next query
+        grid.change_listeners.append(self)
+
+    def invalidate(self):
+        """Rebuild every cluster on the next query, e.g. after the grid's layers were replaced."""
+        self._terrain_version = None
+
+    def cluster_of(self, x, y):
+        return (y // self.size) * self.columns + x // self.size
+
+    def refresh(self):
+        if self._terrain_version != self.grid.terrain_version:
+            self.rebuild()
+        elif self.changed:
+            dirty = {self.cluster_of(x, y) for x, y in self.changed}
+            self.changed.clear()
+            self._update(dirty)
+
+    def rebuild(self):
+        self.node_index = {}
+        self.entrances = {}
+        self.changed.clear()
+        self._update(range(len(self.nodes)))
+        self._terrain_version = self.grid.terrain_version
+
+    def _borders(self, cluster):
+        """(border key, side) for each border of a cluster: side 0 if it is the first cluster of the pair."""
+        cy, cx = divmod(cluster, self.columns)
+        borders = []
+        if cx > 0:
+            borders.append(((True, cx - 1, cy), 1))
+        if cx < self.columns - 1:
+            borders.append(((True, cx, cy), 0))
+        if cy > 0:
+            borders.append(((False, cx, cy - 1), 1))
+        if cy < self.rows - 1:
+            borders.append(((False, cx, cy), 0))
+        return borders
+
+    def _update(self, dirty):
+        """Find the entrances around the dirty clusters again and rebuild every cluster whose nodes may have moved."""
+        rebuild = set(dirty)
+        keys = {key for cluster in dirty for key, _ in self._borders(cluster)}
+        for key, pairs in self._find_entrances(sorted(keys)).items():
+            if self.entrances.get(key) != pairs:
+                self.entrances[key] = pairs
+                vertical, cx, cy = key
+                rebuild.add(cy * self.columns + cx)
+                rebuild.add((cy + (not vertical)) * self.columns + cx + vertical)
+        self._build_clusters(sorted(rebuild))
+
+    def _open_cells(self, xs, ys):
+        """Whether cells are on the map, not walls and unoccupied, for arrays of non-negative coordinates."""
+        grid = self.grid
+        inside = (xs < grid.width) & (ys < grid.height)
+        xs, ys = np.minimum(xs, grid.width - 1), np.minimum(ys, grid.height - 1)
+        return inside & (grid.terrain[ys, xs] != WALL) & (grid.entity_ids[ys, xs] == NO_ENTITY)
+
+    def _find_entrances(self, keys):
+        """Entrance cell pairs of the borders with the given keys, as {key: [(cell, cell)]}."""
+        if not keys:
+            return {}
+        size, width = self.size, self.grid.width
+        vertical = np.array([key[0] for key in keys])[:, None]
+        cx = np.array([key[1] for key in keys])[:, None]
+        cy = np.array([key[2] for key in keys])[:, None]
+        offsets = np.arange(size)
+        # Cells along the first cluster's edge, and the step across the border to the second
+        xs = np.where(vertical, (cx + 1) * size - 1, cx * size + offsets)
+        ys = np.where(vertical, cy * size + offsets, (cy + 1) * size - 1)
+        step_x = vertical.astype(np.intp)
+        step_y = 1 - step_x
+        open_pairs = self._open_cells(xs, ys) & self._open_cells(xs + step_x, ys + step_y)
+        # Runs of open pairs start and end where the row, padded with closed pairs, switches on and off
+        edges = np.diff(np.pad(open_pairs, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+        runs, starts = np.nonzero(edges == 1)
+        _, ends = np.nonzero(edges == -1)
+        lengths = ends - starts
+        wide = lengths >= WIDE_ENTRANCE
+        rows = np.concatenate((runs[~wide], runs[wide], runs[wide]))
+        positions = np.concatenate(((starts + (lengths - 1) // 2)[~wide], starts[wide], ends[wide] - 1))
+        order = np.lexsort((positions, rows))
+        rows, positions = rows[order], positions[order]
+        first = ys[rows, positions] * width + xs[rows, positions]
+        second = first + (step_x + step_y * width)[rows, 0]
+        entrances = {key: [] for key in keys}
+        for row, a, b in zip(rows.tolist(), first.tolist(), second.tolist()):
+            entrances[keys[row]].append((a, b))
+        return entrances
+
+    def _build_clusters(self, clusters):
+        """Collect the nodes of clusters from the entrances and compute their layers and costs."""
+        if not clusters:
+            return
+        size, width = self.size, self.grid.width
+        maps = []  # (cluster, node cell) per layer to compute
+        for cluster in clusters:
+            for cell in self.nodes[cluster]:
+                self.node_index.pop(cell, None)
+            links = {}
+            for key, side in self._borders(cluster):
+                for pair in self.entrances.get(key, ()):
+                    links.setdefault(pair[side], []).append(pair[1 - side])
+            self.nodes[cluster] = sorted(links)
+            self.links[cluster] = [links[cell] for cell in self.nodes[cluster]]
+            for index, cell in enumerate(self.nodes[cluster]):
+                self.node_index[cell] = (cluster, index)
+                maps.append((cluster, cell))
+        walls, blocked = self._cluster_masks(clusters)
+        position = {cluster: index for index, cluster in enumerate(clusters)}
+        layers = []
+        for start in range(0, len(maps), LAYER_CHUNK):
+            chunk = maps[start:start + LAYER_CHUNK]
+            which = np.array([position[cluster] for cluster, _ in chunk])
+            cells = np.array([cell for _, cell in chunk])
+            origins = np.array([divmod(cluster, self.columns) for cluster, _ in chunk]) * size
+            goals = np.zeros((len(chunk), size, size), dtype=bool)
+            goals[np.arange(len(chunk)), cells // width - origins[:, 0], cells % width - origins[:, 1]] = True
+            distances = distance_field(walls[which], goals, blocked[which])
+            layers.append(np.minimum(distances, NO_PATH).astype(np.int16))
+        layers = np.concatenate(layers) if layers else np.zeros((0, size, size), dtype=np.int16)
+        start = 0
+        for cluster in clusters:
+            count = len(self.nodes[cluster])
+            layer = layers[start:start + count]
+            start += count
+            self.layers[cluster] = layer
+            cy, cx = divmod(cluster, self.columns)
+            cells = np.array(self.nodes[cluster], dtype=np.intp)
+            # Row i holds every node's layer read at node i: the walking distance from node i to each node
+            self.costs[cluster] = layer[:, cells // width - cy * size, cells % width - cx * size].T.tolist()
+
+    def _cluster_masks(self, clusters):
+        """Wall and occupied masks of clusters, (cluster, y, x); cells past the map's edge count as walls."""
+        grid, size = self.grid, self.size
+        walls = np.ones((len(clusters), size, size), dtype=bool)
+        blocked = np.zeros((len(clusters), size, size), dtype=bool)
+        for index, cluster in enumerate(clusters):
+            cy, cx = divmod(cluster, self.columns)
+            window = (slice(cy * size, (cy + 1) * size), slice(cx * size, (cx + 1) * size))
+            terrain = grid.terrain[window]
+            height, width = terrain.shape
+            walls[index, :height, :width] = terrain == WALL
+            blocked[index, :height, :width] = grid.entity_ids[window] != NO_ENTITY
+        return walls, blocked
+
+    def _joins(self, x, y):
+        """(cell, steps to it) where a path from or to (x, y) meets the layers of a cluster.
+
+        That is the cell itself, and its open neighbours across a cluster
+        border: an occupied cell on a border has no entrance of its own there.
+        """
+        grid = self.grid
+        cluster = self.cluster_of(x, y)
+        joins = [((x, y), 0)]
+        for dx, dy in NEIGHBOURS:
+            cell = (x + dx, y + dy)
+            if (0 <= cell[0] < grid.width and 0 <= cell[1] < grid.height and self.cluster_of(*cell) != cluster
+                    and grid.is_valid_position(*cell)):
+                joins.append((cell, 1))
+        return joins
+
+    def _reach(self, cell):
+        """(cluster, steps from cell to each of its cluster's nodes)."""
+        cluster = self.cluster_of(*cell)
+        if not self.nodes[cluster]:
+            return cluster, []
+        cy, cx = divmod(cluster, self.columns)
+        return cluster, self.layers[cluster][:, cell[1] - cy * self.size, cell[0] - cx * self.size].tolist()
+
+    def _search_from(self, goal, wanted):
+        """Dijkstra outwards from goal over the nodes, until every node of the wanted clusters is settled.
+
+        Returns {node cell: walking distance to goal}, {node cell: next node
+        towards goal, or GOAL} and, for the nodes next to GOAL, {node cell:
+        cell where their path meets the goal's}.
+        """
+        width = self.grid.width
+        heap = []
+        for cell, extra in self._joins(*goal):
+            cluster, reach = self._reach(cell)
+            exit = cell[1] * width + cell[0]
+            heap.extend((steps + extra, node, GOAL, exit) for node, steps in zip(self.nodes[cluster], reach)
+                        if steps < NO_PATH)
+        heapq.heapify(heap)
+        remaining = sum(len(self.nodes[cluster]) for cluster in wanted)
+        distance = {}
+        toward = {}
+        exits = {}
+        while heap and remaining:
+            steps, cell, next_cell, exit = heapq.heappop(heap)
+            if cell in distance:
+                continue
+            distance[cell] = steps
+            toward[cell] = next_cell
+            if next_cell == GOAL:
+                exits[cell] = exit
+            cluster, index = self.node_index[cell]
+            if cluster in wanted:
+                remaining -= 1
+            for other, cost in zip(self.nodes[cluster], self.costs[cluster][index]):
+                if cost < NO_PATH and other not in distance:
+                    heapq.heappush(heap, (steps + cost, other, cell, GOAL))
+            for other in self.links[cluster][index]:
+                if other not in distance:
+                    heapq.heappush(heap, (steps + 1, other, cell, GOAL))
+        return distance, toward, exits
+
+    def _descend(self, cluster, index, x, y, limit):
+        """Up to limit cells walked from (x, y) downhill on a node's layer, ending on the node."""
+        grid, size = self.grid, self.size
+        layer = self.layers[cluster][index]
+        cy, cx = divmod(cluster, self.columns)
+        x0, y0 = cx * size, cy * size
+        steps = layer.item(y - y0, x - x0)
+        path = []
+        while steps > 0 and len(path) < limit:
+            for dx, dy in NEIGHBOURS:
+                next_x, next_y = x + dx, y + dy
+                if (x0 <= next_x < x0 + size and y0 <= next_y < y0 + size
+                        and layer.item(next_y - y0, next_x - x0) == steps - 1 and grid.is_valid_position(next_x, next_y)):
+                    break
+            else:
+                break
+            x, y = next_x, next_y
+            steps -= 1
+            path.append((x, y))
+        return path
+
+    def _refine(self, start, join, node, search, goal, limit):
+        """Cells from start through join and node, then along the search's nodes to goal, stopping after limit."""
+        width = self.grid.width
+        _, toward, exits = search
+        cluster, index = self.node_index[node]
+        path = [] if join == start else [join]
+        path.extend(self._descend(cluster, index, join[0], join[1], limit))
+        while len(path) < limit:
+            x, y = node % width, node // width
+            next_node = toward[node]
+            if next_node == GOAL:
+                # Walk from where the goal's path meets the layers down to the node, and take those cells back
+                exit = (exits[node] % width, exits[node] // width)
+                tail = self._descend(cluster, index, exit[0], exit[1], UNREACHABLE)[::-1][1:]
+                if exit != (x, y):
+                    tail.append(exit)
+                if exit != goal:
+                    tail.append(goal)
+                path.extend(tail)
+                break
+            next_cluster, next_index = self.node_index[next_node]
+            if next_cluster != cluster:
+                path.append((next_node % width, next_node // width))
+            else:
+                path.extend(self._descend(next_cluster, next_index, x, y, limit - len(path)))
+            node, cluster, index = next_node, next_cluster, next_index
+        return path[:limit]
+
+    def paths(self, starts, goal, max_steps=None):
+        """Shortest paths from many (x, y) cells to one goal, from a single search over the abstract graph.
+
+        Returns a list with, for each start, the cells after it up to goal,
+        or None if there is no path. With max_steps, paths stop after that
+        many cells, which is all a turn's move needs and saves refining the
+        rest. Paths leave each cluster through its entrances, so they can be
+        a few steps longer than the shortest on the grid.
+        """
+        self.refresh()
+        grid, size = self.grid, self.size
+        goal = tuple(goal)
+        limit = UNREACHABLE if max_steps is None else max_steps
+        goal_y, goal_x = divmod(self.cluster_of(*goal), self.columns)
+        starts = [tuple(start) for start in starts]
+        joins = {start: self._joins(*start) for start in starts}
+        wanted = {self.cluster_of(*cell) for start_joins in joins.values() for cell, _ in start_joins}
+        search = self._search_from(goal, wanted)
+        distance = search[0]
+        results = []
+        for start in starts:
+            if abs(start[0] - goal[0]) + abs(start[1] - goal[1]) <= 1:
+                results.append([goal][:limit] if start != goal else [])
+                continue
+            best, best_join, best_node = UNREACHABLE, None, None
+            for join, extra in joins[start]:
+                cluster, reach = self._reach(join)
+                for node, steps in zip(self.nodes[cluster], reach):
+                    if steps < NO_PATH and node in distance and extra + steps + distance[node] < best:
+                        best, best_join, best_node = extra + steps + distance[node], join, node
+            cy, cx = divmod(self.cluster_of(*start), self.columns)
+            if abs(cx - goal_x) <= 1 and abs(cy - goal_y) <= 1:
+                # Near the goal, entrances can be a detour: search the grid around both clusters too
+                x0, y0 = min(cx, goal_x) * size, min(cy, goal_y) * size
+                x1, y1 = (max(cx, goal_x) + 1) * size, (max(cy, goal_y) + 1) * size
+                direct = find_path(lambda x, y: x0 <= x < x1 and y0 <= y < y1 and grid.is_valid_position(x, y),
+                                   start, goal)
+                if direct is not None and len(direct) <= best:
+                    results.append(direct[:limit])
+                    continue
+            if best_node is None:
+                results.append(None)
+            else:
+                results.append(self._refine(start, best_join, best_node, search, goal, limit))
+        return results
+
+    def path(self, start, goal):
+        """Shortest path from one cell to another, as for paths()."""
+        return self.paths([start], goal)[0]
+
+    def team_paths(self, owner, goal, max_steps=None):
+        """Paths for every unit of one owner to goal, as {unit: cells or None}; see paths()."""
+        units = self.grid.units.owned_by(owner)
+        return dict(zip(units, self.paths([(unit.x, unit.y) for unit in units], goal, max_steps)))
@@ -0,0 +1,80 @@
+"""
+Seeded procedural maps.
+
+Features are placed all at once by sampling cells without replacement, so
+they never overwrite each other, and the same seed always gives the same map.
+Walls, mines and resource nodes are sized by density: the fraction of the
+allowed cells (away from the edges and both bases) each one covers.
+
+Base-to-base connectivity is guaranteed by construction. A random monotone
+corridor of cells, stepping right or down from the player base to the AI
+base, is kept free of walls.
+"""
+import collections
+import numpy as np
+
+# Densities that give the classic 10x10 map its 5 walls, 3 mines and 4 resource nodes
+WALL_DENSITY = 0.14
+MINE_DENSITY = 0.08
+RESOURCE_DENSITY = 0.11
+LIVE_OBSTACLES = 2
+EDGE_MARGIN = 2  # Features stay this many cells in from the edge of the map
+BASE_CLEARANCE = 2  # ...and further than this many steps from either base
+
+# Cell coordinates of each feature, as (n, 2) arrays of (x, y)
+MapLayout = collections.namedtuple("MapLayout", ["width", "height", "seed", "walls", "mines", "resources",
+                                                 "live_obstacles"])
+
+def base_corridor(width, height, rng):
+    """Boolean [y, x] mask of a random monotone path from (0, 0) to (width - 1, height - 1)."""
+    steps = rng.permutation(np.repeat([0, 1], [width - 1, height - 1]))  # 0 = right, 1 = down
+    path_x = np.concatenate([[0], np.cumsum(steps == 0)])
+    path_y = np.concatenate([[0], np.cumsum(steps == 1)])
+    corridor = np.zeros((height, width), dtype=bool)
+    corridor[path_y, path_x] = True
+    return corridor
+
+def allowed_cells(width, height):
+    """Boolean [y, x] mask of the cells features may be placed on."""
+    allowed = np.zeros((height, width), dtype=bool)
+    allowed[EDGE_MARGIN:height - EDGE_MARGIN, EDGE_MARGIN:width - EDGE_MARGIN] = True
+    # Only cells in the two base corners can be within BASE_CLEARANCE steps of a base
+    ys, xs = np.ogrid[0:min(height, BASE_CLEARANCE + 1), 0:min(width, BASE_CLEARANCE + 1)]
+    near_base = xs + ys <= BASE_CLEARANCE
+    rows, cols = near_base.shape
+    allowed[:rows, :cols] &= ~near_base
+    allowed[height - rows:, width - cols:] &= ~near_base[::-1, ::-1]
+    return allowed
+
+def _cells(flat_indices, width):
+    y, x = np.divmod(flat_indices, width)
+    return np.stack([x, y], axis=1)
+
+def generate_map(width, height, seed=None, wall_density=WALL_DENSITY, mine_density=MINE_DENSITY,
+                 resource_density=RESOURCE_DENSITY, live_obstacles=LIVE_OBSTACLES):
+    """Lay out a width x height map. Returns a MapLayout.
+
+    seed may be None for a fresh random map; the layout records the seed actually used.
+    """
+    if seed is None:
+        seed = int(np.random.randint(2**31))
+    rng = np.random.default_rng(seed)
+    allowed = allowed_cells(width, height)
+    corridor = base_corridor(width, height, rng)
+
+    # Walls first, off the corridor; everything else anywhere allowed that is still free
+    wall_candidates = np.flatnonzero(allowed & ~corridor)
+    wall_count = min(round(wall_density * np.count_nonzero(allowed)), len(wall_candidates))
+    walls = rng.choice(wall_candidates, size=wall_count, replace=False, shuffle=False)
+
+    allowed.ravel()[walls] = False
+    candidates = np.flatnonzero(allowed)
+    counts = [round(mine_density * (len(candidates) + wall_count)),
+              round(resource_density * (len(candidates) + wall_count)),
+              live_obstacles]
+    total = min(sum(counts), len(candidates))
+    chosen = rng.choice(candidates, size=total, replace=False)
+    mines, resources, live = np.split(chosen, np.cumsum(counts)[:2].clip(max=total))
+
+    return MapLayout(width, height, seed, _cells(walls, width), _cells(mines, width),
+                     _cells(resources, width), _cells(live, width))
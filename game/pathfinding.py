@@ -0,0 +1,104 @@
+import collections
+import heapq
+import numpy as np
+
+# Four-way neighbour steps: up, down, left, right
+NEIGHBOURS = ((0, -1), (0, 1), (-1, 0), (1, 0))
+
+UNREACHABLE = 1 << 30  # Distance of cells with no path to any goal
+
+def bounded_flood_fill(is_passable, start_x, start_y, max_steps):
+    """Breadth-first flood fill from a cell, stopping after max_steps steps.
+
+    Returns a frozenset of reachable (x, y) cells, not including the start cell.
+    Paths never cross cells for which is_passable(x, y) is False.
+    """
+    reachable = set()
+    visited = {(start_x, start_y)}
+    frontier = collections.deque([(start_x, start_y, 0)])
+    while frontier:
+        x, y, steps = frontier.popleft()
+        if steps == max_steps:
+            continue
+        for dx, dy in NEIGHBOURS:
+            cell = (x + dx, y + dy)
+            if cell in visited:
+                continue
+            visited.add(cell)
+            if is_passable(cell[0], cell[1]):
+                reachable.add(cell)
+                frontier.append((cell[0], cell[1], steps + 1))
+    return frozenset(reachable)
+
+def find_path(is_passable, start, goal):
+    """A* search for a shortest four-way path from start to goal.
+
+    Returns the (x, y) cells after start up to and including goal, or None
+    if there is no path. Paths never cross cells for which is_passable(x, y)
+    is False, though the goal itself may be one (e.g. an enemy to reach).
+    """
+    goal_x, goal_y = goal
+    if start == goal:
+        return []
+    came_from = {start: None}
+    cost = {start: 0}
+    heap = [(abs(start[0] - goal_x) + abs(start[1] - goal_y), 0, start)]
+    while heap:
+        _, steps, cell = heapq.heappop(heap)
+        if cell == goal:
+            path = []
+            while cell != start:
+                path.append(cell)
+                cell = came_from[cell]
+            return path[::-1]
+        if steps > cost[cell]:
+            continue
+        for dx, dy in NEIGHBOURS:
+            next_cell = (cell[0] + dx, cell[1] + dy)
+            if steps + 1 < cost.get(next_cell, UNREACHABLE) and (next_cell == goal or is_passable(*next_cell)):
+                cost[next_cell] = steps + 1
+                came_from[next_cell] = cell
+                estimate = steps + 1 + abs(next_cell[0] - goal_x) + abs(next_cell[1] - goal_y)
+                heapq.heappush(heap, (estimate, steps + 1, next_cell))
+    return None
+
+def fill_distances(distances, stride, goals, walls, blocked):
+    """Multi-source BFS over flat layers padded with a wall border, filling distances in place.
+
+    Every layer is a flattened [y, x] array whose rows are stride cells long,
+    so the neighbours of a cell are one index and one stride away. Walls are
+    never entered; blocked cells get a distance but paths don't go through
+    them, except for goals, where every path starts.
+    """
+    distances.fill(UNREACHABLE)
+    frontier = np.flatnonzero(goals & ~walls)
+    distances[frontier] = 0
+    slot = np.empty(len(distances), dtype=np.intp)  # Scratch for dropping repeated cells without sorting
+    steps = 0
+    while len(frontier):
+        steps += 1
+        cells = np.concatenate((frontier - 1, frontier + 1, frontier - stride, frontier + stride))
+        cells = cells[(distances[cells] == UNREACHABLE) & ~walls[cells]]
+        # A cell next to several frontier cells is listed once for each; keep its last listing
+        order = np.arange(len(cells))
+        slot[cells] = order
+        cells = cells[slot[cells] == order]
+        distances[cells] = steps
+        frontier = cells[~blocked[cells]]
+
+def distance_field(walls, goals, blocked=None):
+    """Four-way walking distance from every cell to the nearest goal, as an int32 [..., y, x] array.
+
+    walls, goals and blocked are boolean [..., y, x] masks; leading axes are
+    separate maps. Paths go around walls, and blocked cells get a distance
+    without being walked through. Walls and cells with no path to a goal get
+    UNREACHABLE.
+    """
+    padding = [(0, 0)] * (walls.ndim - 2) + [(1, 1), (1, 1)]
+    padded_walls = np.pad(walls, padding, constant_values=True)
+    shape = padded_walls.shape
+    padded_walls = padded_walls.ravel()
+    padded_blocked = padded_walls if blocked is None else np.pad(blocked, padding).ravel() | padded_walls
+    distances = np.empty(len(padded_walls), dtype=np.int32)
+    fill_distances(distances, shape[-1], np.pad(goals, padding).ravel(), padded_walls, padded_blocked)
+    return distances.reshape(shape)[..., 1:-1, 1:-1]
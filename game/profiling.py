@@ -0,0 +1,137 @@
+"""
+Frame and function timing.
+
+Code is timed in named sections, which may nest:
+
+    with profiler.section("render"):
+        ...
+
+and hot functions are wrapped with the @profiler.timed() decorator. A section
+that isn't inside another one counts as a frame: when it closes, the time
+spent in every section during it is added to that section's rolling window,
+so percentiles describe how much of a frame each section takes. Time is also
+summed per call stack and can be written as a collapsed-stack profile for
+flamegraph tools, or as a CSV of percentiles.
+
+When the profiler is disabled a section is a shared no-op context manager and
+a timed function costs one extra call.
+"""
+import collections
+import csv
+import functools
+import time
+import numpy as np
+
+class _NullSection:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_SECTION = _NullSection()
+
+class _Section:
+    __slots__ = ("profiler", "name")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._stack.append([self.name, time.perf_counter(), 0.0])
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler._close_section()
+        return False
+
+class Profiler:
+    """Rolling per-frame timings of named sections."""
+    def __init__(self, window=600):
+        self.enabled = False
+        self.window = window  # Frames kept per section for the percentiles
+        self.samples = {}  # section -> ring of per-frame seconds
+        self.frames = {}  # section -> frames the section has run in
+        self.stacks = collections.Counter()  # "frame;render;ui" -> seconds spent in that stack itself
+        self._stack = []  # [name, start time, seconds spent in children] of each open section
+        self._frame = {}  # section -> seconds spent in it during the current frame
+
+    def section(self, name):
+        """Context manager timing the code inside it under name."""
+        if not self.enabled:
+            return NULL_SECTION
+        return _Section(self, name)
+
+    def timed(self, name=None):
+        """Decorator timing every call of a function, under its qualified name by default."""
+        def decorate(func):
+            label = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Section(self, label):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def _close_section(self):
+        name, start, child_time = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        path = ";".join([frame[0] for frame in self._stack] + [name])
+        self.stacks[path] += elapsed - child_time
+        self._frame[name] = self._frame.get(name, 0.0) + elapsed
+        if self._stack:
+            self._stack[-1][2] += elapsed
+            return
+        # The outermost section closed: the frame is over
+        for section, seconds in self._frame.items():
+            samples = self.samples.get(section)
+            if samples is None:
+                samples = self.samples[section] = np.zeros(self.window)
+                self.frames[section] = 0
+            samples[self.frames[section] % self.window] = seconds
+            self.frames[section] += 1
+        self._frame.clear()
+
+    def reset(self):
+        self.samples.clear()
+        self.frames.clear()
+        self.stacks.clear()
+        self._frame.clear()
+
+    def stats(self):
+        """One dict per section with its frame count and mean/p50/p95/p99/max milliseconds."""
+        rows = []
+        for section, samples in self.samples.items():
+            frames = self.frames[section]
+            window = samples[:min(frames, self.window)] * 1000
+            p50, p95, p99 = np.percentile(window, [50, 95, 99])
+            rows.append({
+                "section": section,
+                "frames": frames,
+                "mean_ms": float(window.mean()),
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+                "max_ms": float(window.max()),
+            })
+        return rows
+
+    def write_csv(self, path):
+        rows = self.stats()
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["section", "frames", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def write_collapsed(self, path):
+        """Write time per call stack in microseconds, in the collapsed format flamegraph tools read."""
+        with open(path, "w") as f:
+            for stack, seconds in sorted(self.stacks.items()):
+                f.write(f"{stack} {round(seconds * 1e6)}\n")
+
+# Shared by all game code in the process
+profiler = Profiler()
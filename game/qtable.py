@@ -0,0 +1,55 @@
+import numpy as np
+
+class DenseQTable:
+    """Q-values for a bounded integer state space, stored in one contiguous array.
+
+    States are tuples of ints with low[i] <= state[i] <= high[i]. Each state
+    maps to one row of values (one column per action) by index arithmetic, so
+    lookups do no hashing and reading a state never allocates or inserts.
+    """
+    def __init__(self, low, high, num_actions=5, dtype=np.float64):
+        self.low = tuple(int(value) for value in low)
+        self.high = tuple(int(value) for value in high)
+        self.shape = tuple(hi - lo + 1 for lo, hi in zip(self.low, self.high))
+        self.num_actions = num_actions
+        self.values = np.zeros((int(np.prod(self.shape)), num_actions), dtype=dtype)
+        # Row-major strides for turning a state tuple into a row number
+        strides = []
+        stride = 1
+        for size in reversed(self.shape):
+            strides.append(stride)
+            stride *= size
+        self.strides = tuple(reversed(strides))
+
+    def index(self, state):
+        """Row number of a state."""
+        row = 0
+        for value, lo, hi, stride in zip(state, self.low, self.high, self.strides):
+            if not lo <= value <= hi:
+                raise IndexError(f"State {state} is outside {self.low}..{self.high}")
+            row += (value - lo) * stride
+        return row
+
+    def indices(self, states):
+        """Row numbers for an (n, len(shape)) array of states."""
+        states = np.asarray(states) - np.array(self.low)
+        return states @ np.array(self.strides)
+
+    def state(self, row):
+        """State tuple of a row number, the inverse of index()."""
+        return tuple(int(value) + lo for value, lo in zip(np.unravel_index(row, self.shape), self.low))
+
+    def __getitem__(self, state):
+        # A view, so q_table[state][action] = value writes through
+        return self.values[self.index(state)]
+
+    def __setitem__(self, state, values):
+        self.values[self.index(state)] = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def copy(self):
+        table = DenseQTable(self.low, self.high, self.num_actions, self.values.dtype)
+        table.values[:] = self.values
+        return table
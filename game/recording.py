@@ -0,0 +1,285 @@
+"""
+Match recording and replay.
+
+A recording holds what is needed to play a match again without its AIs: the
+map it started on and every command that changed the game, in order.
+Commands are recorded where they take effect, in the grid's add_unit,
+move_unit, handle_combat, use_ability and move_live_obstacles and in
+GameState.next_turn, so clicks in the UI, AI turns and scripted policies are
+all captured the same way. A replay calls the same methods on a new headless
+engine, with no decisions, learning or animation, so a match replays as fast
+as its rules run.
+
+Files are read through a memory map, a chunk of commands at a time, so
+archives far larger than memory can be scanned. A turn index written on
+close gives the first command of every turn.
+
+    header: magic (4s) | format version (H) | record size (H) | seed (q)
+            | width (I) | height (I) | first turn (I) | live obstacles (I)
+    terrain layer (width * height int8) | live obstacle cells ((x, y) int32 pairs)
+    command records
+    turn index (u8 per turn) | index offset (Q) | turns (I) | b"NDIX"
+
+A recording that was never closed is still readable; its turn index is
+rebuilt by scanning the commands.
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+import numpy as np
+
+# Command kinds
+MOVE_UNIT = 1
+COMBAT = 2
+ABILITY = 3
+MOVE_OBSTACLE = 4
+END_TURN = 5
+ADD_UNIT = 6
+
+# Command kind -> (name, names of its arguments)
+COMMAND_TYPES = {
+    MOVE_UNIT: ("move_unit", ("unit", "x", "y")),
+    COMBAT: ("combat", ("unit", "target_x", "target_y")),
+    ABILITY: ("ability", ("unit", "ability", "target_x", "target_y")),  # ability indexes unit.abilities
+    MOVE_OBSTACLE: ("move_obstacle", ("obstacle", "x", "y")),  # obstacle indexes grid.live_obstacles
+    END_TURN: ("end_turn", ()),
+    ADD_UNIT: ("add_unit", ("unit_type", "owner", "x", "y")),  # unit_type indexes UNIT_TYPES, owner is its code
+}
+NO_TARGET = -1  # Ability target coordinate when there is none
+UNIT_TYPES = ("Corvette", "Mech", "Dreadnought", "Drone")  # Unit classes in game.units that ADD_UNIT can create
+
+ARGS = 4
+COMMAND = np.dtype([("kind", "u1"), ("turn", "<u4"), ("args", "<i4", ARGS)])
+
+MAGIC = b"NDRC"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHqIIII")
+INDEX_MAGIC = b"NDIX"
+FOOTER = struct.Struct("<QI4s")
+CHUNK = 65536  # Commands buffered before writing, and read per chunk
+
+def format_command(kind, turn, args):
+    name, arg_names = COMMAND_TYPES[kind]
+    fields = " ".join(f"{field}={value}" for field, value in zip(arg_names, args))
+    return f"[turn {turn}] {name} {fields}".rstrip()
+
+class Recorder:
+    """Writes the commands of a match to a file as they happen.
+
+    Start it on a newly created engine, before anything has moved; the file
+    begins with the engine's current map, units and turn.
+    """
+    def __init__(self, path, engine, buffer_size=CHUNK):
+        grid = engine.grid
+        self.grid = grid
+        self.turn = engine.game_state.current_turn
+        self.buffer = np.zeros(buffer_size, dtype=COMMAND)
+        self.pending = 0  # Buffered commands not yet written
+        self.count = 0  # Commands recorded so far
+        self.turn_starts = [0]  # Index of the first command of each turn
+        live = np.array([(obs.x, obs.y) for obs in grid.live_obstacles], dtype="<i4").reshape(-1, 2)
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, FORMAT_VERSION, COMMAND.itemsize, grid.seed, grid.width, grid.height,
+                                     self.turn, len(live)))
+        self._file.write(grid.terrain.astype("i1").tobytes())
+        self._file.write(live.tobytes())
+        grid.recorder = self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def record(self, kind, *args):
+        """Record a command: its arguments in COMMAND_TYPES order."""
+        record = self.buffer[self.pending]
+        record["kind"] = kind
+        record["turn"] = self.turn
+        record["args"] = args + (0,) * (ARGS - len(args))
+        self.pending += 1
+        self.count += 1
+        if self.pending == len(self.buffer):
+            self.flush()
+
+    def end_turn(self):
+        self.record(END_TURN)
+        self.turn += 1
+        self.turn_starts.append(self.count)
+
+    def flush(self):
+        self._file.write(self.buffer[:self.pending].tobytes())
+        self.pending = 0
+
+    def close(self):
+        """Write the remaining commands and the turn index, and stop recording."""
+        if self._file is None:
+            return
+        self.flush()
+        index_offset = self._file.tell()
+        self._file.write(np.asarray(self.turn_starts, dtype="<u8").tobytes())
+        self._file.write(FOOTER.pack(index_offset, len(self.turn_starts), INDEX_MAGIC))
+        self._file.close()
+        self._file = None
+        if self.grid.recorder is self:
+            self.grid.recorder = None
+
+class Recording:
+    """A recording file opened for reading. Commands are memory-mapped, not loaded."""
+    def __init__(self, path):
+        self.path = path
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            raw = f.read(HEADER.size)
+            if len(raw) < HEADER.size:
+                raise ValueError(f"{path} is too short to be a recording")
+            (magic, version, record_size, self.seed, self.width, self.height,
+             self.first_turn, live_count) = HEADER.unpack(raw)
+            if magic != MAGIC or version != FORMAT_VERSION or record_size != COMMAND.itemsize:
+                raise ValueError(f"{path} is not a version {FORMAT_VERSION} recording")
+            start = HEADER.size + self.width * self.height + live_count * 8
+            end = size
+            turn_starts = None
+            if size - start >= FOOTER.size:
+                f.seek(size - FOOTER.size)
+                index_offset, turns, magic = FOOTER.unpack(f.read(FOOTER.size))
+                if magic == INDEX_MAGIC and index_offset + turns * 8 + FOOTER.size == size:
+                    end = index_offset
+                    turn_starts = np.fromfile(path, dtype="<u8", count=turns, offset=index_offset).astype(np.int64)
+        self.terrain = np.fromfile(path, dtype="i1", count=self.width * self.height,
+                                   offset=HEADER.size).reshape(self.height, self.width)
+        self.live_obstacles = np.fromfile(path, dtype="<i4", count=live_count * 2,
+                                          offset=HEADER.size + self.width * self.height).reshape(-1, 2)
+        count = (end - start) // COMMAND.itemsize  # A partly written last command is dropped
+        if count:
+            self.commands = np.memmap(path, dtype=COMMAND, mode="r", offset=start, shape=(count,))
+        else:
+            self.commands = np.zeros(0, dtype=COMMAND)
+        self.turn_starts = turn_starts if turn_starts is not None else self._scan_turns()
+
+    def __len__(self):
+        return len(self.commands)
+
+    @property
+    def turns(self):
+        """Turns the recording reaches, counting the one in progress when it ended."""
+        return len(self.turn_starts)
+
+    def _scan_turns(self):
+        starts = [np.zeros(1, dtype=np.int64)]
+        for offset in range(0, len(self.commands), CHUNK):
+            kinds = self.commands["kind"][offset:offset + CHUNK]
+            starts.append(np.flatnonzero(kinds == END_TURN) + offset + 1)
+        return np.concatenate(starts)
+
+    def turn_start(self, turn):
+        """Index of the first command of a turn; past the last turn, the end of the commands."""
+        if turn < self.first_turn:
+            raise ValueError(f"{self.path} starts at turn {self.first_turn}")
+        index = turn - self.first_turn
+        return int(self.turn_starts[index]) if index < len(self.turn_starts) else len(self.commands)
+
+    def chunks(self, from_turn=None, to_turn=None):
+        """The commands from the start of from_turn up to the start of to_turn, a chunk at a time."""
+        start = 0 if from_turn is None else self.turn_start(from_turn)
+        stop = len(self.commands) if to_turn is None else self.turn_start(to_turn)
+        for offset in range(start, stop, CHUNK):
+            yield self.commands[offset:min(offset + CHUNK, stop)]
+
+    def layout(self):
+        """The map the match started on, as a MapLayout."""
+        from game.grid import layout_from_terrain
+        return layout_from_terrain(self.terrain, self.live_obstacles, self.seed)
+
+    def new_engine(self):
+        """A headless engine set up as the match was when recording started."""
+        from game.engine import GameEngine
+        if self.width != self.height:
+            raise ValueError(f"{self.path} has a {self.width}x{self.height} map; engines are square")
+        engine = GameEngine(self.width, seed=self.seed, layout=self.layout())
+        # A replay starts on the recorded turn and side; sides alternate from the player on turn 1
+        engine.game_state.current_turn = self.first_turn
+        engine.game_state.current_player = "player" if self.first_turn % 2 else "ai"
+        return engine
+
+def apply_command(engine, kind, args):
+    """Carry out one recorded command on an engine."""
+    grid = engine.grid
+    if kind == ADD_UNIT:
+        from game import units
+        from game.unit_store import OWNER_NAMES
+        unit_class = getattr(units, UNIT_TYPES[args[0]])
+        grid.add_unit(unit_class(args[2], args[3], OWNER_NAMES[args[1]]))
+    elif kind == MOVE_UNIT:
+        grid.move_unit(grid.units.get(args[0]), args[1], args[2])
+    elif kind == COMBAT:
+        grid.handle_combat(grid.units.get(args[0]), args[1], args[2])
+    elif kind == ABILITY:
+        unit = grid.units.get(args[0])
+        grid.use_ability(unit, unit.abilities[args[1]], None if args[2] == NO_TARGET else args[2],
+                         None if args[3] == NO_TARGET else args[3])
+    elif kind == MOVE_OBSTACLE:
+        grid.place_live_obstacle(grid.live_obstacles[args[0]], args[1], args[2])
+    elif kind == END_TURN:
+        if engine.game_state.current_player == "player":
+            engine.end_player_turn()
+        else:
+            engine.game_state.next_turn()
+        engine.check_win_condition()
+
+def replay(recording, until_turn=None, on_turn_end=None):
+    """Play a recording back on a new headless engine and return the engine.
+
+    With until_turn, stop where that turn begins. Commands carry no game
+    state, so reaching a turn always means replaying every turn before it.
+    on_turn_end, if given, is called with the engine after each turn.
+    """
+    engine = recording.new_engine()
+    for chunk in recording.chunks(to_turn=until_turn):
+        for kind, args in zip(chunk["kind"].tolist(), chunk["args"].tolist()):
+            apply_command(engine, kind, args)
+            if kind == END_TURN and on_turn_end is not None:
+                on_turn_end(engine)
+    engine.check_win_condition()
+    return engine
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize and replay match recordings.")
+    parser.add_argument("paths", nargs="+", help="recording files")
+    parser.add_argument("--turn", type=int, help="print the commands of this turn instead")
+    parser.add_argument("--no-replay", action="store_true", help="only count commands, without replaying")
+    args = parser.parse_args()
+
+    winners = {}
+    replayed = 0
+    replay_time = 0.0
+    for path in args.paths:
+        recording = Recording(path)
+        if args.turn is not None:
+            for chunk in recording.chunks(args.turn, args.turn + 1):
+                for record in chunk:
+                    print(format_command(int(record["kind"]), int(record["turn"]), record["args"].tolist()))
+            continue
+        counts = np.zeros(max(COMMAND_TYPES) + 1, dtype=np.int64)
+        for chunk in recording.chunks():
+            counts += np.bincount(chunk["kind"], minlength=len(counts))
+        summary = ", ".join(f"{counts[kind]} {name}" for kind, (name, _) in COMMAND_TYPES.items())
+        line = f"{path}: {recording.width}x{recording.height} seed {recording.seed}, {recording.turns} turns, {summary}"
+        if not args.no_replay:
+            start = time.perf_counter()
+            winner = replay(recording).winner
+            replay_time += time.perf_counter() - start
+            replayed += len(recording)
+            winners[winner] = winners.get(winner, 0) + 1
+            line += f", winner {winner}"
+        print(line)
+    if winners:
+        results = ", ".join(f"{winner}: {count}" for winner, count in winners.items())
+        print(f"{sum(winners.values())} matches ({results}), replayed at {replayed / max(replay_time, 1e-9):,.0f} "
+              f"commands/sec", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import time
+import pygame
+from game.grid import LiveObstacle
+from game.profiling import profiler
+
+PROFILE_REFRESH = 0.5  # Seconds between updates of the profiling overlay
+
+class Renderer:
+    """Draws the game screen in layers and only pushes the parts that changed.
+
+    The map is drawn through a Camera into a viewport at the top left of the
+    screen, and only what the camera can see is ever drawn, so frame time
+    doesn't grow with the map. The visible terrain is pre-rendered into a
+    static surface and the valid-move highlight into an overlay surface; each
+    is rebuilt only when what it shows or the camera changes. Units and live
+    obstacles in view are dynamic items: when one moves or changes, only its
+    old and new rectangles are repainted and passed to pygame.display.update.
+    The whole screen is redrawn when the UI state, the end-of-game banner or
+    the camera changes.
+
+    With show_profile set, the profiler's per-section timings are drawn over
+    the top left of the map and repainted every frame.
+    """
+    def __init__(self, screen, grid, ui, draw_bases, camera):
+        self.screen = screen
+        self.grid = grid
+        self.ui = ui
+        self.draw_bases = draw_bases  # Callable drawing the bases onto a surface through a camera
+        self.camera = camera
+        self.viewport = pygame.Rect(0, 0, camera.viewport_width, camera.viewport_height)
+        self.banner_font = pygame.font.Font(None, 60)
+
+        self.static_layer = pygame.Surface(self.viewport.size)
+        self.static_key = None  # (terrain version, camera version) the static layer shows
+        self.overlay = pygame.Surface(self.viewport.size, pygame.SRCALPHA)
+        self.overlay_moves = frozenset()
+        self.overlay_camera = None  # Camera version the overlay was drawn for
+
+        self.drawn_items = {}  # key -> (rect, signature) as of the last frame
+        self.full_redraw_key = None
+
+        self.show_profile = False
+        self.profile_font = pygame.font.Font(None, 18)
+        self.profile_surface = None
+        self.profile_rect = None  # Where the overlay was last drawn
+        self.profile_built = 0.0
+
+    def _rebuild_static_layer(self):
+        self.static_layer.fill((0, 0, 0))  # Black background
+        self.grid.draw_terrain(self.static_layer, self.camera)
+        self.draw_bases(self.static_layer, self.camera)
+        self.static_key = (self.grid.terrain_version, self.camera.version)
+
+    def _rebuild_overlay(self):
+        self.overlay.fill((0, 0, 0, 0))
+        self.grid.draw_valid_moves(self.overlay, self.camera)
+        self.overlay_moves = frozenset(self.grid.valid_moves)
+        self.overlay_camera = self.camera.version
+
+    def _cell_rect(self, x, y):
+        size = self.camera.cell_size
+        return pygame.Rect(self.camera.cell_to_screen(x, y), (size, size))
+
+    def _dynamic_items(self, unit_positions):
+        """Everything in view drawn over the map each frame, as key -> (rect, signature, draw)."""
+        camera = self.camera
+        size = camera.cell_size
+        origin = camera.origin
+        items = {}
+        for entity, position in self.grid.entities_in_view(unit_positions, camera):
+            if isinstance(entity, LiveObstacle):
+                draw = lambda obs=entity: obs.draw(self.screen, size, origin)
+                items[("live_obstacle", id(entity))] = (self._cell_rect(entity.x, entity.y), (entity.x, entity.y), draw)
+                continue
+            unit = entity
+            x, y = position if position is not None else (unit.x, unit.y)
+            rect = unit.screen_rect(size, (x, y), origin)
+            draw = lambda unit=unit, position=position: unit.draw(self.screen, size, position=position, origin=origin)
+            items[("unit", id(unit))] = (rect, (x, y, unit.health, unit.max_health), draw)
+        return items
+
+    def _rebuild_profile_overlay(self):
+        lines = [f"{'section':<28}{'p50':>7}{'p95':>7}{'p99':>7} ms"]
+        for row in profiler.stats():
+            lines.append(f"{row['section'][:27]:<28}{row['p50_ms']:7.2f}{row['p95_ms']:7.2f}{row['p99_ms']:7.2f}")
+        rendered = [self.profile_font.render(line, True, (255, 255, 255)) for line in lines]
+        line_height = self.profile_font.get_linesize()
+        width = max(text.get_width() for text in rendered) + 10
+        self.profile_surface = pygame.Surface((width, line_height * len(rendered) + 10), pygame.SRCALPHA)
+        self.profile_surface.fill((0, 0, 0, 190))
+        for index, text in enumerate(rendered):
+            self.profile_surface.blit(text, (5, 5 + index * line_height))
+        self.profile_built = time.perf_counter()
+
+    def render(self, unit_positions=None, banner=None):
+        """Draw a frame. Returns the list of screen rects that were updated."""
+        with profiler.section("render"):
+            return self._render(unit_positions, banner)
+
+    def _render(self, unit_positions, banner):
+        if unit_positions is None:
+            unit_positions = {}
+        with profiler.section("layers"):
+            if self.static_key != (self.grid.terrain_version, self.camera.version):
+                self._rebuild_static_layer()
+                self.full_redraw_key = None
+            overlay_changed = self.overlay_moves != self.grid.valid_moves or self.overlay_camera != self.camera.version
+            if overlay_changed:
+                old_moves = self.overlay_moves
+                self._rebuild_overlay()
+            if self.show_profile and time.perf_counter() - self.profile_built > PROFILE_REFRESH:
+                self._rebuild_profile_overlay()
+
+        items = self._dynamic_items(unit_positions)
+        full_redraw_key = (self.ui.state_key(), banner, self.camera.version)
+        if full_redraw_key != self.full_redraw_key:
+            self.full_redraw_key = full_redraw_key
+            with profiler.section("grid"):
+                self.screen.fill((0, 0, 0))
+                self.screen.set_clip(self.viewport)
+                self.screen.blit(self.static_layer, (0, 0))
+                self.screen.blit(self.overlay, (0, 0))
+                for _, _, draw in items.values():
+                    draw()
+                self.screen.set_clip(None)
+            with profiler.section("ui"):
+                self.ui.draw()
+                if banner:
+                    text_surface = self.banner_font.render(banner, True, (255, 255, 0))
+                    self.screen.blit(text_surface, text_surface.get_rect(center=self.screen.get_rect().center))
+            self._draw_profile_overlay()
+            self.drawn_items = {key: (rect, signature) for key, (rect, signature, _) in items.items()}
+            with profiler.section("display"):
+                pygame.display.flip()
+            return [self.screen.get_rect()]
+
+        # Collect the old and new rects of everything that appeared, moved, changed or vanished
+        dirty = []
+        for key in self.drawn_items.keys() | items.keys():
+            old = self.drawn_items.get(key)
+            new = items.get(key)
+            if old is not None and new is not None and old[0] == new[0] and old[1] == new[1]:
+                continue
+            if old is not None:
+                dirty.append(old[0])
+            if new is not None:
+                dirty.append(new[0])
+        if overlay_changed:
+            dirty.extend(self._cell_rect(x, y) for x, y in old_moves ^ self.overlay_moves)
+        # The profiling overlay is repainted every frame, and its old area once more after it is hidden
+        if self.profile_rect is not None:
+            dirty.append(self.profile_rect)
+            self.profile_rect = None
+        if self.show_profile and self.profile_surface is not None:
+            dirty.append(self.profile_surface.get_rect())
+        self.drawn_items = {key: (rect, signature) for key, (rect, signature, _) in items.items()}
+        if not dirty:
+            return []
+
+        # Repaint each dirty rect from the layers, whatever dynamic items overlap it, then the cached UI panel
+        for rect in dirty:
+            with profiler.section("grid"):
+                self.screen.set_clip(rect)
+                self.screen.fill((0, 0, 0))
+                # The layers are viewport sized and the viewport sits at the screen's top left
+                self.screen.set_clip(rect.clip(self.viewport))
+                self.screen.blit(self.static_layer, rect, rect)
+                self.screen.blit(self.overlay, rect, rect)
+                for item_rect, _, draw in items.values():
+                    if item_rect.colliderect(rect):
+                        draw()
+            with profiler.section("ui"):
+                self.screen.set_clip(rect)
+                self.ui.draw()
+        self.screen.set_clip(None)
+        self._draw_profile_overlay()
+        with profiler.section("display"):
+            pygame.display.update(dirty)
+        return dirty
+
+    def _draw_profile_overlay(self):
+        if self.show_profile and self.profile_surface is not None:
+            self.profile_rect = self.screen.blit(self.profile_surface, (0, 0))
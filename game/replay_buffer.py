@@ -0,0 +1,85 @@
+import numpy as np
+
+class ReplayBuffer:
+    """Fixed-capacity experience replay kept in preallocated NumPy columns.
+
+    States are stored as DenseQTable row numbers. Once full, the oldest
+    experience is overwritten, so memory stays flat however long we play.
+
+    Prioritized sampling weights are kept in a sum tree: leaves hold each
+    slot's priority ** priority_exponent and every parent the sum of its two
+    children, so adding, sampling and updating priorities cost O(log capacity)
+    per experience instead of a pass over the buffer.
+    """
+    def __init__(self, capacity, priority_exponent=0.6):
+        self.capacity = capacity
+        self.priority_exponent = priority_exponent
+        self.states = np.zeros(capacity, dtype=np.int64)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float64)
+        self.next_states = np.zeros(capacity, dtype=np.int64)
+        self.priorities = np.zeros(capacity, dtype=np.float64)
+        self.max_priority = 1.0  # Highest priority ever given, for new experiences
+        self.leaves = 1 << max(0, capacity - 1).bit_length()  # Leaf count, a power of two
+        self.tree = np.zeros(2 * self.leaves, dtype=np.float64)  # Node i's children are 2i and 2i + 1; the root is 1
+        self.size = 0
+        self.position = 0  # Next slot to write
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state):
+        """Store one experience, with the highest priority seen so far so it gets replayed soon."""
+        self.states[self.position] = state
+        self.actions[self.position] = action
+        self.rewards[self.position] = reward
+        self.next_states[self.position] = next_state
+        self.priorities[self.position] = self.max_priority
+        # Set the leaf and fix up the sums on the way to the root
+        node = self.position + self.leaves
+        tree = self.tree
+        tree[node] = self.max_priority ** self.priority_exponent
+        node >>= 1
+        while node:
+            tree[node] = tree[2 * node] + tree[2 * node + 1]
+            node >>= 1
+        self.position = (self.position + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, batch_size, prioritized=False):
+        """Pick batch_size slots, uniformly or in proportion to their priority."""
+        if not prioritized:
+            return np.random.randint(0, self.size, batch_size)
+        tree = self.tree
+        draws = np.random.rand(batch_size) * tree[1]
+        nodes = np.ones(batch_size, dtype=np.int64)
+        # Walk down from the root, going right whenever the draw is past the left subtree's sum
+        while nodes[0] < self.leaves:
+            left = tree[2 * nodes]
+            right = draws >= left
+            draws -= left * right
+            nodes = 2 * nodes + right
+        return np.minimum(nodes - self.leaves, self.size - 1)
+
+    def update_priorities(self, slots, td_errors):
+        priorities = np.abs(td_errors) + 1e-3
+        self.priorities[slots] = priorities
+        self.max_priority = max(self.max_priority, float(priorities.max(initial=0.0)))
+        tree = self.tree
+        nodes = np.asarray(slots) + self.leaves
+        tree[nodes] = priorities ** self.priority_exponent
+        nodes = np.unique(nodes >> 1)
+        while nodes[0]:
+            tree[nodes] = tree[2 * nodes] + tree[2 * nodes + 1]
+            nodes = np.unique(nodes >> 1)
+
+def batched_td_update(q_values, states, actions, rewards, next_states, alpha, gamma):
+    """Apply a minibatch of Q-learning updates to a (rows, actions) array in one step.
+
+    Repeated state/action pairs share one averaged update. Returns the TD errors.
+    """
+    td_errors = rewards + gamma * q_values[next_states].max(axis=1) - q_values[states, actions]
+    pairs = states * q_values.shape[1] + actions
+    _, inverse, counts = np.unique(pairs, return_inverse=True, return_counts=True)
+    np.add.at(q_values, (states, actions), alpha * td_errors / counts[inverse])
+    return td_errors
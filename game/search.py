@@ -0,0 +1,330 @@
+"""
+Search-based AI.
+
+SearchAI chooses each action of a side's turn by looking ahead over the
+actions of both sides with alpha-beta search. Every unit acts ROUNDS times a
+turn; an action is an attack, an ability, a move or waiting, and each action
+is one ply. Moves follow the rules of the side being played: AI units step
+one cell a round, as GameEngine.rl_side_steps lets the Q-learning AI move,
+and player units make one move within their movement range a turn, as in
+the UI.
+
+Actions are tried on the real grid, through its own rules, and taken back
+with the grid's undo journal, so no game state is copied. The search deepens
+one ply at a time until the action's share of the turn's time budget runs
+out, and plays the best action of the deepest search that finished. Live
+obstacles are taken to stand still while the search looks ahead.
+
+Results are kept in a transposition table keyed by the grid's Zobrist hash,
+so a position reached again, by another order of the same actions or by the
+next iteration, reuses its score and searches its best action first.
+"""
+import argparse
+import time
+from collections import namedtuple
+from game.recording import ABILITY, COMBAT, MOVE_UNIT
+from game.trace import SEARCH, tracer
+from game.unit_store import OWNER_CODES
+from game.zobrist import EXACT, LOWER, SEARCH_FEATURE, UPPER, TranspositionTable, zobrist_key
+
+WAIT = 0  # Action kind for a unit doing nothing; the others are recording command kinds
+ROUNDS = 2  # Actions per unit per turn
+STEP_EVERY_ROUND = ("ai",)  # Sides whose units step one cell every round; the others move once a turn
+STEPS = ((0, -1), (0, 1), (-1, 0), (1, 0))  # One-cell moves, in QLearningAI's action order
+ENEMY = {"player": "ai", "ai": "player"}
+
+# Evaluation weights
+WIN_SCORE = 1 << 30  # Minus the plies it takes; scores past WIN_SCORE - MAX_PLIES are wins
+ELIMINATED_SCORE = 1 << 20  # Lost by a side with no units left, which can no longer win
+UNIT_SCORE = 1000  # Per unit alive, on top of its health
+DISTANCE_SCORE = 6  # Per cell between a side's nearest unit and the base it is heading for
+MAX_DISTANCE = (UNIT_SCORE - 1) // DISTANCE_SCORE  # Cells counted at most, so progress never outweighs a unit
+RESOURCE_SCORE = 8  # Per captured resource node
+
+MAX_PLIES = 1000
+INFINITY = float("inf")
+CHECK_INTERVAL = 32  # Nodes searched between looks at the clock
+
+# One search: nodes visited, plies searched to, seconds taken, the chosen action's score and
+# the transposition table lookups that found an entry
+SearchStats = namedtuple("SearchStats", ["nodes", "depth", "seconds", "score", "table_hits"])
+
+class _OutOfTime(Exception):
+    pass
+
+def _to_table(score, ply):
+    """A score as stored in the transposition table: wins counted from the position, not the root."""
+    if score > WIN_SCORE - MAX_PLIES:
+        return score + ply
+    if score < MAX_PLIES - WIN_SCORE:
+        return score - ply
+    return score
+
+def _from_table(score, ply):
+    if score > WIN_SCORE - MAX_PLIES:
+        return score - ply
+    if score < MAX_PLIES - WIN_SCORE:
+        return score + ply
+    return score
+
+class SearchAI:
+    """Alpha-beta search over both sides' actions with a time budget per turn.
+
+    Actions are (kind, unit, x, y, ability) tuples, with None for the fields
+    a kind doesn't use.
+    """
+    def __init__(self, budget_ms=100, max_depth=32, table_bits=16):
+        self.budget_ms = budget_ms  # Thinking time for a whole turn, shared evenly by its actions
+        self.max_depth = max_depth
+        self.table = TranspositionTable(table_bits)
+        self.searches = []  # SearchStats of each action of the last turn
+        self.grid = None
+        self.targets = None  # Side -> the base its units are heading for
+        self.nodes = 0
+        self.deadline = INFINITY
+
+    def turn_steps(self, engine, owner):
+        """Play one side's turn, yielding (unit, (old_x, old_y)) after each action like rl_side_steps."""
+        grid = engine.grid
+        schedule = [unit for _ in range(ROUNDS) for unit in grid.units.owned_by(owner)]
+        seconds = self.budget_ms / 1000 / max(1, len(schedule))
+        self.searches = []
+        for index, unit in enumerate(schedule):
+            # Skip units destroyed earlier this turn
+            if unit not in grid.units:
+                continue
+            old_position = (unit.x, unit.y)
+            self.play(grid, self.choose_action(engine, owner, schedule, index, seconds))
+            yield unit, old_position
+
+    def choose_action(self, engine, side, schedule, index, seconds):
+        """The best action for schedule[index], searching for up to seconds (always at least one ply)."""
+        grid = engine.grid
+        self.grid = grid
+        self.targets = {"ai": engine.player_base, "player": engine.ai_base}
+        unit = schedule[index]
+        actions = self.actions(unit, side)
+        best, best_score, depth_reached = actions[0], 0, 0
+        start = time.perf_counter()
+        self.nodes = 0
+        self.table.new_search()
+        hits = self.table.hits
+        # Nothing the search tries may reach a recording, the trace or the UI's move highlights
+        recorder, traced, valid_moves = grid.recorder, tracer.enabled, grid.valid_moves
+        grid.recorder = None
+        tracer.enabled = 0
+        grid.journal = []
+        try:
+            for depth in range(1, self.max_depth + 1 if len(actions) > 1 else 1):
+                self.deadline = start + seconds if depth > 1 else INFINITY
+                alpha = -INFINITY
+                for action in actions:
+                    if self._make(action, side):
+                        score = WIN_SCORE
+                    else:
+                        score = self._search(depth - 1, alpha, INFINITY, side, schedule, index + 1, 1)
+                    grid.undo(0)
+                    if score > alpha:
+                        alpha, iteration_best = score, action
+                best, best_score, depth_reached = iteration_best, alpha, depth
+                # Search the best action first next time round, for earlier cutoffs
+                actions.remove(best)
+                actions.insert(0, best)
+                if abs(best_score) >= WIN_SCORE - self.max_depth:
+                    break  # The outcome is settled
+        except _OutOfTime:
+            grid.undo(0)
+        finally:
+            grid.journal = None
+            grid.recorder = recorder
+            tracer.enabled = traced
+            grid.valid_moves = valid_moves
+        seconds = time.perf_counter() - start
+        stats = SearchStats(self.nodes, depth_reached, seconds, best_score, self.table.hits - hits)
+        self.searches.append(stats)
+        if tracer.enabled & SEARCH:
+            tracer.emit(SEARCH, unit.unit_id, depth_reached, self.nodes, int(self.nodes / max(seconds, 1e-9)),
+                        seconds * 1000, best_score)
+        return best
+
+    def _search(self, depth, alpha, beta, side, schedule, index, ply):
+        """Score of the position for side, which is to act with schedule[index] next."""
+        self.nodes += 1
+        if self.nodes % CHECK_INTERVAL == 0 and time.perf_counter() > self.deadline:
+            raise _OutOfTime()
+        grid = self.grid
+        store = grid.units
+        while index < len(schedule) and schedule[index] not in store:
+            index += 1
+        if depth and index == len(schedule):
+            # The turn passes to the other side, whose units start it with fresh flags
+            other = ENEMY[side]
+            units = store.owned_by(other)
+            if not units:
+                return self.evaluate(side)
+            mark = len(grid.journal)
+            grid.reset_turn_flags(other)
+            score = -self._search(depth, -beta, -alpha, other, [unit for _ in range(ROUNDS) for unit in units], 0, ply)
+            grid.undo(mark)
+            return score
+
+        key = grid.hash ^ zobrist_key(SEARCH_FEATURE, OWNER_CODES[side], index, len(schedule))
+        entry = self.table.probe(key)
+        first = 0
+        if entry is not None:
+            stored_depth, score, bound, first = entry
+            if stored_depth >= depth:
+                score = _from_table(score, ply)
+                if bound == EXACT or bound == LOWER and score >= beta or bound == UPPER and score <= alpha:
+                    return score
+        if depth == 0:
+            score = self.evaluate(side)
+            self.table.store(key, 0, score, EXACT, 0)
+            return score
+
+        actions = list(enumerate(self.actions(schedule[index], side)))
+        if 0 < first < len(actions):
+            # The best action last time this position was searched goes first
+            actions.insert(0, actions.pop(first))
+        original_alpha = alpha
+        best = -INFINITY
+        best_index = 0
+        for action_index, action in actions:
+            mark = len(grid.journal)
+            if self._make(action, side):
+                score = WIN_SCORE - ply
+            else:
+                score = self._search(depth - 1, alpha, beta, side, schedule, index + 1, ply + 1)
+            grid.undo(mark)
+            if score > best:
+                best = score
+                best_index = action_index
+                if best > alpha:
+                    alpha = best
+                    if alpha >= beta:
+                        break
+        bound = UPPER if best <= original_alpha else LOWER if best >= beta else EXACT
+        self.table.store(key, depth, _to_table(best, ply), bound, best_index)
+        return best
+
+    def _make(self, action, side):
+        """Play an action during the search. Returns True if it wins the match."""
+        self.play(self.grid, action)
+        unit = action[1]
+        return action[0] == MOVE_UNIT and unit in self.grid.units and (unit.x, unit.y) == self.targets[side]
+
+    @staticmethod
+    def play(grid, action):
+        """Carry out an action with the grid's rules."""
+        kind, unit, x, y, ability = action
+        if kind == MOVE_UNIT:
+            grid.move_unit(unit, x, y)
+        elif kind == COMBAT:
+            grid.handle_combat(unit, x, y)
+        elif kind == ABILITY:
+            grid.use_ability(unit, ability, x, y)
+
+    def actions(self, unit, side):
+        """A unit's legal actions, most promising first: attacks, abilities, moves nearest its target, waiting."""
+        grid = self.grid
+        in_range = grid.get_units_in_range(unit.x, unit.y, unit.attack_range, owner=ENEMY[side])
+        actions = [(COMBAT, unit, target.x, target.y, None) for target in in_range if unit.can_attack(target)]
+        for ability in unit.abilities:
+            if ability == "Quick Strike" and unit.has_attacked:
+                actions.append((ABILITY, unit, None, None, ability))
+            elif ability == "Repair":
+                actions.extend((ABILITY, unit, friend.x, friend.y, ability)
+                               for friend in grid.get_units_in_range(unit.x, unit.y, 1, owner=side)
+                               if friend.health < friend.max_health)
+            elif ability == "Area Attack" and not unit.has_attacked and len(in_range) > 1:
+                actions.append((ABILITY, unit, None, None, ability))
+            # Scout changes nothing the rules see
+        if side in STEP_EVERY_ROUND:
+            cells = [(unit.x + dx, unit.y + dy) for dx, dy in STEPS if grid.is_valid_position(unit.x + dx, unit.y + dy)]
+        elif not unit.has_moved:
+            cells = grid.get_reachable_cells(unit)
+        else:
+            cells = ()
+        target_x, target_y = self.targets[side]
+        cells = sorted(cells, key=lambda cell: abs(cell[0] - target_x) + abs(cell[1] - target_y))
+        actions.extend((MOVE_UNIT, unit, x, y, None) for x, y in cells)
+        actions.append((WAIT, unit, None, None, None))
+        return actions
+
+    def evaluate(self, side):
+        """Static score of the grid for side: units and health, progress towards the enemy base, resources.
+
+        A side with no units scores as eliminated, and the distance term is
+        capped below a unit's value, so losing units never pays for progress.
+        """
+        store = self.grid.units
+        # Searched positions hold few units, where a loop over plain lists beats array operations
+        units = {OWNER_CODES[side]: [0, 0, INFINITY], OWNER_CODES[ENEMY[side]]: [0, 0, INFINITY]}  # health, count, distance
+        targets = {OWNER_CODES[owner]: target for owner, target in self.targets.items()}
+        for owner, health, x, y in zip(store.column("owner").tolist(), store.column("health").tolist(),
+                                       store.column("x").tolist(), store.column("y").tolist()):
+            totals = units[owner]
+            totals[0] += health
+            totals[1] += 1
+            target_x, target_y = targets[owner]
+            totals[2] = min(totals[2], abs(x - target_x) + abs(y - target_y))
+        score = 0
+        for code, sign in ((OWNER_CODES[side], 1), (OWNER_CODES[ENEMY[side]], -1)):
+            health, count, distance = units[code]
+            if count:
+                score += sign * (health + UNIT_SCORE * count - DISTANCE_SCORE * min(distance, MAX_DISTANCE))
+            else:
+                score -= sign * ELIMINATED_SCORE
+        for resource in self.grid.owned_resources:
+            score += RESOURCE_SCORE if resource.owner == side else -RESOURCE_SCORE
+        return score
+
+    def turn_report(self):
+        """One line summing up the searches of the last turn."""
+        if not self.searches:
+            return "no searches"
+        nodes = sum(stats.nodes for stats in self.searches)
+        seconds = sum(stats.seconds for stats in self.searches)
+        depths = [stats.depth for stats in self.searches]
+        hits = sum(stats.table_hits for stats in self.searches)
+        return (f"{len(self.searches)} searches, {nodes} nodes in {seconds * 1000:.0f} ms "
+                f"({nodes / max(seconds, 1e-9):,.0f} nodes/sec), depth {min(depths)}-{max(depths)}, "
+                f"{hits} transposition hits")
+
+def main():
+    from game.engine import GameEngine
+    parser = argparse.ArgumentParser(description="Play the search AI against the scripted player.")
+    parser.add_argument("--matches", type=int, default=5)
+    parser.add_argument("--grid-size", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=100, help="thinking time per AI turn")
+    parser.add_argument("--max-rounds", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first match's map")
+    args = parser.parse_args()
+
+    winners = {}
+    nodes = 0
+    seconds = 0.0
+    depths = []
+    for match in range(args.matches):
+        engine = GameEngine(args.grid_size, seed=args.seed + match)
+        engine.ai_search = SearchAI(args.budget_ms)
+        searches = []
+        for _ in range(args.max_rounds):
+            engine.play_round()
+            searches.extend(engine.ai_search.searches)
+            engine.ai_search.searches = []
+            if engine.game_over:
+                break
+        winners[engine.winner] = winners.get(engine.winner, 0) + 1
+        nodes += sum(stats.nodes for stats in searches)
+        seconds += sum(stats.seconds for stats in searches)
+        depths.extend(stats.depth for stats in searches)
+        print(f"match {match + 1}: winner {engine.winner} after {engine.game_state.current_turn} turns")
+    results = ", ".join(f"{winner}: {count}" for winner, count in winners.items())
+    print(f"{args.matches} matches ({results})")
+    if depths:
+        print(f"{nodes / max(seconds, 1e-9):,.0f} nodes/sec, depth reached {sum(depths) / len(depths):.1f} "
+              f"on average ({min(depths)}-{max(depths)})")
+
+if __name__ == "__main__":
+    main()
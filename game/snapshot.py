@@ -0,0 +1,251 @@
+"""
+Snapshots of a match, for saving, loading and branching game state.
+
+A snapshot holds the map layers, the unit store's rows, the live obstacles'
+cells, who has captured which resource nodes and the turn. Q-tables are learning
+rather than match state and are saved by game.checkpoint instead.
+
+Map layers are kept as read-only copies shared between snapshots. A layer
+that hasn't changed since the grid last matched a snapshot is reused rather
+than copied, and restoring skips layers the grid already holds, so search
+and autosave only pay for what changed between branches.
+
+Files are a header, a table of arrays and the arrays, each aligned so it can
+be memory-mapped:
+
+    magic (4s) | format version (H) | arrays (H) | STATE
+    per array: name (32s) | dtype (8s) | rows (Q) | columns (Q, 0 for 1-D) | offset (Q)
+    padding | arrays
+
+load_snapshot maps large arrays instead of reading them. Restoring such a
+snapshot gives the grid private copy-on-write maps of the file, so a large
+map costs nothing until its cells change.
+"""
+import os
+import struct
+import numpy as np
+from game.engine import GameEngine
+from game.grid import layout_from_terrain
+from game.trace import tracer
+from game.unit_store import OWNER_NAMES
+from game.units import Corvette, Dreadnought, Drone, Mech, Unit
+
+UNIT_TYPES = (Unit, Corvette, Mech, Dreadnought, Drone)  # Unit class codes in files
+PLAYERS = ("player", "ai")
+WINNERS = (None, "Player", "AI")
+NO_UNIT = -1  # selected_unit when no unit is selected
+
+# Map layer -> the grid attribute bumped whenever it changes
+LAYERS = {"terrain": "terrain_version", "entity_ids": "version", "owners": "version"}
+STATE_FIELDS = ("seed", "width", "height", "current_turn", "current_player", "player_resources", "ai_resources",
+                "game_over", "winner", "selected_unit", "next_entity_id", "ids_issued", "hash")
+
+MAGIC = b"NDSS"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<4sHH")
+STATE = struct.Struct("<qIIIBiiBBiQQQ")
+ENTRY = struct.Struct("<32s8sQQQ")
+ALIGNMENT = 64
+MAP_THRESHOLD = 1 << 20  # Arrays of at least this many bytes are memory-mapped when loaded
+
+class Snapshot:
+    """The state of a match at one moment."""
+    def __init__(self, state, layers, columns, live_obstacles, owned_resources, resource_owners,
+                 store=None, units=None, owner_order=None, unit_arrays=None):
+        self.state = state  # STATE_FIELDS -> int
+        self.layers = layers  # Layer name -> read-only [y, x] array
+        self.columns = columns  # Unit component -> values by row
+        self.live_obstacles = live_obstacles  # (x, y) of each live obstacle
+        self.owned_resources = owned_resources  # (x, y) of each captured resource node...
+        self.resource_owners = resource_owners  # ...and its owner code
+        # Snapshots taken from a running match refer to its Unit objects; loaded ones describe them instead
+        self.store = store  # UnitStore the units belong to
+        self.units = units  # Units by row
+        self.owner_order = owner_order  # Units in UnitStore per-owner order
+        self.unit_arrays = unit_arrays  # unit_types, unit_ids, unit_entity_ids and owner_order (ids) arrays
+
+def _shared_layer(grid, name):
+    """A read-only copy of a grid layer, reusing the last one while the layer is unchanged."""
+    version = getattr(grid, LAYERS[name])
+    cached = grid.layer_snapshots.get(name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    frozen = np.array(getattr(grid, name))
+    frozen.flags.writeable = False
+    grid.layer_snapshots[name] = (version, frozen)
+    return frozen
+
+def take_snapshot(engine):
+    """Capture an engine's match state. Unchanged map layers are shared with earlier snapshots."""
+    grid = engine.grid
+    game_state = engine.game_state
+    units, columns, ids_issued, owner_order = grid.units.state()
+    selected = game_state.selected_unit
+    state = {
+        "seed": grid.seed,
+        "width": grid.width,
+        "height": grid.height,
+        "current_turn": game_state.current_turn,
+        "current_player": PLAYERS.index(game_state.current_player),
+        "player_resources": game_state.player_resources,
+        "ai_resources": game_state.ai_resources,
+        "game_over": int(engine.game_over),
+        "winner": WINNERS.index(engine.winner),
+        "selected_unit": selected.unit_id if selected is not None and selected in grid.units else NO_UNIT,
+        "next_entity_id": grid._next_entity_id,
+        "ids_issued": ids_issued,
+        "hash": grid.hash,
+    }
+    layers = {name: _shared_layer(grid, name) for name in LAYERS}
+    live_obstacles = np.array([(obs.x, obs.y) for obs in grid.live_obstacles], dtype=np.int32).reshape(-1, 2)
+    owned_resources, resource_owners = grid.resource_ownership()
+    return Snapshot(state, layers, columns, live_obstacles, owned_resources, resource_owners,
+                    grid.units, units, owner_order)
+
+def _restore_layer(grid, name, source):
+    """Make a grid layer equal to a snapshot layer, unless it already is."""
+    cached = grid.layer_snapshots.get(name)
+    if cached is not None and cached[1] is source and cached[0] == getattr(grid, LAYERS[name]):
+        return
+    if isinstance(source, np.memmap) and source.nbytes >= MAP_THRESHOLD:
+        setattr(grid, name, np.memmap(source.filename, dtype=source.dtype, mode="c", offset=source.offset,
+                                      shape=source.shape))
+    else:
+        np.copyto(getattr(grid, name), source)
+
+def _unit_arrays(snapshot):
+    """The unit_types, unit_ids, unit_entity_ids and owner_order arrays that describe a snapshot's units."""
+    if snapshot.unit_arrays is not None:
+        return snapshot.unit_arrays
+    units = snapshot.units
+    return {
+        "unit_types": np.array([UNIT_TYPES.index(type(unit)) for unit in units], dtype=np.uint8),
+        "unit_ids": np.array([unit.unit_id for unit in units], dtype=np.int32),
+        "unit_entity_ids": np.array([unit.entity_id for unit in units], dtype=np.int32),
+        "owner_order": np.array([unit.unit_id for unit in snapshot.owner_order], dtype=np.int32),
+    }
+
+def _build_units(snapshot):
+    """New Unit objects matching a snapshot's, by row and in per-owner order."""
+    arrays = _unit_arrays(snapshot)
+    owners = snapshot.columns["owner"].tolist()
+    units = []
+    for code, unit_id, entity_id, owner in zip(arrays["unit_types"].tolist(), arrays["unit_ids"].tolist(),
+                                               arrays["unit_entity_ids"].tolist(), owners):
+        unit = UNIT_TYPES[code](0, 0, OWNER_NAMES[owner])
+        unit.unit_id = unit_id
+        unit.entity_id = entity_id
+        units.append(unit)
+    by_id = {unit.unit_id: unit for unit in units}
+    return units, [by_id[unit_id] for unit_id in arrays["owner_order"].tolist()]
+
+def restore_snapshot(engine, snapshot):
+    """Put an engine back in the state of a snapshot of a match on the same map.
+
+    Restoring into the engine a snapshot was taken from keeps its Unit
+    objects; any other engine gets new ones.
+
+    Raises ValueError if the snapshot was taken on a different map.
+    """
+    grid = engine.grid
+    game_state = engine.game_state
+    state = snapshot.state
+    terrain = snapshot.layers["terrain"]
+    cached = grid.layer_snapshots.get("terrain")
+    same_terrain = cached is not None and cached[1] is terrain and cached[0] == grid.terrain_version
+    if (state["width"], state["height"]) != (grid.width, grid.height) or len(snapshot.live_obstacles) != len(
+            grid.live_obstacles) or not (same_terrain or np.array_equal(terrain, grid.terrain)):
+        raise ValueError("the snapshot was taken on a different map")
+
+    for name in ("entity_ids", "owners"):
+        _restore_layer(grid, name, snapshot.layers[name])
+    grid.version += 1
+    for name in ("entity_ids", "owners"):
+        grid.layer_snapshots[name] = (grid.version, snapshot.layers[name])
+    grid.layer_snapshots["terrain"] = (grid.terrain_version, terrain)
+
+    if snapshot.store is grid.units:
+        units, owner_order = snapshot.units, snapshot.owner_order
+    else:
+        units, owner_order = _build_units(snapshot)
+    grid.units.restore(units, snapshot.columns, state["ids_issued"], owner_order)
+    for obs, (x, y) in zip(grid.live_obstacles, snapshot.live_obstacles.tolist()):
+        obs.x, obs.y = x, y
+    grid.restore_resource_ownership(snapshot.owned_resources, snapshot.resource_owners)
+    grid._next_entity_id = state["next_entity_id"]
+    grid.hash = state["hash"]
+    grid.reindex_entities()
+
+    game_state.current_turn = state["current_turn"]
+    game_state.current_player = PLAYERS[state["current_player"]]
+    game_state.player_resources = state["player_resources"]
+    game_state.ai_resources = state["ai_resources"]
+    game_state.selected_unit = None if state["selected_unit"] == NO_UNIT else grid.units.get(state["selected_unit"])
+    engine.game_over = game_state.game_over = bool(state["game_over"])
+    engine.winner = game_state.winner = WINNERS[state["winner"]]
+    tracer.turn = game_state.current_turn
+
+def engine_from_snapshot(snapshot, ai=None):
+    """A new headless engine in the state of a snapshot: a loaded one, or a clone of a running match."""
+    state = snapshot.state
+    if state["width"] != state["height"]:
+        raise ValueError(f"the snapshot has a {state['width']}x{state['height']} map; engines are square")
+    layout = layout_from_terrain(snapshot.layers["terrain"], snapshot.live_obstacles, state["seed"])
+    engine = GameEngine(state["width"], ai=ai, seed=state["seed"], layout=layout)
+    restore_snapshot(engine, snapshot)
+    return engine
+
+def _file_arrays(snapshot):
+    arrays = dict(snapshot.layers)
+    arrays.update((f"unit.{name}", column) for name, column in snapshot.columns.items())
+    arrays.update(_unit_arrays(snapshot))
+    arrays["live_obstacles"] = snapshot.live_obstacles
+    arrays["owned_resources"] = snapshot.owned_resources
+    arrays["resource_owners"] = snapshot.resource_owners
+    return arrays
+
+def save_snapshot(path, snapshot):
+    """Write a snapshot to path, replacing any existing file atomically."""
+    arrays = {name: np.ascontiguousarray(array) for name, array in _file_arrays(snapshot).items()}
+    offset = -(-(HEADER.size + STATE.size + ENTRY.size * len(arrays)) // ALIGNMENT) * ALIGNMENT
+    entries = []
+    for name, array in arrays.items():
+        rows, columns = array.shape if array.ndim == 2 else (len(array), 0)
+        entries.append(ENTRY.pack(name.encode("ascii"), array.dtype.str.encode("ascii"), rows, columns, offset))
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(arrays)))
+        f.write(STATE.pack(*(snapshot.state[field] for field in STATE_FIELDS)))
+        f.writelines(entries)
+        for array in arrays.values():
+            f.write(b"\0" * (-f.tell() % ALIGNMENT))
+            f.write(array.tobytes())
+    os.replace(temp_path, path)
+
+def load_snapshot(path):
+    """Read a snapshot written by save_snapshot, memory-mapping its large arrays."""
+    with open(path, "rb") as f:
+        raw = f.read(HEADER.size + STATE.size)
+        if len(raw) < HEADER.size + STATE.size:
+            raise ValueError(f"{path} is too short to be a snapshot")
+        magic, version, count = HEADER.unpack_from(raw)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} snapshot")
+        state = dict(zip(STATE_FIELDS, STATE.unpack_from(raw, HEADER.size)))
+        entries = [ENTRY.unpack(f.read(ENTRY.size)) for _ in range(count)]
+        arrays = {}
+        for name, dtype, rows, columns, offset in entries:
+            dtype = np.dtype(dtype.rstrip(b"\0").decode("ascii"))
+            shape = (rows, columns) if columns else (rows,)
+            if rows * max(columns, 1) * dtype.itemsize >= MAP_THRESHOLD:
+                array = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+            else:
+                f.seek(offset)
+                array = np.frombuffer(f.read(rows * max(columns, 1) * dtype.itemsize), dtype=dtype).reshape(shape)
+            arrays[name.rstrip(b"\0").decode("ascii")] = array
+    layers = {name: arrays.pop(name) for name in LAYERS}
+    columns = {name[len("unit."):]: arrays.pop(name) for name in list(arrays) if name.startswith("unit.")}
+    unit_arrays = {name: arrays.pop(name) for name in ("unit_types", "unit_ids", "unit_entity_ids", "owner_order")}
+    return Snapshot(state, layers, columns, arrays["live_obstacles"], arrays["owned_resources"],
+                    arrays["resource_owners"], unit_arrays=unit_arrays)
@@ -0,0 +1,87 @@
+from operator import attrgetter
+
+class SpatialIndex:
+    """Uniform bucket grid of units, kept separately for each owner.
+
+    Range queries only visit buckets that overlap the query diamond, so their
+    cost follows the number of nearby units rather than the army size. They
+    return units in unit id order, so the first unit found (the one an attack
+    or Area Attack hits) is the same in every process and after a restore.
+    """
+    def __init__(self, bucket_size=8):
+        self.bucket_size = bucket_size
+        self.buckets = {}  # owner -> {(bucket_x, bucket_y): {unit: None}}, in insertion order
+        self._cells = {}  # unit -> (x, y) the unit is indexed at
+
+    def _bucket_of(self, x, y):
+        return (x // self.bucket_size, y // self.bucket_size)
+
+    def insert(self, unit):
+        """Start tracking a unit at its current position."""
+        key = self._bucket_of(unit.x, unit.y)
+        self.buckets.setdefault(unit.owner, {}).setdefault(key, {})[unit] = None
+        self._cells[unit] = (unit.x, unit.y)
+
+    def remove(self, unit, owner=None):
+        """Stop tracking a unit, indexed under owner if given rather than its current owner."""
+        x, y = self._cells.pop(unit)
+        owner_buckets = self.buckets[unit.owner if owner is None else owner]
+        key = self._bucket_of(x, y)
+        bucket = owner_buckets[key]
+        del bucket[unit]
+        if not bucket:
+            del owner_buckets[key]
+
+    def move(self, unit):
+        """Re-index a unit after its position changed."""
+        old_x, old_y = self._cells[unit]
+        old_key = self._bucket_of(old_x, old_y)
+        new_key = self._bucket_of(unit.x, unit.y)
+        if old_key != new_key:
+            self.remove(unit)
+            self.insert(unit)
+        else:
+            self._cells[unit] = (unit.x, unit.y)
+
+    def change_owner(self, unit, old_owner):
+        """Re-index a unit after its owner changed from old_owner."""
+        self.remove(unit, old_owner)
+        self.insert(unit)
+
+    def query(self, x, y, distance, owner=None):
+        """Get all units within Manhattan distance of (x, y), optionally of one owner."""
+        if owner is None:
+            owners = list(self.buckets)
+        else:
+            owners = [owner]
+        size = self.bucket_size
+        min_bx, min_by = self._bucket_of(x - distance, y - distance)
+        max_bx, max_by = self._bucket_of(x + distance, y + distance)
+        span = (max_bx - min_bx + 1) * (max_by - min_by + 1)
+
+        found = []
+        for current_owner in owners:
+            owner_buckets = self.buckets.get(current_owner, {})
+            # Walk whichever is smaller: the covered buckets or the occupied ones
+            if span <= len(owner_buckets):
+                keys = [(bx, by) for bx in range(min_bx, max_bx + 1) for by in range(min_by, max_by + 1)]
+            else:
+                keys = [key for key in owner_buckets
+                        if min_bx <= key[0] <= max_bx and min_by <= key[1] <= max_by]
+            for bx, by in keys:
+                bucket = owner_buckets.get((bx, by))
+                if not bucket:
+                    continue
+                # Nearest and farthest corners of the bucket from (x, y)
+                left, top = bx * size, by * size
+                right, bottom = left + size - 1, top + size - 1
+                near = max(left - x, 0, x - right) + max(top - y, 0, y - bottom)
+                if near > distance:
+                    continue
+                far = max(abs(x - left), abs(x - right)) + max(abs(y - top), abs(y - bottom))
+                if far <= distance:
+                    found.extend(bucket)
+                else:
+                    found.extend(unit for unit in bucket if abs(unit.x - x) + abs(unit.y - y) <= distance)
+        found.sort(key=attrgetter("unit_id"))
+        return found
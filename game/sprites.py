@@ -0,0 +1,36 @@
+import pygame
+
+class SpriteAtlas:
+    """Pre-rendered sprites packed side by side into one surface.
+
+    Each sprite is rendered once, the first time its key is asked for, and
+    drawing it afterwards is a single blit from the atlas.
+    """
+    def __init__(self):
+        self.surface = None
+        self.areas = {}  # key -> Rect of the sprite inside surface
+
+    def get(self, key, size, render):
+        """Return (atlas surface, area) for key, calling render(surface) to draw it if it's new."""
+        area = self.areas.get(key)
+        if area is None:
+            area = self._add(key, size, render)
+        return self.surface, area
+
+    def _add(self, key, size, render):
+        width, height = size
+        sprite = pygame.Surface(size, pygame.SRCALPHA)
+        render(sprite)
+
+        # Grow the atlas to the right and copy the existing sprites across
+        x = self.surface.get_width() if self.surface else 0
+        atlas_height = max(height, self.surface.get_height() if self.surface else 0)
+        atlas = pygame.Surface((x + width, atlas_height), pygame.SRCALPHA)
+        if self.surface:
+            atlas.blit(self.surface, (0, 0))
+        atlas.blit(sprite, (x, 0))
+        self.surface = atlas
+
+        area = pygame.Rect(x, 0, width, height)
+        self.areas[key] = area
+        return area
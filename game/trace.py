@@ -0,0 +1,189 @@
+"""
+Structured event tracing.
+
+Game code records typed events into an in-memory ring buffer instead of
+printing. Each event kind is its own category bit, and call sites check the
+bit before building the event, so a disabled category costs one attribute
+lookup and an AND:
+
+    if tracer.enabled & MOVE:
+        tracer.emit(MOVE, unit.unit_id, old_x, old_y, new_x, new_y)
+
+Events can also be streamed to a file for analysis after a match. Files
+ending in .jsonl get one JSON object per event; anything else gets the
+compact binary format read back by read_trace:
+
+    magic (4s) | format version (H) | record size (H) | records
+"""
+import json
+import struct
+import sys
+import numpy as np
+from game.unit_store import OWNER_NAMES
+
+# Event kinds, each also the bit that enables it
+MOVE = 1 << 0
+ATTACK = 1 << 1
+CAPTURE = 1 << 2
+HAZARD = 1 << 3
+DEATH = 1 << 4
+SPAWN = 1 << 5
+DECISION = 1 << 6
+Q_UPDATE = 1 << 7
+TURN = 1 << 8
+INCOME = 1 << 9
+SEARCH = 1 << 10
+ALL = (1 << 11) - 1
+GAMEPLAY = MOVE | ATTACK | CAPTURE | HAZARD | DEATH | SPAWN | TURN | INCOME
+
+# Event kind -> (name, names of the integer fields, names of the float fields)
+EVENT_TYPES = {
+    MOVE: ("move", ("unit", "from_x", "from_y", "to_x", "to_y"), ()),
+    ATTACK: ("attack", ("attacker", "target", "damage", "target_health"), ()),
+    CAPTURE: ("capture", ("unit", "x", "y", "owner"), ()),
+    HAZARD: ("hazard", ("unit", "x", "y", "damage", "health"), ()),
+    DEATH: ("death", ("unit", "x", "y", "owner"), ()),
+    SPAWN: ("spawn", ("unit", "x", "y", "owner"), ()),
+    DECISION: ("decision", ("state_x", "state_y", "action", "greedy"), ()),
+    Q_UPDATE: ("q_update", ("state_x", "state_y", "action"), ("reward", "value")),
+    TURN: ("turn", ("player", "resources"), ()),
+    INCOME: ("income", ("player", "amount"), ()),
+    SEARCH: ("search", ("unit", "depth", "nodes", "nodes_per_sec"), ("ms", "score")),
+}
+OWNER_FIELDS = ("owner", "player")  # Integer fields holding owner codes
+
+INT_FIELDS = 5
+FLOAT_FIELDS = 2
+RECORD = np.dtype([("kind", "<u2"), ("turn", "<u4"), ("ints", "<i4", INT_FIELDS), ("floats", "<f4", FLOAT_FIELDS)])
+
+MAGIC = b"NDTR"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHH")
+
+def event_dict(record):
+    """One trace record as a dict of named fields."""
+    kind = int(record["kind"])
+    name, int_names, float_names = EVENT_TYPES[kind]
+    event = {"event": name, "turn": int(record["turn"])}
+    for field, value in zip(int_names, record["ints"].tolist()):
+        event[field] = OWNER_NAMES[value] if field in OWNER_FIELDS else value
+    for field, value in zip(float_names, record["floats"].tolist()):
+        event[field] = value
+    return event
+
+def format_event(record):
+    """One trace record as a line of text for the console."""
+    event = event_dict(record)
+    fields = " ".join(f"{key}={value}" for key, value in event.items() if key not in ("event", "turn"))
+    return f"[turn {event['turn']}] {event['event']} {fields}"
+
+class Tracer:
+    """Ring buffer of the most recent events, with optional streaming to a file or the console."""
+    def __init__(self, capacity=65536):
+        self.enabled = 0  # Bitmask of the event kinds being recorded
+        self.echo = False  # Also print each recorded event
+        self.turn = 0  # Stamped on every event
+        self.buffer = np.zeros(capacity, dtype=RECORD)
+        self.count = 0  # Events recorded since the last clear
+        self._stream = None
+        self._stream_is_json = False
+        self._flushed = 0  # Events already written to the stream
+
+    def enable(self, kinds=ALL):
+        self.enabled |= kinds
+
+    def disable(self, kinds=ALL):
+        self.enabled &= ~kinds
+
+    def clear(self):
+        self.flush()
+        self.count = 0
+        self._flushed = 0
+
+    def emit(self, kind, *values):
+        """Record an event: its integer fields, then its float fields, in EVENT_TYPES order."""
+        int_count = len(EVENT_TYPES[kind][1])
+        ints = values[:int_count] + (0,) * (INT_FIELDS - int_count)
+        floats = values[int_count:] + (0.0,) * (FLOAT_FIELDS - len(values) + int_count)
+        capacity = len(self.buffer)
+        if self._stream is not None and self.count - self._flushed == capacity:
+            # The oldest unwritten event is about to be overwritten
+            self.flush()
+        record = self.buffer[self.count % capacity]
+        record["kind"] = kind
+        record["turn"] = self.turn
+        record["ints"] = ints
+        record["floats"] = floats
+        self.count += 1
+        if self.echo:
+            print(format_event(record))
+
+    def events(self):
+        """The buffered events, oldest first, as a structured array."""
+        capacity = len(self.buffer)
+        if self.count <= capacity:
+            return self.buffer[:self.count].copy()
+        start = self.count % capacity
+        return np.concatenate([self.buffer[start:], self.buffer[:start]])
+
+    def stream(self, path):
+        """Write every event recorded from now on to path, as JSONL if it ends in .jsonl."""
+        self.close()
+        self._stream_is_json = path.endswith(".jsonl")
+        if self._stream_is_json:
+            self._stream = open(path, "w")
+        else:
+            self._stream = open(path, "wb")
+            self._stream.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD.itemsize))
+        self._flushed = self.count
+
+    def flush(self):
+        """Write events recorded since the last flush to the stream."""
+        if self._stream is None or self._flushed == self.count:
+            return
+        capacity = len(self.buffer)
+        # Pending events occupy at most two runs of the ring
+        start = self._flushed % capacity
+        pending = self.count - self._flushed
+        runs = [self.buffer[start:start + pending]]
+        if start + pending > capacity:
+            runs.append(self.buffer[:start + pending - capacity])
+        for run in runs:
+            if self._stream_is_json:
+                self._stream.writelines(json.dumps(event_dict(record)) + "\n" for record in run)
+            else:
+                self._stream.write(run.tobytes())
+        self._flushed = self.count
+
+    def close(self):
+        """Flush and close the stream, if one is open."""
+        if self._stream is None:
+            return
+        self.flush()
+        self._stream.close()
+        self._stream = None
+
+def read_trace(path):
+    """Load a binary trace file as a structured array of RECORD."""
+    with open(path, "rb") as f:
+        raw = f.read(HEADER.size)
+    if len(raw) < HEADER.size:
+        raise ValueError(f"{path} is too short to be a trace")
+    magic, version, record_size = HEADER.unpack(raw)
+    if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD.itemsize:
+        raise ValueError(f"{path} is not a version {FORMAT_VERSION} trace")
+    return np.fromfile(path, dtype=RECORD, offset=HEADER.size)
+
+# Shared by all game code in the process
+tracer = Tracer()
+
+def main():
+    """Print how many of each event a binary trace file holds: python -m game.trace FILE"""
+    records = read_trace(sys.argv[1])
+    kinds, counts = np.unique(records["kind"], return_counts=True)
+    print(f"{len(records)} events over {int(records['turn'].max()) if len(records) else 0} turns")
+    for kind, count in zip(kinds.tolist(), counts.tolist()):
+        print(f"  {EVENT_TYPES[kind][0]}: {count}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Offline self-play training for QLearningAI.
+
+Worker processes play headless matches with a local copy of the Q-table. After
+every round the parent merges the workers' tables, weighting each state/action
+by how often it was updated, and sends the merged table back out.
+
+Run with: python -m game.training --rounds 20 --workers 4
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import random
+import time
+import numpy as np
+from game.ai import QLearningAI
+from game.checkpoint import write_table
+from game.engine import GameEngine
+from game.recording import Recorder
+
+def _self_play(job):
+    """Play a batch of self-play matches and return the locally updated table."""
+    q_table, num_episodes, seed, grid_size, max_rounds, record_dir = job
+    random.seed(seed)
+    np.random.seed(seed)
+
+    ai = QLearningAI(grid_size)
+    ai.q_table.values[:] = q_table
+    # The player side shares the table; its states point the other way, at the AI base
+    rival = QLearningAI(grid_size)
+    rival.q_table = ai.q_table
+    rival.visits = ai.visits
+
+    winners = []
+    rounds = []
+    for episode in range(num_episodes):
+        ai.last_state = ai.last_action = None
+        rival.last_state = rival.last_action = None
+        engine = GameEngine(grid_size, ai=ai)
+        recorder = None
+        if record_dir is not None:
+            recorder = Recorder(os.path.join(record_dir, f"match-{seed}-{episode}.rec"), engine)
+        winners.append(engine.play_match(
+            lambda engine: engine.play_rl_side("player", rival, engine.ai_base), max_rounds))
+        if recorder is not None:
+            recorder.close()
+        rounds.append(engine.game_state.current_turn // 2)
+    return ai.q_table.values, ai.visits.values, winners, rounds
+
+def merge_q_tables(q_table, worker_tables):
+    """Visit-weighted average of (q_values, visits) array pairs from workers.
+
+    State/actions no worker updated keep their value from q_table. Returns the
+    merged values and the summed visit counts.
+    """
+    weighted = np.zeros_like(q_table)
+    totals = np.zeros_like(q_table)
+    for worker_q, worker_visits in worker_tables:
+        weighted += worker_visits * worker_q
+        totals += worker_visits
+    merged = np.where(totals > 0, weighted / np.maximum(totals, 1), q_table)
+    return merged, totals
+
+def train(rounds=20, workers=None, episodes_per_worker=25, grid_size=10, max_rounds=200, seed=0, record_dir=None):
+    """Run parallel self-play training.
+
+    With record_dir, every match is recorded there for replaying later.
+    Returns a QLearningAI holding the merged table and a list with one dict of
+    statistics per round (the convergence curve).
+    """
+    workers = workers or os.cpu_count() or 1
+    if record_dir is not None:
+        os.makedirs(record_dir, exist_ok=True)
+    ai = QLearningAI(grid_size)
+    q_table = ai.q_table.values.copy()
+    visits = np.zeros_like(q_table)
+    curve = []
+    started = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        for round_index in range(rounds):
+            round_start = time.perf_counter()
+            jobs = [(q_table, episodes_per_worker, seed + round_index * workers + worker, grid_size, max_rounds,
+                     record_dir) for worker in range(workers)]
+            results = pool.map(_self_play, jobs)
+
+            merged, round_visits = merge_q_tables(q_table, [(q, v) for q, v, _, _ in results])
+            # Largest change of any Q-value this round, a simple convergence measure
+            change = np.abs(merged - q_table).max()
+            q_table = merged
+            visits += round_visits
+
+            winners = [winner for _, _, batch, _ in results for winner in batch]
+            rounds_played = [count for _, _, _, batch in results for count in batch]
+            elapsed = time.perf_counter() - round_start
+            stats = {
+                "round": round_index + 1,
+                "episodes": len(winners),
+                "episodes_per_sec": len(winners) / elapsed,
+                "ai_win_rate": winners.count("AI") / len(winners),
+                "player_win_rate": winners.count("Player") / len(winners),
+                "mean_match_rounds": float(np.mean(rounds_played)),
+                "states": int(np.count_nonzero(visits.sum(axis=1))),
+                "max_q_change": float(change),
+            }
+            curve.append(stats)
+            print(f"Round {stats['round']}/{rounds}: {stats['episodes_per_sec']:.1f} episodes/sec, "
+                  f"AI wins {stats['ai_win_rate']:.0%}, {stats['states']} states, "
+                  f"max Q change {stats['max_q_change']:.3f}")
+
+    total_episodes = sum(stats["episodes"] for stats in curve)
+    print(f"Trained on {total_episodes} episodes in {time.perf_counter() - started:.1f}s")
+
+    ai.q_table.values[:] = q_table
+    ai.visits.values[:] = visits
+    return ai, curve
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the Q-learning AI with parallel self-play.")
+    parser.add_argument("--rounds", type=int, default=20, help="merge/broadcast rounds")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--episodes", type=int, default=25, help="episodes per worker per round")
+    parser.add_argument("--grid-size", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=200, help="rounds before a match is a draw")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--curve", help="write the convergence curve to this CSV file")
+    parser.add_argument("--output", help="save the trained table as DIR/ai.qtable, e.g. checkpoints")
+    parser.add_argument("--record", metavar="DIR", help="record every match to DIR for python -m game.recording")
+    args = parser.parse_args()
+
+    ai, curve = train(args.rounds, args.workers, args.episodes, args.grid_size, args.max_rounds, args.seed,
+                      args.record)
+    if args.curve:
+        with open(args.curve, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(curve[0]))
+            writer.writeheader()
+            writer.writerows(curve)
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        path = os.path.join(args.output, "ai.qtable")
+        write_table(path, ai.q_table.values, ai.STATE_ENCODING, (args.grid_size, args.grid_size))
+        print(f"Saved Q-table to {path}")
+
+if __name__ == "__main__":
+    main()
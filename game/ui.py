@@ -1,28 +1,38 @@
+import collections
 import pygame
 
+TEXT_CACHE_SIZE = 256  # Rendered strings kept by UI.render_text
+
 class UI:
-    def __init__(self, screen, grid, game_state):
+    def __init__(self, screen, grid, game_state, camera):
         self.screen = screen
         self.grid = grid
         self.game_state = game_state
+        self.camera = camera
         self.font = pygame.font.Font(None, 24)
         self.small_font = pygame.font.Font(None, 20)
         self.selected_cell = None
         
-        # Calculate UI regions
-        self.grid_width = grid.width * grid.cell_size
-        self.grid_height = grid.height * grid.cell_size
+        # Calculate UI regions; the map viewport is at the top left
+        self.grid_width = camera.viewport_width
+        self.grid_height = camera.viewport_height
         self.sidebar_width = 250  # Width for the right sidebar
         self.bottom_height = 100  # Height for the bottom info bar
         
+        # Rendered text and the composited UI panel, rebuilt only when what they show changes
+        self._text_cache = collections.OrderedDict()
+        self._panel = None
+        self._panel_key = None
+        
     def handle_event(self, event):
-        if event.type == pygame.MOUSEBUTTONDOWN:
+        # Buttons 4 and 5 are the mouse wheel, which zooms the camera
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button not in (4, 5):
             x, y = event.pos
-            grid_x = x // self.grid.cell_size
-            grid_y = y // self.grid.cell_size
+            cell = self.camera.screen_to_cell(x, y)
             
             # Check if click is within grid
-            if 0 <= grid_x < self.grid.width and 0 <= grid_y < self.grid.height:
+            if cell is not None:
+                grid_x, grid_y = cell
                 clicked_unit = self.grid.get_unit_at(grid_x, grid_y)
                 
                 # If a unit is selected
@@ -31,7 +41,7 @@ class UI:
                     # Check if unit has already moved and attacked
                     if unit.has_moved and unit.has_attacked:
                         print("This unit has already moved and attacked this turn! Deselecting.")
-                        self.grid.valid_moves = []
+                        self.grid.valid_moves = set()
                         self.game_state.selected_unit = None
                         return
                         
@@ -43,7 +53,7 @@ class UI:
                             if unit.has_moved and unit.has_attacked:
                                 print("Deselecting after move+attack.")
                                 self.game_state.selected_unit = None
-                                self.grid.valid_moves = []
+                                self.grid.valid_moves = set()
                             else:
                                 print("Unit can still act, recalculating valid moves.")
                                 self.grid.calculate_valid_moves(unit)
@@ -57,7 +67,7 @@ class UI:
                             if unit.has_moved and unit.has_attacked:
                                 print("Deselecting after attack+move.")
                                 self.game_state.selected_unit = None
-                                self.grid.valid_moves = []
+                                self.grid.valid_moves = set()
                             else:
                                 print("Unit can still act, recalculating valid moves.")
                                 self.grid.calculate_valid_moves(unit)
@@ -87,7 +97,7 @@ class UI:
                     # Deselect if clicking empty cell
                     print("Deselected unit.")
                     self.game_state.selected_unit = None
-                    self.grid.valid_moves = []
+                    self.grid.valid_moves = set()
             
             # Check if end turn button was clicked
             end_turn_rect = pygame.Rect(
@@ -98,20 +108,44 @@ class UI:
             if end_turn_rect.collidepoint(x, y):
                 if self.game_state.current_player == "player":
                     # Reset all units' turn flags
-                    for unit in self.grid.units:
-                        unit.reset_turn()
+                    self.grid.reset_turn_flags()
                     self.game_state.next_turn()
-                    self.grid.valid_moves = []
+                    self.grid.valid_moves = set()
                     self.game_state.selected_unit = None
                     print("Player ended turn. AI's turn now.")
     
+    def render_text(self, font, text, color):
+        """font.render with an LRU cache, since rasterizing text is one of pygame's slowest calls."""
+        key = (font, text, color)
+        surface = self._text_cache.get(key)
+        if surface is None:
+            surface = font.render(text, True, color)
+            self._text_cache[key] = surface
+            if len(self._text_cache) > TEXT_CACHE_SIZE:
+                self._text_cache.popitem(last=False)
+        else:
+            self._text_cache.move_to_end(key)
+        return surface
+    
     def draw(self):
+        # Recomposite the UI only when the game state or selected unit changed
+        key = self.state_key()
+        if self._panel is None:
+            self._panel = pygame.Surface(self.screen.get_size(), pygame.SRCALPHA)
+            self._panel_key = None
+        if key != self._panel_key:
+            self._panel.fill((0, 0, 0, 0))
+            self.draw_panel(self._panel)
+            self._panel_key = key
+        self.screen.blit(self._panel, (0, 0))
+    
+    def draw_panel(self, surface):
         # Draw UI elements
-        self.draw_resources()
-        self.draw_turn_info()
-        self.draw_selected_unit_info()
-        self.draw_legend()
-        self.draw_instructions()
+        self.draw_resources(surface)
+        self.draw_turn_info(surface)
+        self.draw_selected_unit_info(surface)
+        self.draw_legend(surface)
+        self.draw_instructions(surface)
         
         # Draw end turn button
         if self.game_state.current_player == "player":
@@ -120,44 +154,64 @@ class UI:
                 self.screen.get_height() - 40,
                 100, 30
             )
-            pygame.draw.rect(self.screen, (0, 255, 0), end_turn_rect)  # Green button
-            text_surface = self.font.render("End Turn", True, (0, 0, 0))
+            pygame.draw.rect(surface, (0, 255, 0), end_turn_rect)  # Green button
+            text_surface = self.render_text(self.font, "End Turn", (0, 0, 0))
             text_rect = text_surface.get_rect(center=end_turn_rect.center)
-            self.screen.blit(text_surface, text_rect)
+            surface.blit(text_surface, text_rect)
         
         # Draw selection indicator
         if self.selected_cell:
             x, y = self.selected_cell
-            rect = pygame.Rect(x * self.grid.cell_size, y * self.grid.cell_size,
-                             self.grid.cell_size, self.grid.cell_size)
-            pygame.draw.rect(self.screen, (255, 255, 0), rect, 3)  # Yellow border for selected unit
+            size = self.camera.cell_size
+            rect = pygame.Rect(self.camera.cell_to_screen(x, y), (size, size))
+            if self.camera.overlaps_view(rect):
+                # A cell partly in view is drawn cut off at the viewport's edge
+                surface.set_clip(pygame.Rect(0, 0, self.camera.viewport_width, self.camera.viewport_height))
+                pygame.draw.rect(surface, (255, 255, 0), rect, 3)  # Yellow border for selected unit
+                surface.set_clip(None)
+    
+    def state_key(self):
+        """Everything the sidebar and info bar show; the screen needs a full redraw when it changes."""
+        state = self.game_state
+        unit = state.selected_unit
+        unit_key = None
+        if unit:
+            unit_key = (id(unit), unit.health, unit.max_health, unit.has_moved, unit.has_attacked)
+        return (state.player_resources, state.ai_resources, state.current_turn, state.current_player,
+                unit_key, self.selected_cell, self.camera.version)
     
-    def draw_resources(self):
+    def draw_resources(self, surface=None):
+        if surface is None:
+            surface = self.screen
         # Draw player resources
         player_text = f"Player Resources: {self.game_state.player_resources}"
-        text_surface = self.font.render(player_text, True, (0, 255, 0))
-        self.screen.blit(text_surface, (10, self.grid_height + 10))
+        text_surface = self.render_text(self.font, player_text, (0, 255, 0))
+        surface.blit(text_surface, (10, self.grid_height + 10))
         
         # Draw AI resources
         ai_text = f"AI Resources: {self.game_state.ai_resources}"
-        text_surface = self.font.render(ai_text, True, (255, 0, 0))
-        self.screen.blit(text_surface, (10, self.grid_height + 40))
+        text_surface = self.render_text(self.font, ai_text, (255, 0, 0))
+        surface.blit(text_surface, (10, self.grid_height + 40))
     
-    def draw_turn_info(self):
+    def draw_turn_info(self, surface=None):
+        if surface is None:
+            surface = self.screen
         turn_text = f"Turn: {self.game_state.current_turn} - {self.game_state.current_player.capitalize()}'s Turn"
-        text_surface = self.font.render(turn_text, True, (255, 255, 255))
+        text_surface = self.render_text(self.font, turn_text, (255, 255, 255))
         text_rect = text_surface.get_rect(center=(self.grid_width // 2, 20))
-        self.screen.blit(text_surface, text_rect)
+        surface.blit(text_surface, text_rect)
     
-    def draw_selected_unit_info(self):
+    def draw_selected_unit_info(self, surface=None):
+        if surface is None:
+            surface = self.screen
         if self.game_state.selected_unit:
             unit = self.game_state.selected_unit
             y_offset = 50
             
             # Draw unit type and health
             text = f"{unit.__class__.__name__} - Health: {unit.health}/{unit.max_health}"
-            text_surface = self.font.render(text, True, (255, 255, 255))
-            self.screen.blit(text_surface, (self.screen.get_width() - self.sidebar_width + 10, y_offset))
+            text_surface = self.render_text(self.font, text, (255, 255, 255))
+            surface.blit(text_surface, (self.screen.get_width() - self.sidebar_width + 10, y_offset))
             y_offset += 30
             
             # Draw stats
@@ -168,8 +222,8 @@ class UI:
                 f"Attack Range: {unit.attack_range}"
             ]
             for stat in stats:
-                text_surface = self.font.render(stat, True, (255, 255, 255))
-                self.screen.blit(text_surface, (self.screen.get_width() - self.sidebar_width + 10, y_offset))
+                text_surface = self.render_text(self.font, stat, (255, 255, 255))
+                surface.blit(text_surface, (self.screen.get_width() - self.sidebar_width + 10, y_offset))
                 y_offset += 20
             
             # Draw turn status
@@ -181,22 +235,24 @@ class UI:
                 status.append("Attacked")
             if status:
                 text = f"Status: {', '.join(status)}"
-                text_surface = self.font.render(text, True, (255, 200, 0))
-                self.screen.blit(text_surface, (self.screen.get_width() - self.sidebar_width + 10, y_offset))
+                text_surface = self.render_text(self.font, text, (255, 200, 0))
+                surface.blit(text_surface, (self.screen.get_width() - self.sidebar_width + 10, y_offset))
                 y_offset += 30
             
             # Draw abilities
             if unit.abilities:
                 y_offset += 10
-                text_surface = self.font.render("Abilities:", True, (255, 255, 255))
-                self.screen.blit(text_surface, (self.screen.get_width() - self.sidebar_width + 10, y_offset))
+                text_surface = self.render_text(self.font, "Abilities:", (255, 255, 255))
+                surface.blit(text_surface, (self.screen.get_width() - self.sidebar_width + 10, y_offset))
                 y_offset += 20
                 for ability in unit.abilities:
-                    text_surface = self.font.render(f"- {ability}", True, (255, 255, 255))
-                    self.screen.blit(text_surface, (self.screen.get_width() - self.sidebar_width + 20, y_offset))
+                    text_surface = self.render_text(self.font, f"- {ability}", (255, 255, 255))
+                    surface.blit(text_surface, (self.screen.get_width() - self.sidebar_width + 20, y_offset))
                     y_offset += 20
     
-    def draw_legend(self):
+    def draw_legend(self, surface=None):
+        if surface is None:
+            surface = self.screen
         legend_text = [
             "Unit Legend:",
             "▲ Corvette (Fast Scout)",
@@ -214,10 +270,12 @@ class UI:
         
         # Draw in the right sidebar below unit info
         for i, text in enumerate(legend_text):
-            text_surface = self.small_font.render(text, True, (255, 255, 255))
-            self.screen.blit(text_surface, (self.grid_width + 10, 200 + i * 20))
+            text_surface = self.render_text(self.small_font, text, (255, 255, 255))
+            surface.blit(text_surface, (self.grid_width + 10, 200 + i * 20))
     
-    def draw_instructions(self):
+    def draw_instructions(self, surface=None):
+        if surface is None:
+            surface = self.screen
         instructions = [
             "How to Play:",
             "1. Click on your unit to select it",
@@ -236,5 +294,5 @@ class UI:
         
         # Draw instructions in the right sidebar
         for i, text in enumerate(instructions):
-            text_surface = self.small_font.render(text, True, (200, 200, 200))
-            self.screen.blit(text_surface, (self.grid_width + 10, 350 + i * 20)) 
\ No newline at end of file
+            text_surface = self.render_text(self.small_font, text, (200, 200, 200))
+            surface.blit(text_surface, (self.grid_width + 10, 350 + i * 20)) 
\ No newline at end of file
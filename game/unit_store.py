@@ -0,0 +1,229 @@
+import numpy as np
+
+# Owner codes, shared with the grid's owner layer
+OWNER_CODES = {None: 0, "player": 1, "ai": 2}
+OWNER_NAMES = {code: owner for owner, code in OWNER_CODES.items()}
+
+# Bits of the flags component
+MOVED = 1
+ATTACKED = 2
+
+# Component name -> dtype of its column
+COMPONENTS = {
+    "x": np.int32,
+    "y": np.int32,
+    "owner": np.int8,
+    "health": np.int32,
+    "max_health": np.int32,
+    "attack_power": np.int32,
+    "defense": np.int32,
+    "movement_range": np.int32,
+    "attack_range": np.int32,
+    "flags": np.uint8,
+}
+
+class UnitStore:
+    """The units on a grid, kept as parallel component arrays with one row per unit.
+
+    Every unit gets a stable integer id when added. Rows stay packed: removing
+    a unit moves the last row into its place, so removal is O(1) and
+    whole-army operations are single writes over the first len(store) rows.
+    Unit objects are thin views that read and write their row.
+    """
+    def __init__(self, capacity=16):
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in COMPONENTS.items()}
+        self.views = []  # row -> Unit
+        self.rows = []  # unit id -> row, None once the unit has been removed
+        self._by_owner = {owner: {} for owner in OWNER_CODES if owner is not None}  # owner -> {unit: None}
+        self.owner_listeners = []  # Called with (unit, old owner) after an attached unit changes hands
+
+    def __len__(self):
+        return len(self.views)
+
+    def __iter__(self):
+        return iter(self.views)
+
+    def __contains__(self, unit):
+        return unit._store is self
+
+    def get(self, unit_id):
+        """The attached unit with this id, or None if it has been removed."""
+        row = self.rows[unit_id]
+        return None if row is None else self.views[row]
+
+    def column(self, name):
+        """The live rows of one component array."""
+        return self.columns[name][:len(self.views)]
+
+    def _grow(self):
+        """Double the capacity of every column."""
+        for name, column in self.columns.items():
+            self.columns[name] = np.concatenate([column, np.zeros_like(column)])
+
+    def add(self, unit):
+        """Copy a detached unit into a new row and attach it to the store. Returns its id."""
+        row = len(self.views)
+        if row == len(self.columns["x"]):
+            self._grow()
+        for name, column in self.columns.items():
+            column[row] = unit._values[name]
+        unit.unit_id = len(self.rows)
+        self.rows.append(row)
+        self.views.append(unit)
+        self._by_owner[unit.owner][unit] = None
+        unit._store = self
+        return unit.unit_id
+
+    def remove(self, unit):
+        """Detach a unit, moving the last row into its place."""
+        row = self.rows[unit.unit_id]
+        last = len(self.views) - 1
+        # The unit keeps its final values, so it still answers after leaving the store
+        unit._values = {name: column[row].item() for name, column in self.columns.items()}
+        if row != last:
+            for column in self.columns.values():
+                column[row] = column[last]
+            moved = self.views[last]
+            self.views[row] = moved
+            self.rows[moved.unit_id] = row
+        self.views.pop()
+        self.rows[unit.unit_id] = None
+        unit._store = None
+        del self._by_owner[unit.owner][unit]
+
+    def owner_position(self, unit):
+        """Where a unit comes in owned_by(unit.owner)."""
+        return list(self._by_owner[unit.owner]).index(unit)
+
+    def reinsert(self, unit, row, owner_position):
+        """Undo remove(): put a removed unit back in its old row and per-owner position, with its old id."""
+        last = len(self.views)
+        if last == len(self.columns["x"]):
+            self._grow()
+        if row == last:
+            self.views.append(unit)
+        else:
+            # The unit that took over the row goes back to the end
+            moved = self.views[row]
+            for column in self.columns.values():
+                column[last] = column[row]
+            self.views.append(moved)
+            self.rows[moved.unit_id] = last
+            self.views[row] = unit
+        for name, column in self.columns.items():
+            column[row] = unit._values[name]
+        self.rows[unit.unit_id] = row
+        unit._store = self
+        owned = list(self._by_owner[unit.owner])
+        owned.insert(owner_position, unit)
+        self._by_owner[unit.owner] = dict.fromkeys(owned)
+
+    def state(self):
+        """Everything restore needs: (units by row, copies of the live rows of each column,
+        ids issued so far, units in per-owner order)."""
+        count = len(self.views)
+        columns = {name: column[:count].copy() for name, column in self.columns.items()}
+        owner_order = [unit for units in self._by_owner.values() for unit in units]
+        return list(self.views), columns, len(self.rows), owner_order
+
+    def restore(self, units, columns, ids_issued, owner_order):
+        """Put the store back in a state returned by state(). Units not in it are detached."""
+        kept = set(units)
+        for unit in self.views:
+            if unit not in kept:
+                row = self.rows[unit.unit_id]
+                unit._values = {name: column[row].item() for name, column in self.columns.items()}
+                unit._store = None
+        count = len(units)
+        capacity = len(self.columns["x"])
+        while capacity < count:
+            capacity *= 2
+        for name, column in self.columns.items():
+            if len(column) < capacity:
+                column = self.columns[name] = np.zeros(capacity, dtype=column.dtype)
+            column[:count] = columns[name]
+        self.views = list(units)
+        self.rows = [None] * ids_issued
+        for row, unit in enumerate(units):
+            self.rows[unit.unit_id] = row
+            unit._store = self
+        self._by_owner = {owner: {} for owner in self._by_owner}
+        for unit in owner_order:
+            self._by_owner[unit.owner][unit] = None
+
+    def set_owner(self, unit, owner):
+        """Hand an attached unit to another owner, keeping the per-owner views and owner_listeners in step."""
+        old_owner = unit.owner
+        del self._by_owner[old_owner][unit]
+        self.columns["owner"][self.rows[unit.unit_id]] = OWNER_CODES[owner]
+        self._by_owner[owner][unit] = None
+        for listener in self.owner_listeners:
+            listener(unit, old_owner)
+
+    def owned_by(self, owner):
+        """One owner's units, in the order they were added."""
+        return list(self._by_owner[owner])
+
+    def reset_turn(self, owner=None):
+        """Clear the turn flags of every unit, or of one owner's units."""
+        flags = self.column("flags")
+        if owner is None:
+            flags[:] = 0
+        else:
+            flags[self.column("owner") == OWNER_CODES[owner]] = 0
+
+    def dead_units(self):
+        """Units whose health has dropped to zero."""
+        return [self.views[row] for row in np.flatnonzero(self.column("health") <= 0)]
+
+class Component:
+    """Unit attribute kept in a UnitStore column, or on the unit itself while it isn't in a store."""
+    def __init__(self, name=None):
+        self.name = name
+
+    def __set_name__(self, cls, name):
+        if self.name is None:
+            self.name = name
+
+    def __get__(self, unit, cls=None):
+        if unit is None:
+            return self
+        store = unit._store
+        if store is None:
+            return unit._values[self.name]
+        return store.columns[self.name][store.rows[unit.unit_id]].item()
+
+    def __set__(self, unit, value):
+        store = unit._store
+        if store is None:
+            unit._values[self.name] = value
+        else:
+            store.columns[self.name][store.rows[unit.unit_id]] = value
+
+class OwnerComponent(Component):
+    """The owner component, stored as an owner code."""
+    def __get__(self, unit, cls=None):
+        if unit is None:
+            return self
+        return OWNER_NAMES[super().__get__(unit, cls)]
+
+    def __set__(self, unit, value):
+        if unit._store is None:
+            unit._values[self.name] = OWNER_CODES[value]
+        else:
+            unit._store.set_owner(unit, value)
+
+class Flag:
+    """Boolean unit attribute kept as one bit of the flags component."""
+    def __init__(self, bit):
+        self.bit = bit
+        self.flags = Component("flags")
+
+    def __get__(self, unit, cls=None):
+        if unit is None:
+            return self
+        return bool(self.flags.__get__(unit) & self.bit)
+
+    def __set__(self, unit, value):
+        flags = self.flags.__get__(unit)
+        self.flags.__set__(unit, flags | self.bit if value else flags & ~self.bit)
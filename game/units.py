@@ -1,84 +1,153 @@
-import pygame
+from game.trace import ATTACK, tracer
+from game.unit_store import ATTACKED, COMPONENTS, MOVED, Component, Flag, OwnerComponent
 
 class Unit:
+    """A unit on the map, as a view of its row in the grid's UnitStore.
+
+    Until it is added to a grid (and again once removed) the unit keeps its
+    component values itself, so it can be built and inspected anywhere.
+    """
+    # Stat template copied into every new unit; subclasses override it
+    stats = {
+        "movement_range": 1,
+        "attack_power": 1,
+        "defense": 1,
+        "max_health": 100,
+        "attack_range": 1,  # Range for attacking other units
+    }
+    abilities = []  # List of special abilities
+
+    x = Component()
+    y = Component()
+    owner = OwnerComponent()  # "player" or "ai"
+    health = Component()
+    max_health = Component()
+    attack_power = Component()
+    defense = Component()
+    movement_range = Component()
+    attack_range = Component()
+    has_moved = Flag(MOVED)  # Track if unit has moved this turn
+    has_attacked = Flag(ATTACKED)  # Track if unit has attacked this turn
+
+    # Base colors for player units
+    colors = {
+        "player": {
+            "Corvette": (0, 255, 255),    # Cyan
+            "Mech": (0, 255, 0),          # Green
+            "Dreadnought": (255, 165, 0),  # Orange
+            "Drone": (255, 255, 0)        # Yellow
+        },
+        "ai": {
+            "Corvette": (255, 0, 255),    # Magenta
+            "Mech": (255, 0, 0),          # Red
+            "Dreadnought": (255, 69, 0),   # Red-Orange
+            "Drone": (255, 140, 0)        # Dark Orange
+        }
+    }
+    # Drawing assets shared by all units, created on first use so the rules run without pygame
+    _font = None
+    _sprites = None  # SpriteAtlas of bodies and health bar strips
+    HEALTH_BAR_HEIGHT = 5
+    HEALTH_BAR_OFFSET = 10  # Pixels between the top of the health bar and the top of the cell
+
     def __init__(self, x, y, owner):
+        self._store = None  # UnitStore holding the unit's components, once it is on a grid
+        self.unit_id = None
+        self._values = dict.fromkeys(COMPONENTS, 0)
         self.x = x
         self.y = y
-        self.owner = owner  # "player" or "ai"
-        self.movement_range = 1
-        self.attack_power = 1
-        self.defense = 1
-        self.health = 100
-        self.max_health = 100
-        self.attack_range = 1  # Range for attacking other units
-        self.has_attacked = False  # Track if unit has attacked this turn
-        self.has_moved = False    # Track if unit has moved this turn
-        self.abilities = []       # List of special abilities
-        # Base colors for player units
-        self.colors = {
-            "player": {
-                "Corvette": (0, 255, 255),    # Cyan
-                "Mech": (0, 255, 0),          # Green
-                "Dreadnought": (255, 165, 0),  # Orange
-                "Drone": (255, 255, 0)        # Yellow
-            },
-            "ai": {
-                "Corvette": (255, 0, 255),    # Magenta
-                "Mech": (255, 0, 0),          # Red
-                "Dreadnought": (255, 69, 0),   # Red-Orange
-                "Drone": (255, 140, 0)        # Dark Orange
-            }
-        }
-        self.font = pygame.font.Font(None, 20)
+        self.owner = owner
+        for name, value in self.stats.items():
+            setattr(self, name, value)
+        self.health = self.max_health
     
-    def draw(self, screen, cell_size, selected=False):
-        """Draw the unit on the screen."""
-        # Calculate position
-        x = self.x * cell_size
-        y = self.y * cell_size
-        
+    @property
+    def font(self):
+        if Unit._font is None:
+            import pygame
+            Unit._font = pygame.font.Font(None, 20)
+        return Unit._font
+    
+    @staticmethod
+    def sprite_size(cell_size):
+        # The legs reach a little below the cell
+        return (cell_size, cell_size + cell_size // 4)
+    
+    def screen_rect(self, cell_size, position=None, origin=(0, 0)):
+        """Screen area the unit covers when drawn, health bar included."""
+        import pygame
+        cell_x, cell_y = position if position is not None else (self.x, self.y)
+        width, height = self.sprite_size(cell_size)
+        return pygame.Rect(origin[0] + int(cell_x * cell_size),
+                           origin[1] + int(cell_y * cell_size) - self.HEALTH_BAR_OFFSET,
+                           width, height + self.HEALTH_BAR_OFFSET)
+    
+    def render_sprite(self, surface, cell_size):
+        """Draw the unit's body at the top left of surface. Called once per atlas entry."""
+        import pygame
         # Draw unit body (human-like shape)
         color = (0, 255, 0) if self.owner == "player" else (255, 0, 0)
         
         # Draw body (torso)
-        body_rect = pygame.Rect(x + cell_size//4, y + cell_size//4, cell_size//2, cell_size//2)
-        pygame.draw.rect(screen, color, body_rect)
+        body_rect = pygame.Rect(cell_size//4, cell_size//4, cell_size//2, cell_size//2)
+        pygame.draw.rect(surface, color, body_rect)
         
         # Draw head
         head_radius = cell_size//6
-        head_center = (x + cell_size//2, y + cell_size//4)
-        pygame.draw.circle(screen, color, head_center, head_radius)
+        head_center = (cell_size//2, cell_size//4)
+        pygame.draw.circle(surface, color, head_center, head_radius)
         
         # Draw arms
         arm_width = cell_size//8
         arm_height = cell_size//3
         # Left arm
-        left_arm = pygame.Rect(x + cell_size//8, y + cell_size//3, arm_width, arm_height)
-        pygame.draw.rect(screen, color, left_arm)
+        left_arm = pygame.Rect(cell_size//8, cell_size//3, arm_width, arm_height)
+        pygame.draw.rect(surface, color, left_arm)
         # Right arm
-        right_arm = pygame.Rect(x + cell_size - cell_size//8 - arm_width, y + cell_size//3, arm_width, arm_height)
-        pygame.draw.rect(screen, color, right_arm)
+        right_arm = pygame.Rect(cell_size - cell_size//8 - arm_width, cell_size//3, arm_width, arm_height)
+        pygame.draw.rect(surface, color, right_arm)
         
         # Draw legs
         leg_width = cell_size//8
         leg_height = cell_size//3
         # Left leg
-        left_leg = pygame.Rect(x + cell_size//3, y + cell_size//2 + cell_size//4, leg_width, leg_height)
-        pygame.draw.rect(screen, color, left_leg)
+        left_leg = pygame.Rect(cell_size//3, cell_size//2 + cell_size//4, leg_width, leg_height)
+        pygame.draw.rect(surface, color, left_leg)
         # Right leg
-        right_leg = pygame.Rect(x + cell_size - cell_size//3 - leg_width, y + cell_size//2 + cell_size//4, leg_width, leg_height)
-        pygame.draw.rect(screen, color, right_leg)
+        right_leg = pygame.Rect(cell_size - cell_size//3 - leg_width, cell_size//2 + cell_size//4, leg_width, leg_height)
+        pygame.draw.rect(surface, color, right_leg)
+    
+    @staticmethod
+    def render_health_strip(surface, cell_size):
+        """Green then red, each cell_size wide; a cell_size window into it shows any health level."""
+        surface.fill((0, 255, 0), (0, 0, cell_size, Unit.HEALTH_BAR_HEIGHT))  # Green health
+        surface.fill((255, 0, 0), (cell_size, 0, cell_size, Unit.HEALTH_BAR_HEIGHT))  # Red background
+    
+    def draw(self, screen, cell_size, selected=False, position=None, origin=(0, 0)):
+        """Draw the unit on the screen, at position (in cells) if given instead of its own cell.
+
+        origin is where the top left corner of cell (0, 0) is on the screen.
+        """
+        import pygame
+        from game.sprites import SpriteAtlas
+        if Unit._sprites is None:
+            Unit._sprites = SpriteAtlas()
+        # Calculate position
+        cell_x, cell_y = position if position is not None else (self.x, self.y)
+        x = origin[0] + int(cell_x * cell_size)
+        y = origin[1] + int(cell_y * cell_size)
+        
+        # Draw the pre-rendered body
+        atlas, area = Unit._sprites.get((self.__class__.__name__, self.owner, cell_size), self.sprite_size(cell_size),
+                                        lambda surface: self.render_sprite(surface, cell_size))
+        screen.blit(atlas, (x, y), area)
         
         # Draw health bar
-        health_width = cell_size
-        health_height = 5
-        health_x = x
-        health_y = y - 10
-        health_rect = pygame.Rect(health_x, health_y, health_width, health_height)
-        pygame.draw.rect(screen, (255, 0, 0), health_rect)  # Red background
-        current_health_width = int(health_width * (self.health / self.max_health))
-        current_health_rect = pygame.Rect(health_x, health_y, current_health_width, health_height)
-        pygame.draw.rect(screen, (0, 255, 0), current_health_rect)  # Green health
+        atlas, strip = Unit._sprites.get(("health", cell_size), (2 * cell_size, self.HEALTH_BAR_HEIGHT),
+                                         lambda surface: self.render_health_strip(surface, cell_size))
+        current_health_width = int(cell_size * (self.health / self.max_health))
+        window = pygame.Rect(strip.x + cell_size - current_health_width, strip.y, cell_size, self.HEALTH_BAR_HEIGHT)
+        screen.blit(atlas, (x, y - self.HEALTH_BAR_OFFSET), window)
         
         # Draw selection indicator
         if selected:
@@ -104,6 +173,8 @@ class Unit:
         damage = max(1, self.attack_power - target.defense)
         target.health = max(0, target.health - damage)
         self.has_attacked = True
+        if tracer.enabled & ATTACK:
+            tracer.emit(ATTACK, self.unit_id, target.unit_id, damage, target.health)
         return True
     
     def reset_turn(self):
@@ -116,46 +187,42 @@ class Unit:
         return self.health <= 0
 
 class Corvette(Unit):
-    def __init__(self, x, y, owner):
-        super().__init__(x, y, owner)
-        self.movement_range = 3
-        self.attack_power = 2
-        self.defense = 1
-        self.health = 60
-        self.max_health = 60
-        self.attack_range = 1
-        self.abilities = ["Quick Strike"]  # Can attack twice in one turn
+    stats = {
+        "movement_range": 3,
+        "attack_power": 2,
+        "defense": 1,
+        "max_health": 60,
+        "attack_range": 1,
+    }
+    abilities = ["Quick Strike"]  # Can attack twice in one turn
 
 class Mech(Unit):
-    def __init__(self, x, y, owner):
-        super().__init__(x, y, owner)
-        self.movement_range = 2
-        self.attack_power = 3
-        self.defense = 2
-        self.health = 100
-        self.max_health = 100
-        self.attack_range = 1
-        self.abilities = ["Repair"]  # Can heal adjacent friendly units
+    stats = {
+        "movement_range": 2,
+        "attack_power": 3,
+        "defense": 2,
+        "max_health": 100,
+        "attack_range": 1,
+    }
+    abilities = ["Repair"]  # Can heal adjacent friendly units
 
 class Dreadnought(Unit):
-    def __init__(self, x, y, owner):
-        super().__init__(x, y, owner)
-        self.movement_range = 1
-        self.attack_power = 5
-        self.defense = 4
-        self.health = 150
-        self.max_health = 150
-        self.attack_range = 2
-        self.abilities = ["Area Attack"]  # Can attack all units in range
+    stats = {
+        "movement_range": 1,
+        "attack_power": 5,
+        "defense": 4,
+        "max_health": 150,
+        "attack_range": 2,
+    }
+    abilities = ["Area Attack"]  # Can attack all units in range
 
 class Drone(Unit):
-    def __init__(self, x, y, owner):
-        super().__init__(x, y, owner)
-        self.movement_range = 2
-        self.attack_power = 1
-        self.defense = 1
-        self.health = 40
-        self.max_health = 40
-        self.attack_range = 1
-        self.abilities = ["Scout"]  # Can see enemy units from further away
-        self.resource_gathering = 2 
\ No newline at end of file
+    stats = {
+        "movement_range": 2,
+        "attack_power": 1,
+        "defense": 1,
+        "max_health": 40,
+        "attack_range": 1,
+    }
+    abilities = ["Scout"]  # Can see enemy units from further away
+    resource_gathering = 2
@@ -0,0 +1,253 @@
+import numpy as np
+from game.grid import OWNER_CODES
+from game.pathfinding import NEIGHBOURS, UNREACHABLE, distance_field
+from game.units import Corvette
+
+PLAYER = OWNER_CODES["player"]
+AI = OWNER_CODES["ai"]
+
+# Same action encoding as QLearningAI: stay, up, down, left, right
+ACTION_DELTAS = np.array([(0, 0), (0, -1), (0, 1), (-1, 0), (1, 0)], dtype=np.int32)
+
+MINE_DAMAGE = 50  # Matches Hazard.damage
+ROUNDS = 2  # AI rounds per turn, as in GameEngine.rl_side_steps
+
+class BatchedSimulator:
+    """Steps many independent matches at once, stored as stacked NumPy arrays.
+
+    Each game has units_per_side units of unit_class per side. The learner
+    controls the AI units; player units follow a scripted policy like
+    greedy_player_policy. Turns run as in GameEngine.play_round: the player
+    attacks and moves, then every AI unit acts ROUNDS times, attacking at
+    most once a turn, with the win condition checked after each side's turn.
+    Movement, mine damage, resource capture, attack damage and rewards follow
+    the same rules as GameEngine, except that:
+
+    - live obstacles are not simulated;
+    - the scripted player walks downhill on the walking distance to the AI
+      base, which goes around walls but not units, and stops where the next
+      cell is taken, where the engine plans around units with team_paths
+      and falls back to a straight-line move;
+    - a unit attacks the first enemy slot in range rather than the first
+      unit the spatial index returns;
+    - the walking distances used for rewards go around walls but not units.
+    """
+    def __init__(self, num_envs, grid_size=10, units_per_side=1, unit_class=Corvette,
+                 num_obstacles=5, num_hazards=3, num_resources=4, max_steps=200, seed=None):
+        self.num_envs = num_envs
+        self.grid_size = grid_size
+        self.units_per_side = units_per_side
+        self.num_obstacles = num_obstacles
+        self.num_hazards = num_hazards
+        self.num_resources = num_resources
+        self.max_steps = max_steps
+        self.rng = np.random.default_rng(seed)
+
+        self.player_base = (0, 0)
+        self.ai_base = (grid_size - 1, grid_size - 1)
+
+        # Unit slots: the first units_per_side belong to the player, the rest to the AI
+        num_units = 2 * units_per_side
+        template = unit_class(0, 0, "player")
+        self.owner = np.array([PLAYER] * units_per_side + [AI] * units_per_side, dtype=np.int8)
+        self.attack_power = np.full((num_envs, num_units), template.attack_power, dtype=np.int32)
+        self.defense = np.full((num_envs, num_units), template.defense, dtype=np.int32)
+        self.attack_range = np.full(num_units, template.attack_range, dtype=np.int32)
+        self.movement_range = template.movement_range
+        self.max_health = template.max_health
+
+        # Per-game state, filled in by reset()
+        self.positions = np.zeros((num_envs, num_units, 2), dtype=np.int32)  # [..., (x, y)]
+        self.health = np.zeros((num_envs, num_units), dtype=np.int32)
+        self.walls = np.zeros((num_envs, grid_size, grid_size), dtype=bool)  # [env, y, x]
+        self.mines = np.zeros((num_envs, grid_size, grid_size), dtype=bool)
+        self.resources = np.zeros((num_envs, grid_size, grid_size), dtype=bool)
+        self.resource_owner = np.zeros((num_envs, grid_size, grid_size), dtype=np.int8)
+        self.has_attacked = np.zeros((num_envs, num_units), dtype=bool)  # Turn flags, cleared when a turn starts
+        self.round = np.zeros(num_envs, dtype=np.int32)  # AI round the next step plays; 0 starts a turn
+        self.base_distance = np.zeros((num_envs, grid_size, grid_size), dtype=np.int32)  # To the player base
+        self.ai_base_distance = np.zeros((num_envs, grid_size, grid_size), dtype=np.int32)  # For the scripted player
+        self.resource_distance = np.zeros((num_envs, grid_size, grid_size), dtype=np.int32)  # To unowned nodes
+        self.steps = np.zeros(num_envs, dtype=np.int32)
+
+        # Cells map features may use: away from the border and outside both base neighbourhoods
+        ys, xs = np.mgrid[2:grid_size - 2, 2:grid_size - 2]
+        xs, ys = xs.ravel(), ys.ravel()
+        far_from_bases = (xs + ys > 2) & ((grid_size - 1 - xs) + (grid_size - 1 - ys) > 2)
+        self._feature_cells = np.stack([xs[far_from_bases], ys[far_from_bases]], axis=1)
+
+        # Spawn cells next to each base, one diagonal step further out per extra unit
+        self._spawns = np.array(
+            [(1 + i, 1) if i % 2 else (1, 1 + i) for i in range(units_per_side)]
+            + [(grid_size - 2 - i, grid_size - 2) if i % 2 else (grid_size - 2, grid_size - 2 - i)
+               for i in range(units_per_side)], dtype=np.int32)
+
+    @property
+    def alive(self):
+        return self.health > 0
+
+    def reset(self, env_mask=None):
+        """Start new games, for every env or only where env_mask is True. Returns observations."""
+        if env_mask is None:
+            env_mask = np.ones(self.num_envs, dtype=bool)
+        envs = np.flatnonzero(env_mask)
+        if len(envs) == 0:
+            return self.observe()
+
+        # Place all map features at once by sampling cells without replacement
+        counts = (self.num_obstacles, self.num_hazards, self.num_resources)
+        total = min(sum(counts), len(self._feature_cells))
+        order = self.rng.random((len(envs), len(self._feature_cells))).argsort(axis=1)[:, :total]
+        cells = self._feature_cells[order]  # [env, feature, (x, y)]
+        layers = []
+        start = 0
+        for count in counts:
+            layer = np.zeros((len(envs), self.grid_size, self.grid_size), dtype=bool)
+            chosen = cells[:, start:start + count]
+            rows = np.repeat(np.arange(len(envs)), chosen.shape[1])
+            layer[rows, chosen[..., 1].ravel(), chosen[..., 0].ravel()] = True
+            layers.append(layer)
+            start += count
+        self.walls[envs], self.mines[envs], self.resources[envs] = layers
+        self.resource_owner[envs] = 0
+        bases = np.zeros((len(envs), self.grid_size, self.grid_size), dtype=bool)
+        bases[:, self.player_base[1], self.player_base[0]] = True
+        self.base_distance[envs] = distance_field(self.walls[envs], bases)
+        bases[:] = False
+        bases[:, self.ai_base[1], self.ai_base[0]] = True
+        self.ai_base_distance[envs] = distance_field(self.walls[envs], bases)
+        self._update_resource_distance(envs)
+
+        self.positions[envs] = self._spawns
+        self.health[envs] = self.max_health
+        self.has_attacked[envs] = False
+        self.round[envs] = 0
+        self.steps[envs] = 0
+        return self.observe()
+
+    def observe(self):
+        """QLearningAI-style states for every AI unit: (dx, dy) to the player base clamped to [-5, 5]."""
+        ai_positions = self.positions[:, self.owner == AI]
+        delta = np.array(self.player_base, dtype=np.int32) - ai_positions
+        return np.clip(delta, -5, 5)
+
+    def _update_resource_distance(self, envs):
+        unowned = self.resources[envs] & (self.resource_owner[envs] == 0)
+        self.resource_distance[envs] = distance_field(self.walls[envs], unowned)
+
+    def _attack(self, slot, acting):
+        """Let one unit slot attack the first enemy in range, in every env where acting is True and it hasn't attacked."""
+        distance = np.abs(self.positions - self.positions[:, slot:slot + 1]).sum(axis=2)
+        targets = (self.owner != self.owner[slot]) & self.alive & (distance <= self.attack_range[slot])
+        targets &= (acting & ~self.has_attacked[:, slot])[:, None]
+        attacked = targets.any(axis=1)
+        envs = np.flatnonzero(attacked)
+        target = targets[envs].argmax(axis=1)
+        damage = np.maximum(1, self.attack_power[envs, slot] - self.defense[envs, target])
+        self.health[envs, target] = np.maximum(0, self.health[envs, target] - damage)
+        self.has_attacked[envs, slot] = True
+        return attacked
+
+    def _move(self, slot, deltas, moving):
+        """Move one unit slot by deltas in every env where moving is True and the target is free."""
+        target = self.positions[:, slot] + deltas
+        x, y = target[:, 0], target[:, 1]
+        inside = (x >= 0) & (x < self.grid_size) & (y >= 0) & (y < self.grid_size)
+        x, y = np.clip(x, 0, self.grid_size - 1), np.clip(y, 0, self.grid_size - 1)
+        envs = np.arange(self.num_envs)
+        moved = moving & inside & ~self.walls[envs, y, x] & ~self._occupied(x, y) & np.any(deltas != 0, axis=1)
+        self.positions[moved, slot] = target[moved]
+
+        # Mines damage the unit that steps on them, resource nodes change hands
+        hit = moved & self.mines[envs, y, x]
+        self.health[hit, slot] = np.maximum(0, self.health[hit, slot] - MINE_DAMAGE)
+        captured = moved & self.resources[envs, y, x]
+        newly_owned = captured & (self.resource_owner[envs, y, x] == 0)
+        self.resource_owner[captured, y[captured], x[captured]] = self.owner[slot]
+        if newly_owned.any():
+            self._update_resource_distance(np.flatnonzero(newly_owned))
+        return moved, captured
+
+    def _occupied(self, x, y):
+        """Whether cell (x[env], y[env]) holds a live unit, per env."""
+        return ((self.positions[:, :, 0] == x[:, None]) & (self.positions[:, :, 1] == y[:, None])
+                & self.alive).any(axis=1)
+
+    def _player_deltas(self, slot):
+        """Scripted player: walk up to movement_range cells downhill on the distance to the AI base."""
+        envs = np.arange(self.num_envs)
+        position = self.positions[:, slot].copy()
+        for _ in range(self.movement_range):
+            distance = self.ai_base_distance[envs, position[:, 1], position[:, 0]]
+            stepped = np.zeros(self.num_envs, dtype=bool)
+            for dx, dy in NEIGHBOURS:
+                x, y = position[:, 0] + dx, position[:, 1] + dy
+                inside = (x >= 0) & (x < self.grid_size) & (y >= 0) & (y < self.grid_size)
+                x, y = np.clip(x, 0, self.grid_size - 1), np.clip(y, 0, self.grid_size - 1)
+                downhill = inside & (self.ai_base_distance[envs, y, x] == distance - 1) & (distance < UNREACHABLE)
+                take = ~stepped & downhill & ~self.walls[envs, y, x] & ~self._occupied(x, y)
+                position[take] = np.stack([x[take], y[take]], axis=1)
+                stepped |= take
+            if not stepped.any():
+                break
+        return position - self.positions[:, slot]
+
+    def _winners(self):
+        """GameEngine.check_win_condition per env: owner code of the side with a unit on the other's base, or 0."""
+        alive = self.alive
+        at_ai_base = (self.positions == np.array(self.ai_base, dtype=np.int32)).all(axis=2)
+        at_player_base = (self.positions == np.array(self.player_base, dtype=np.int32)).all(axis=2)
+        player_wins = (at_ai_base & alive & (self.owner == PLAYER)).any(axis=1)
+        ai_wins = (at_player_base & alive & (self.owner == AI)).any(axis=1)
+        return np.where(player_wins, PLAYER, np.where(ai_wins, AI, 0)).astype(np.int8)
+
+    def step(self, actions):
+        """Advance every game by one AI round, starting with the player's turn where a turn starts.
+
+        actions has shape (num_envs, units_per_side) with values 0-4, one per
+        AI unit, and each turn takes ROUNDS steps. Returns (observations,
+        rewards, dones, info); finished games are reset automatically and
+        info["winner"] holds their owner code (0 for a draw). Games still
+        running after max_steps steps end in a draw.
+        """
+        actions = np.asarray(actions).reshape(self.num_envs, self.units_per_side)
+        rewards = np.zeros(self.num_envs, dtype=np.float64)
+        envs = np.arange(self.num_envs)
+
+        # A new turn: every unit's turn flags clear, then the player attacks and walks towards the AI base
+        starting = self.round == 0
+        self.has_attacked[starting] = False
+        for slot in np.flatnonzero(self.owner == PLAYER):
+            acting = starting & self.alive[:, slot]
+            self._attack(slot, acting)
+            acting &= self.alive[:, slot]
+            self._move(slot, self._player_deltas(slot), acting)
+        winner = np.where(starting, self._winners(), 0).astype(np.int8)
+
+        # One AI round, shaped the same way as GameEngine.rl_side_steps
+        for index, slot in enumerate(np.flatnonzero(self.owner == AI)):
+            acting = self.alive[:, slot] & (winner == 0)
+            x, y = self.positions[:, slot, 0], self.positions[:, slot, 1]
+            old_distance = self.base_distance[envs, y, x]
+            old_resource_distance = self.resource_distance[envs, y, x]
+            attacked = self._attack(slot, acting)
+            rewards[attacked] += 15
+            moving = acting & ~attacked
+            self._move(slot, ACTION_DELTAS[actions[:, index]], moving)
+            x, y = self.positions[:, slot, 0], self.positions[:, slot, 1]
+            new_distance = self.base_distance[envs, y, x]
+            shaped = np.where(new_distance < old_distance, 4, np.where(new_distance > old_distance, -3, -1))
+            on_resource = self.resources[envs, y, x]
+            closer_to_resource = ~on_resource & (self.resource_distance[envs, y, x] < old_resource_distance)
+            shaped = shaped + 8 * on_resource + closer_to_resource + 3 * ((new_distance >= 2) & (new_distance <= 4))
+            shaped = shaped - 2 * (new_distance <= 1)
+            rewards[moving] += shaped[moving]
+
+        self.steps += 1
+        self.round = (self.round + 1) % ROUNDS
+        ending = (self.round == 0) & (winner == 0)
+        winner[ending] = self._winners()[ending]
+        dones = (winner != 0) | (self.steps >= self.max_steps)
+
+        observations = self.reset(dones)
+        return observations, rewards, dones, {"winner": winner}
@@ -0,0 +1,84 @@
+"""
+Zobrist hashing of game positions, and a transposition table keyed by it.
+
+A position's hash is the XOR of one 64-bit key per feature: each unit (its
+id, cell, health and turn flags), each live obstacle's cell and each
+captured resource node's owner. Changing a feature XORs its old key out and
+its new key in, so the grid keeps its hash up to date in O(1) per change
+and equal positions on the same map have equal hashes.
+
+Keys aren't drawn into tables, which would need one per cell and value:
+zobrist_key folds a feature's fields together and scrambles them with the
+splitmix64 finalizer, giving the same pseudo-random key for the same
+feature in every process.
+"""
+import numpy as np
+
+# Feature kinds, the first field of every key
+UNIT_FEATURE = 1  # (UNIT_FEATURE, unit id, cell, health, turn flags)
+OBSTACLE_FEATURE = 2  # (OBSTACLE_FEATURE, live obstacle entity id, cell)
+RESOURCE_FEATURE = 3  # (RESOURCE_FEATURE, cell, owner code); uncaptured nodes add nothing
+SEARCH_FEATURE = 4  # Search context mixed into a position's hash by a search
+
+MASK = (1 << 64) - 1
+
+# Bound kinds of a stored score
+EXACT = 0
+LOWER = 1  # The score is at least this
+UPPER = 2  # The score is at most this
+
+def zobrist_key(*fields):
+    """Pseudo-random 64-bit key of a feature given as small non-negative ints."""
+    value = 0xCBF29CE484222325
+    for field in fields:
+        value = (value * 0x100000001B3 ^ field) & MASK
+    value = (value ^ value >> 30) * 0xBF58476D1CE4E5B9 & MASK
+    value = (value ^ value >> 27) * 0x94D049BB133111EB & MASK
+    return value ^ value >> 31
+
+# One transposition table slot; depth -1 marks an empty one
+ENTRY = np.dtype([("key", "<u8"), ("depth", "<i2"), ("score", "<i4"), ("bound", "u1"), ("best", "<i2"),
+                  ("generation", "<u2")])
+
+class TranspositionTable:
+    """Search results for positions by hash, in one preallocated array of ENTRY.
+
+    Each hash has one slot, picked by its low bits. A new result takes the
+    slot unless the slot holds a deeper result from the current search, so
+    memory stays flat and old searches give way to new ones.
+    """
+    def __init__(self, size_bits=16):
+        self.mask = (1 << size_bits) - 1
+        self.entries = np.zeros(self.mask + 1, dtype=ENTRY)
+        self.entries["depth"] = -1
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def __len__(self):
+        return int((self.entries["depth"] >= 0).sum())
+
+    def new_search(self):
+        """Start a new search; results of earlier ones become first to be replaced."""
+        self.generation = (self.generation + 1) & 0xFFFF
+
+    def clear(self):
+        self.entries["depth"] = -1
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key):
+        """(depth, score, bound, index of the best action) stored for a hash, or None."""
+        self.probes += 1
+        stored_key, depth, score, bound, best, _ = self.entries[key & self.mask].item()
+        if depth < 0 or stored_key != key:
+            return None
+        self.hits += 1
+        return depth, score, bound, best
+
+    def store(self, key, depth, score, bound, best):
+        slot = key & self.mask
+        _, stored_depth, _, _, _, generation = self.entries[slot].item()
+        if stored_depth > depth and generation == self.generation:
+            return
+        self.entries[slot] = (key, depth, score, bound, best, self.generation)
@@ -1,276 +1,246 @@
+import argparse
+import os
 import pygame
 import sys
-import random
-import collections
-import numpy as np
 import time
-from game.grid import Grid, ResourceNode
-from game.units import Unit, Corvette, Mech, Dreadnought, Drone
-from game.game_state import GameState
+from game.camera import Camera
+from game.checkpoint import CheckpointWriter, load_engine_checkpoint, save_engine_checkpoint
+from game.engine import GameEngine
+from game.profiling import profiler
+from game.recording import Recorder
+from game.renderer import Renderer
+from game.search import SearchAI
+from game.snapshot import load_snapshot, restore_snapshot, save_snapshot, take_snapshot
+from game.trace import GAMEPLAY, tracer
 from game.ui import UI
 
-class QLearningAI:
-    def __init__(self, grid_size):
-        self.q_table = collections.defaultdict(lambda: np.zeros(5))  # 5 actions: stay, up, down, left, right
-        self.grid_size = grid_size
-        self.last_state = None
-        self.last_action = None
-        self.learning_rate = 0.8  # Increased learning rate
-        self.discount_factor = 0.95  # Increased discount factor
-        self.exploration_rate = 0.2  # Balanced exploration rate
-        self.memory = []  # Store recent experiences for better learning
-
-    def get_state(self, unit, player_base):
-        dx = player_base[0] - unit.x
-        dy = player_base[1] - unit.y
-        # Normalize distances to make state space smaller
-        dx = max(min(dx, 5), -5)
-        dy = max(min(dy, 5), -5)
-        return (dx, dy)
-
-    def choose_action(self, state, epsilon=None):
-        if epsilon is None:
-            epsilon = self.exploration_rate
-            
-        if np.random.rand() < epsilon:
-            # Weighted random choice based on Q-values
-            q_values = self.q_table[state]
-            exp_q = np.exp(q_values - np.max(q_values))  # Subtract max for numerical stability
-            probs = exp_q / np.sum(exp_q)
-            action = np.random.choice(5, p=probs)
-            print(f"[AI RL] Weighted random action {action} for state {state}")
-            return action
-            
-        # Get Q-values for current state
-        q_values = self.q_table[state]
-        
-        # Add small random noise to break ties
-        noise = np.random.randn(5) * 0.1
-        q_values = q_values + noise
-        
-        action = np.argmax(q_values)
-        print(f"[AI RL] Greedy action {action} for state {state} with Q-values {self.q_table[state]}")
-        return action
-
-    def move(self, unit, player_base, grid):
-        state = self.get_state(unit, player_base)
-        action = self.choose_action(state)
-        
-        # Calculate potential moves
-        moves = [(0, 0), (0, -1), (0, 1), (-1, 0), (1, 0)]  # stay, up, down, left, right
-        dx, dy = moves[action]
-        
-        new_x, new_y = unit.x + dx, unit.y + dy
-        
-        # Check if move is valid
-        if 0 <= new_x < self.grid_size and 0 <= new_y < self.grid_size:
-            if grid.is_valid_position(new_x, new_y):
-                print(f"[AI RL] Moving from ({unit.x}, {unit.y}) to ({new_x}, {new_y})")
-                unit.x, unit.y = new_x, new_y
-            else:
-                print(f"[AI RL] Tried invalid move from ({unit.x}, {unit.y}) to ({new_x}, {new_y})")
-        else:
-            print(f"[AI RL] Tried move outside grid from ({unit.x}, {unit.y}) to ({new_x}, {new_y})")
-            
-        self.last_state = state
-        self.last_action = action
-        return (unit.x, unit.y)
-
-    def update_q(self, unit, player_base, reward, alpha=None, gamma=None):
-        if self.last_state is None or self.last_action is None:
-            return
-            
-        if alpha is None:
-            alpha = self.learning_rate
-        if gamma is None:
-            gamma = self.discount_factor
-            
-        next_state = self.get_state(unit, player_base)
-        best_next = np.max(self.q_table[next_state])
-        old_value = self.q_table[self.last_state][self.last_action]
-        
-        # Q-learning update with higher learning rate
-        new_value = old_value + alpha * (reward + gamma * best_next - old_value)
-        self.q_table[self.last_state][self.last_action] = new_value
-        
-        # Store experience in memory
-        self.memory.append((self.last_state, self.last_action, reward, next_state))
-        
-        # Update Q-values based on recent experiences
-        if len(self.memory) > 10:
-            for exp_state, exp_action, exp_reward, exp_next_state in self.memory[-10:]:
-                exp_best_next = np.max(self.q_table[exp_next_state])
-                exp_old_value = self.q_table[exp_state][exp_action]
-                self.q_table[exp_state][exp_action] = exp_old_value + alpha * (exp_reward + gamma * exp_best_next - exp_old_value)
-        
-        print(f"[AI RL] Updated Q for state {self.last_state}, action {self.last_action}: {new_value}")
+CHECKPOINT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpoints")
+CHECKPOINT_INTERVAL = 30  # Seconds between background Q-table checkpoints
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+QUICKSAVE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "saves", "quicksave.snap")
+AI_STEP_DURATION = 0.3  # Seconds spent animating each AI unit's action
+MAX_VIEWPORT = (800, 600)  # Largest map area on screen; bigger maps scroll
+PAN_SPEED = 12  # Pixels the camera scrolls per frame while an arrow key is held
 
 class NebulaDominion:
-    def __init__(self):
+    def __init__(self, grid_size=10, cell_size=50, seed=None, record=None, search_ms=None):
         pygame.init()
-        self.grid_size = 10
-        self.cell_size = 50
+        self.grid_size = grid_size
+        self.cell_size = cell_size
         self.sidebar_width = 250
         self.bottom_height = 100
         
-        self.screen_width = self.grid_size * self.cell_size + self.sidebar_width
-        self.screen_height = self.grid_size * self.cell_size + self.bottom_height
+        # The map is shown through a camera; small maps fit the viewport exactly
+        viewport_width = min(self.grid_size * self.cell_size, MAX_VIEWPORT[0])
+        viewport_height = min(self.grid_size * self.cell_size, MAX_VIEWPORT[1])
+        self.camera = Camera(viewport_width, viewport_height, self.grid_size, self.grid_size, self.cell_size)
+        self.screen_width = viewport_width + self.sidebar_width
+        self.screen_height = viewport_height + self.bottom_height
         self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
         pygame.display.set_caption("Nebula Dominion")
         
         self.clock = pygame.time.Clock()
-        self.grid = Grid(self.grid_size, self.grid_size)
-        self.game_state = GameState(self.grid)
-        self.ui = UI(self.screen, self.grid, self.game_state)
+        # Report what happens in the match on the console; AI decisions and Q-updates stay off
+        tracer.enable(GAMEPLAY)
+        tracer.echo = True
+        # All game rules live in the headless engine; this class only adds display and input
+        self.engine = GameEngine(self.grid_size, seed=seed)
+        self.grid = self.engine.grid
+        self.grid.cell_size = self.cell_size
+        self.game_state = self.engine.game_state
+        self.ai_rl = self.engine.ai_rl
+        # Let the search AI play the AI's turns, thinking for search_ms per turn
+        if search_ms:
+            self.engine.ai_search = SearchAI(search_ms)
+        # Record the match for replaying with python -m game.recording
+        self.recorder = Recorder(record, self.engine) if record else None
+        # Resume learning from the last session's Q-tables
+        load_engine_checkpoint(self.engine, CHECKPOINT_DIR)
+        self.checkpoint_writer = CheckpointWriter()
+        self.last_checkpoint = time.monotonic()
+        self.toggle_profiling_pending = False  # F3 was pressed; applied once the frame ends
+        self.ui = UI(self.screen, self.grid, self.game_state, self.camera)
+        self.renderer = Renderer(self.screen, self.grid, self.ui, self.draw_bases, self.camera)
         
         # Base locations
-        self.player_base = (0, 0)
-        self.ai_base = (self.grid_size - 1, self.grid_size - 1)
-        
-        # Initialize some units for testing
-        self.initialize_test_units()
-        self.game_over = False
-        self.winner = None
+        self.player_base = self.engine.player_base
+        self.ai_base = self.engine.ai_base
         self.live_obstacles_moved = False
         
-        self.ai_rl = QLearningAI(self.grid_size)
+        # AI turn in progress, advanced a step at a time from the main loop
+        self.ai_steps = None
+        self.ai_animation = None  # (unit, from_cell, to_cell, start_time)
+        self.ai_compute_time = 0.0
+        self.ai_turn_started = 0.0
     
-    def initialize_test_units(self):
-        # Player unit - placed near player base (0,0)
-        player_unit = Corvette(1, 1, "player")
-        if self.grid.add_unit(player_unit):
-            print(f"Added player unit at (1, 1)")
-        
-        # AI unit - placed near AI base (9,9)
-        ai_unit = Corvette(8, 8, "ai")
-        if self.grid.add_unit(ai_unit):
-            print(f"Added AI unit at (8, 8)")
-        
-        # Select player's unit at start
-        self.game_state.select_unit(player_unit)
-        self.grid.calculate_valid_moves(player_unit)
+    @property
+    def game_over(self):
+        return self.engine.game_over
     
-    def ai_turn(self):
-        """AI's turn logic with RL"""
-        ai_units = [unit for unit in self.grid.units if unit.owner == "ai"]
-        player_units = [unit for unit in self.grid.units if unit.owner == "player"]
-        
-        # AI gets 2 moves per turn
-        for move in range(2):
-            print(f"\nAI Move {move + 1}/2:")
-            for unit in ai_units:
-                # RL move
-                old_x, old_y = unit.x, unit.y
-                old_distance = abs(unit.x - self.player_base[0]) + abs(unit.y - self.player_base[1])
-                
-                # Try to attack first if possible
-                attacked = False
-                for player_unit in player_units:
-                    if unit.can_attack(player_unit):
-                        if self.grid.handle_combat(unit, player_unit.x, player_unit.y):
-                            print(f"AI attacked player's {player_unit.__class__.__name__}!")
-                            self.ai_rl.update_q(unit, self.player_base, 15)  # Higher reward for attacking
-                            attacked = True
-                            break
-                
-                if not attacked:
-                    # Move if didn't attack
-                    self.ai_rl.move(unit, self.player_base, self.grid)
-                    new_distance = abs(unit.x - self.player_base[0]) + abs(unit.y - self.player_base[1])
-                    
-                    # Calculate reward based on movement
-                    reward = 0
-                    if new_distance < old_distance:
-                        reward += 4  # Higher reward for getting closer
-                    elif new_distance > old_distance:
-                        reward -= 3  # Higher penalty for moving away
-                    else:
-                        reward -= 1  # Penalty for not moving
-                    
-                    # Additional rewards
-                    if isinstance(self.grid.grid[unit.y, unit.x], ResourceNode):
-                        reward += 8  # Higher reward for capturing resource nodes
-                    
-                    # Reward for being in a good position (near player but not too close)
-                    if 2 <= new_distance <= 4:
-                        reward += 3
-                    
-                    # Penalty for being too close to player (vulnerable position)
-                    if new_distance <= 1:
-                        reward -= 2
-                    
-                    self.ai_rl.update_q(unit, self.player_base, reward)
-                
-                time.sleep(0.3)  # Reduced delay for smoother gameplay
-        
-        self.game_state.next_turn()
-        print("AI turn ended. Player's turn.")
+    @property
+    def winner(self):
+        return self.engine.winner
     
-    def check_win_condition(self):
-        # Player wins if any player unit reaches AI base
-        for unit in self.grid.units:
-            if unit.owner == "player" and (unit.x, unit.y) == self.ai_base:
-                self.game_over = True
-                self.winner = "Player"
-                return
-            if unit.owner == "ai" and (unit.x, unit.y) == self.player_base:
-                self.game_over = True
-                self.winner = "AI"
+    def advance_ai_turn(self):
+        """Run the next AI unit's action once the previous one has finished animating."""
+        now = time.perf_counter()
+        if self.ai_steps is None:
+            print("\nAI's turn starting...")
+            self.ai_steps = self.engine.ai_turn_steps()
+            self.ai_compute_time = 0.0
+            self.ai_turn_started = now
+        if self.ai_animation is not None:
+            if now - self.ai_animation[3] < AI_STEP_DURATION:
                 return
+            self.ai_animation = None
+        
+        try:
+            unit, old_position = next(self.ai_steps)
+        except StopIteration:
+            self.ai_compute_time += time.perf_counter() - now
+            self.ai_steps = None
+            # Check win condition after AI moves
+            self.check_win_condition()
+            total = time.perf_counter() - self.ai_turn_started
+            print(f"AI's turn ended: {self.ai_compute_time * 1000:.1f} ms computing, "
+                  f"{(total - self.ai_compute_time) * 1000:.0f} ms presenting.")
+            if self.engine.ai_search is not None:
+                print(f"AI search: {self.engine.ai_search.turn_report()}")
+            print()
+            self.live_obstacles_moved = False  # Reset flag after AI acts
+            return
+        self.ai_compute_time += time.perf_counter() - now
+        self.ai_animation = (unit, old_position, (unit.x, unit.y), time.perf_counter())
+    
+    def animated_positions(self):
+        """Where to draw units that are mid-animation, as fractional grid cells."""
+        if self.ai_animation is None:
+            return {}
+        unit, (from_x, from_y), (to_x, to_y), start = self.ai_animation
+        progress = min(1.0, (time.perf_counter() - start) / AI_STEP_DURATION)
+        return {unit: (from_x + (to_x - from_x) * progress, from_y + (to_y - from_y) * progress)}
     
-    def draw_bases(self):
+    def check_win_condition(self):
+        self.engine.check_win_condition()
+    
+    def draw_bases(self, surface, camera):
         # Draw player base
-        base_size = self.cell_size
-        player_rect = pygame.Rect(
-            self.player_base[0] * self.cell_size, self.player_base[1] * self.cell_size, base_size, base_size)
-        ai_rect = pygame.Rect(
-            self.ai_base[0] * self.cell_size, self.ai_base[1] * self.cell_size, base_size, base_size)
-        pygame.draw.rect(self.screen, (0, 0, 255), player_rect, 4)  # Blue border
-        pygame.draw.rect(self.screen, (255, 0, 0), ai_rect, 4)      # Red border
+        base_size = camera.cell_size
+        player_rect = pygame.Rect(camera.cell_to_screen(*self.player_base), (base_size, base_size))
+        ai_rect = pygame.Rect(camera.cell_to_screen(*self.ai_base), (base_size, base_size))
+        pygame.draw.rect(surface, (0, 0, 255), player_rect, 4)  # Blue border
+        pygame.draw.rect(surface, (255, 0, 0), ai_rect, 4)      # Red border
+    
+    def toggle_profiling(self):
+        """F3: start or stop timing frames and show or hide the timings, called between frames."""
+        self.toggle_profiling_pending = False
+        profiler.enabled = not profiler.enabled
+        self.renderer.show_profile = profiler.enabled
+    
+    def export_profile(self):
+        """F4: write the timings so far as a CSV and a collapsed-stack profile for flamegraphs."""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.write_csv(os.path.join(PROFILE_DIR, "frame_times.csv"))
+        profiler.write_collapsed(os.path.join(PROFILE_DIR, "frame_times.folded"))
+        print(f"Wrote profile to {PROFILE_DIR}")
+    
+    def quicksave(self):
+        """F5: save the match so far, once the AI has finished its turn."""
+        if self.ai_steps is not None:
+            return
+        os.makedirs(os.path.dirname(QUICKSAVE_PATH), exist_ok=True)
+        save_snapshot(QUICKSAVE_PATH, take_snapshot(self.engine))
+        print(f"Saved game to {QUICKSAVE_PATH}")
+    
+    def quickload(self):
+        """F9: go back to the last quicksave of a match on this map."""
+        if self.recorder is not None:
+            print("Can't load a save while recording")
+            return
+        if not os.path.exists(QUICKSAVE_PATH):
+            print("No quicksave to load")
+            return
+        try:
+            restore_snapshot(self.engine, load_snapshot(QUICKSAVE_PATH))
+        except ValueError as e:
+            print(f"Can't load {QUICKSAVE_PATH}: {e}")
+            return
+        self.ai_steps = None
+        self.ai_animation = None
+        self.grid.valid_moves = set()
+        if self.game_state.selected_unit is not None:
+            self.grid.calculate_valid_moves(self.game_state.selected_unit)
+        print(f"Loaded game from {QUICKSAVE_PATH}")
     
     def run(self):
         while True:
+            with profiler.section("frame"):
+                self.run_frame()
+            # Switch profiling between frames, so no frame is timed only in part
+            if self.toggle_profiling_pending:
+                self.toggle_profiling()
+            self.clock.tick(60)
+    
+    def run_frame(self):
+        with profiler.section("events"):
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    save_engine_checkpoint(self.engine, CHECKPOINT_DIR, self.checkpoint_writer)
+                    self.checkpoint_writer.close()
+                    if self.recorder is not None:
+                        self.recorder.close()
                     pygame.quit()
                     sys.exit()
-                if not self.game_over:
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    self.toggle_profiling_pending = not self.toggle_profiling_pending
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                    self.export_profile()
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F5:
+                    self.quicksave()
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_F9:
+                    self.quickload()
+                elif event.type == pygame.MOUSEWHEEL:
+                    # Zoom around the cursor when it is over the map
+                    mouse = pygame.mouse.get_pos()
+                    self.camera.zoom(event.y, mouse if self.camera.contains_point(*mouse) else None)
+                elif not self.game_over:
                     self.ui.handle_event(event)
                     self.live_obstacles_moved = False  # Reset flag when player acts
             
-            # AI turn
-            if not self.game_over and self.game_state.current_player == "ai":
-                print("\nAI's turn starting...")
-                self.ai_turn()
-                # Check win condition after AI moves
-                self.check_win_condition()
-                print("AI's turn ended.\n")
-                self.live_obstacles_moved = False  # Reset flag after AI acts
-            
-            # Move live obstacles only once per full turn
-            if not self.game_over and not self.live_obstacles_moved:
-                player_units = [u for u in self.grid.units if u.owner == "player"]
-                if player_units:
-                    self.grid.move_live_obstacles(player_units[0])
-                    self.live_obstacles_moved = True
-            
-            # Draw everything
-            self.screen.fill((0, 0, 0))  # Black background
-            self.grid.draw(self.screen)
-            self.draw_bases()
-            self.ui.draw()
-            
-            # Draw win message
-            if self.game_over:
-                font = pygame.font.Font(None, 60)
-                text = f"{self.winner} wins!"
-                text_surface = font.render(text, True, (255, 255, 0))
-                rect = text_surface.get_rect(center=(self.screen_width // 2, self.screen_height // 2))
-                self.screen.blit(text_surface, rect)
-            
-            pygame.display.flip()
-            self.clock.tick(60)
+            # Scroll the map while arrow keys are held
+            keys = pygame.key.get_pressed()
+            pan_x = (keys[pygame.K_RIGHT] - keys[pygame.K_LEFT]) * PAN_SPEED
+            pan_y = (keys[pygame.K_DOWN] - keys[pygame.K_UP]) * PAN_SPEED
+            if pan_x or pan_y:
+                self.camera.pan(pan_x, pan_y)
+        
+        # AI turn, one unit at a time so the window keeps drawing and handling input
+        if not self.game_over and self.game_state.current_player == "ai":
+            with profiler.section("ai_turn"):
+                self.advance_ai_turn()
+        
+        # Move live obstacles only once per full turn
+        if not self.game_over and not self.live_obstacles_moved and self.ai_steps is None:
+            with profiler.section("live_obstacles"):
+                self.engine.move_live_obstacles()
+            self.live_obstacles_moved = True
+        
+        # Periodically save what the AI and live obstacles learned, writing off the main thread
+        if time.monotonic() - self.last_checkpoint > CHECKPOINT_INTERVAL:
+            save_engine_checkpoint(self.engine, CHECKPOINT_DIR, self.checkpoint_writer)
+            self.last_checkpoint = time.monotonic()
+        
+        # Draw everything that changed, with the win message once the game is over
+        banner = f"{self.winner} wins!" if self.game_over else None
+        self.renderer.render(self.animated_positions(), banner)
 
 if __name__ == "__main__":
-    game = NebulaDominion()
+    parser = argparse.ArgumentParser(description="Play Nebula Dominion.")
+    parser.add_argument("--grid-size", type=int, default=10, help="cells per side of the map")
+    parser.add_argument("--cell-size", type=int, default=50, help="starting size of a cell in pixels")
+    parser.add_argument("--seed", type=int, help="map seed; the same seed always gives the same map")
+    parser.add_argument("--record", help="record the match to this file")
+    parser.add_argument("--search-ms", type=float, help="let the search AI play, thinking this long per turn")
+    args = parser.parse_args()
+    game = NebulaDominion(args.grid_size, args.cell_size, args.seed, args.record, args.search_ms)
     game.run() 
\ No newline at end of file
@@ -0,0 +1,66 @@
+import os
+import random
+import sys
+import numpy as np
+import pytest
+
+# Let the tests import the game package however pytest is started
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game.engine import GameEngine
+from game.mapgen import MapLayout
+from game.snapshot import restore_snapshot, take_snapshot
+from game.units import Corvette
+
+NO_CELLS = np.zeros((0, 2), dtype=np.int32)
+
+def walled_engine(size, walls):
+    """An engine on a size x size map with only the given (x, y) walls: no mines, resources or live obstacles."""
+    layout = MapLayout(size, size, 0, np.array(walls, dtype=np.int32).reshape(-1, 2), NO_CELLS, NO_CELLS, NO_CELLS)
+    return GameEngine(size, seed=0, layout=layout)
+
+class Scenario:
+    """A seeded engine crowded with Corvettes, changed at random the ways occupancy can change.
+
+    Caches kept up to date incrementally are checked against a rebuild
+    after each change that changes() yields.
+    """
+    def __init__(self, seed, size, units):
+        self.rng = random.Random(seed)
+        self.engine = GameEngine(size, seed=seed)
+        self.grid = self.engine.grid
+        self.free = np.argwhere(self.grid.passable_mask())[:, ::-1].tolist()  # (x, y) cells
+        for x, y in self.rng.sample(self.free, units):
+            self.grid.add_unit(Corvette(x, y, self.rng.choice(["player", "ai"])))
+        self.start = take_snapshot(self.engine)
+
+    def move_units(self, count):
+        for _ in range(count):
+            unit = self.rng.choice(list(self.grid.units))
+            self.grid.move_unit(unit, unit.x + self.rng.choice([-1, 0, 1]), unit.y + self.rng.choice([-1, 0, 1]))
+
+    def changes(self, steps, batch=3):
+        """Make steps random changes, yielding after every batch of them."""
+        grid = self.grid
+        for step in range(1, steps + 1):
+            roll = self.rng.random()
+            if roll < 0.7:
+                self.move_units(self.rng.randint(1, 5))
+            elif roll < 0.8:
+                self.engine.move_live_obstacles()
+            elif roll < 0.85:
+                restore_snapshot(self.engine, self.start)
+            else:
+                # Moves taken back with the undo journal, as the search AI does
+                grid.journal = []
+                for unit in list(grid.units)[:5]:
+                    grid.move_unit(unit, unit.x + 1, unit.y)
+                grid.undo(0)
+                grid.journal = None
+            if step % batch == 0:
+                yield step
+
+@pytest.fixture
+def scenario():
+    """Factory for a Scenario: scenario(seed, size, units)."""
+    return Scenario
@@ -0,0 +1,42 @@
+import os
+import numpy as np
+import pytest
+from game import checkpoint
+from game.checkpoint import CheckpointError, CheckpointWriter, load_table, write_table
+
+def test_tables_round_trip_and_training_writes_stay_private(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoint, "WRITE_CHUNK", 64)  # Several write calls per table
+    path = tmp_path / "ai.qtable"
+    values = np.arange(300 * 5, dtype=np.float32).reshape(300, 5)
+    write_table(path, values, "v1", (10, 10))
+    loaded = load_table(path, "v1", (10, 10), (300, 5))
+    np.testing.assert_array_equal(loaded, values)
+    if os.name != "nt":
+        assert isinstance(loaded, np.memmap)
+    loaded[0] = -1
+    # Saving over a loaded table leaves it intact, and never wrote its own changes to the file
+    write_table(path, values * 2, "v1", (10, 10))
+    assert loaded[1, 0] == 5
+    np.testing.assert_array_equal(load_table(path, "v1", (10, 10), (300, 5)), values * 2)
+
+def test_mismatched_and_truncated_tables_are_rejected(tmp_path):
+    path = tmp_path / "ai.qtable"
+    write_table(path, np.zeros((4, 3), dtype=np.float32), "v1", (10, 10))
+    with pytest.raises(CheckpointError, match="encoding"):
+        load_table(path, "v2", (10, 10), (4, 3))
+    with pytest.raises(CheckpointError, match="12x12"):
+        load_table(path, "v1", (12, 12), (4, 3))
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 4)
+    with pytest.raises(CheckpointError, match="truncated"):
+        load_table(path, "v1", (10, 10), (4, 3))
+
+def test_writer_saves_the_table_as_it_was_when_submitted(tmp_path):
+    writer = CheckpointWriter()
+    values = np.zeros((1000, 4), dtype=np.float32)
+    for step in range(1, 4):
+        values[:] = step
+        writer.submit(tmp_path / "ai.qtable", values, "v1", (10, 10))
+        values[500:] = -step  # Training goes on while the checkpoint is written
+    writer.close()
+    np.testing.assert_array_equal(load_table(tmp_path / "ai.qtable", "v1", (10, 10), (1000, 4)), 3)
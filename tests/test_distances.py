@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from conftest import walled_engine
+from game.distances import UNCLAIMED_RESOURCES, DistanceField
+from game.grid import NO_ENTITY, WALL
+from game.pathfinding import UNREACHABLE, distance_field
+
+U = UNREACHABLE
+# A 5x5 map walled off along y = 2 except for the gap at (4, 2); the Corvettes start at (1, 1) and (3, 3)
+WALLS = [(0, 2), (1, 2), (2, 2), (3, 2)]
+
+def _fresh_distances(grid, field):
+    """What a full BFS gives for a field's goals on the grid as it is now."""
+    goals = np.zeros((grid.height, grid.width), dtype=bool)
+    if field.goals == UNCLAIMED_RESOURCES:
+        for resource in grid.resources:
+            goals[resource.y, resource.x] = resource.owner is None
+    else:
+        for x, y in field.goals:
+            goals[y, x] = True
+    return distance_field(grid.terrain == WALL, goals, grid.entity_ids != NO_ENTITY)
+
+def test_distances_go_around_walls_and_units():
+    field = walled_engine(5, WALLS).base_distances[(0, 0)]
+    # Occupied cells get the distance they would have if free, but paths don't pass through them:
+    # (2, 3) is reached around the AI Corvette at (3, 3)
+    np.testing.assert_array_equal(field.layer(), [
+        [0, 1, 2, 3, 4],
+        [1, 2, 3, 4, 5],
+        [U, U, U, U, 6],
+        [13, 12, 11, 8, 7],
+        [12, 11, 10, 9, 8],
+    ])
+
+def test_repair_after_blocking_and_reopening_the_gap():
+    engine = walled_engine(5, WALLS)
+    field = engine.base_distances[(0, 0)]
+    field.layer()
+    player, ai = engine.grid.units.owned_by("player")[0], engine.grid.units.owned_by("ai")[0]
+    # Standing just above the gap cuts the bottom half off
+    engine.grid.move_unit(player, 4, 1)
+    np.testing.assert_array_equal(field.layer(), [
+        [0, 1, 2, 3, 4],
+        [1, 2, 3, 4, 5],
+        [U, U, U, U, U],
+        [U, U, U, U, U],
+        [U, U, U, U, U],
+    ])
+    engine.grid.move_unit(ai, 2, 3)
+    engine.grid.move_unit(player, 2, 1)
+    np.testing.assert_array_equal(field.layer(), [
+        [0, 1, 2, 3, 4],
+        [1, 2, 3, 4, 5],
+        [U, U, U, U, 6],
+        [13, 12, 9, 8, 7],
+        [12, 11, 10, 9, 8],
+    ])
+
+@pytest.mark.parametrize("seed", range(6))
+def test_repaired_fields_match_a_fresh_bfs(scenario, seed):
+    size = (10, 20, 40)[seed % 3]
+    match = scenario(seed, size, size)
+    engine, grid = match.engine, match.grid
+    fields = [DistanceField(grid, [engine.player_base]), DistanceField(grid, [engine.ai_base]),
+              DistanceField(grid, UNCLAIMED_RESOURCES)]
+    # Reading after every few changes repairs several at once
+    for _ in match.changes(150):
+        for field in fields:
+            np.testing.assert_array_equal(field.layer(), _fresh_distances(grid, field))
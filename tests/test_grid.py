@@ -0,0 +1,27 @@
+import numpy as np
+from conftest import walled_engine
+from game.grid import NO_ENTITY
+from game.unit_store import OWNER_CODES
+from game.units import Mech
+
+def test_layers_follow_units_as_they_move_and_change_hands():
+    grid = walled_engine(6, []).grid
+    mech = Mech(2, 1, "player")
+    grid.add_unit(mech)
+    assert grid.entity_ids.dtype == np.int32 and grid.owners.dtype == np.int8
+    assert grid.owners[1, 2] == OWNER_CODES["player"]
+    assert grid.get_units_in_range(2, 2, 1, owner="player") == [mech]
+
+    mech.owner = "ai"
+    assert grid.owners[1, 2] == OWNER_CODES["ai"]
+    assert grid.get_units_in_range(2, 2, 1, owner="player") == []
+    assert grid.get_units_in_range(2, 2, 1, owner="ai") == [mech]
+    assert grid.owner_mask("ai")[1, 2]
+
+    # The spatial index and layers keep the new owner after a move
+    grid.move_unit(mech, 2, 3)
+    assert grid.entity_ids[1, 2] == NO_ENTITY and grid.owners[1, 2] == OWNER_CODES[None]
+    assert grid.get_unit_at(2, 3) is mech
+    assert grid.owners[3, 2] == OWNER_CODES["ai"]
+    assert grid.get_units_in_range(2, 3, 0, owner="ai") == [mech]
+    assert grid.hash == grid.compute_hash()
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from conftest import walled_engine
+from game.grid import NO_ENTITY, WALL
+from game.hpa import HierarchicalPathfinder
+from game.pathfinding import UNREACHABLE, distance_field
+
+def _assert_valid_paths(grid, pathfinder, starts, goal):
+    goals = np.zeros((grid.height, grid.width), dtype=bool)
+    goals[goal[1], goal[0]] = True
+    shortest = distance_field(grid.terrain == WALL, goals, grid.entity_ids != NO_ENTITY)
+    for start, path in zip(starts, pathfinder.paths(starts, goal)):
+        if path is None:
+            assert shortest[start[1], start[0]] >= UNREACHABLE
+            continue
+        assert len(path) >= shortest[start[1], start[0]]
+        cell = start
+        for step in path:
+            assert abs(step[0] - cell[0]) + abs(step[1] - cell[1]) == 1
+            assert step == goal or grid.is_valid_position(*step)
+            cell = step
+        assert cell == goal
+        assert pathfinder.paths([start], goal, max_steps=3)[0] == path[:3]
+
+def _assert_same_clusters(pathfinder, fresh):
+    assert fresh.nodes == pathfinder.nodes
+    assert fresh.entrances == pathfinder.entrances
+    assert fresh.node_index == pathfinder.node_index
+    for built, updated in zip(fresh.layers, pathfinder.layers):
+        if built is not None:
+            np.testing.assert_array_equal(built, updated)
+
+def test_path_through_the_only_gap_between_clusters():
+    # A 16x16 map split by a wall along x = 8 except for the gap at (8, 15)
+    grid = walled_engine(16, [(8, y) for y in range(15)]).grid
+    pathfinder = HierarchicalPathfinder(grid, 8)
+    path = pathfinder.path((2, 2), (13, 2))
+    # Down to the gap and back up: 18 steps to (7, 15), 2 through the gap, 17 up to the goal
+    assert len(path) == 37
+    assert path[17:20] == [(7, 15), (8, 15), (9, 15)]
+    assert path[-1] == (13, 2)
+    # Entrances are stored as cell indices, y * 16 + x; the wall leaves one across the bottom right border
+    assert pathfinder.entrances == {
+        (False, 0, 0): [(7 * 16, 8 * 16), (7 * 16 + 7, 8 * 16 + 7)],
+        (False, 1, 0): [(7 * 16 + 9, 8 * 16 + 9), (7 * 16 + 15, 8 * 16 + 15)],
+        (True, 0, 0): [],
+        (True, 0, 1): [(15 * 16 + 7, 15 * 16 + 8)],
+    }
+    # A unit standing in the gap closes the entrance and the path with it
+    grid.move_unit(grid.units.owned_by("player")[0], 8, 15)
+    assert pathfinder.path((2, 2), (13, 2)) is None
+    assert pathfinder.entrances[(True, 0, 1)] == []
+
+@pytest.mark.parametrize("seed", range(4))
+def test_incremental_clusters_match_a_fresh_build(scenario, seed):
+    size = (10, 40, 70)[seed % 3]
+    match = scenario(seed, size, size * 2)
+    engine, grid, rng = match.engine, match.grid, match.rng
+    pathfinder = HierarchicalPathfinder(grid, (8, 16)[seed % 2])
+    for _ in match.changes(60, batch=4):
+        units = list(grid.units)
+        starts = [(unit.x, unit.y) for unit in rng.sample(units, min(10, len(units)))]
+        goal = rng.choice([engine.ai_base, engine.player_base, tuple(rng.choice(match.free))])
+        _assert_valid_paths(grid, pathfinder, starts, goal)
+
+        fresh = HierarchicalPathfinder(grid, pathfinder.size)
+        fresh.refresh()
+        pathfinder.refresh()
+        _assert_same_clusters(pathfinder, fresh)
+        grid.change_listeners.remove(fresh)
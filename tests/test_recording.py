@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+from game.engine import GameEngine
+from game.recording import Recorder, Recording, replay
+from game.units import Corvette, Dreadnought
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _record_match(path):
+    """A seeded match with units added while recording and an Area Attack with two enemies in range."""
+    engine = GameEngine(12, seed=1)
+    grid = engine.grid
+    with Recorder(path, engine):
+        # The AI's first unit, id 1, starts at (10, 10)
+        assert grid.add_unit(Corvette(9, 10, "ai"))
+        dreadnought = Dreadnought(9, 9, "player")
+        assert grid.add_unit(dreadnought)
+        health = {unit.unit_id: unit.health for unit in grid.units.owned_by("ai")}
+        assert grid.use_ability(dreadnought, "Area Attack")
+        hit = [unit.unit_id for unit in grid.units.owned_by("ai") if unit.health < health[unit.unit_id]]
+        for _ in range(20):
+            engine.play_round()
+            if engine.game_over:
+                break
+    return engine, hit
+
+def test_area_attack_hits_the_lowest_unit_id_in_range(tmp_path):
+    engine, hit = _record_match(tmp_path / "match.rec")
+    # Both AI units are in range; only the first one found is hit
+    assert hit == [1]
+
+def test_replay_in_another_process_reaches_the_recorded_position(tmp_path):
+    path = tmp_path / "match.rec"
+    engine, _ = _record_match(path)
+    assert replay(Recording(path)).grid.hash == engine.grid.hash
+    script = "import sys; from game.recording import Recording, replay; print(replay(Recording(sys.argv[1])).grid.hash)"
+    result = subprocess.run([sys.executable, "-c", script, str(path)], cwd=ROOT, capture_output=True, text=True,
+                            check=True)
+    assert int(result.stdout) == engine.grid.hash
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from conftest import NO_CELLS
+from game.engine import GameEngine
+from game.mapgen import MapLayout
+from game.snapshot import engine_from_snapshot, load_snapshot, restore_snapshot, save_snapshot, take_snapshot
+from game.units import Dreadnought, Drone
+
+def _match():
+    """A 12x12 match with a captured resource node, a dead unit's freed id and some spent resources."""
+    layout = MapLayout(12, 12, 0, np.array([(5, 5), (6, 5)], dtype=np.int32), NO_CELLS,
+                       np.array([(3, 1), (8, 8)], dtype=np.int32), np.array([(9, 2)], dtype=np.int32))
+    engine = GameEngine(12, seed=0, layout=layout)
+    grid = engine.grid
+    for unit in (Drone(2, 2, "player"), Dreadnought(7, 7, "ai"), Drone(4, 4, "ai")):
+        grid.add_unit(unit)
+    grid.move_unit(grid.units.owned_by("player")[0], 3, 1)  # Captures (3, 1)
+    for unit_id, health in ((2, 0), (3, 77)):  # Kill the Drone at (2, 2) and wound the Dreadnought
+        unit = grid.units.get(unit_id)
+        grid._begin_unit_change(unit)
+        unit.health = health
+        grid._end_unit_change(unit)
+    grid.remove_dead_units()
+    engine.game_state.current_turn = 4
+    engine.game_state.player_resources = 35
+    return engine
+
+def _units(engine):
+    return [(unit.unit_id, type(unit).__name__, unit.owner, unit.x, unit.y, unit.health)
+            for unit in engine.grid.units]
+
+def test_save_and_load_keep_units_resources_and_hash(tmp_path):
+    engine = _match()
+    save_snapshot(tmp_path / "match.snap", take_snapshot(engine))
+    clone = engine_from_snapshot(load_snapshot(tmp_path / "match.snap"))
+    assert _units(clone) == _units(engine) == [
+        (0, "Corvette", "player", 3, 1, 60), (1, "Corvette", "ai", 10, 10, 60),
+        (4, "Drone", "ai", 4, 4, 40), (3, "Dreadnought", "ai", 7, 7, 77)]
+    assert clone.grid.units.owned_by("ai") == [clone.grid.units.get(i) for i in (1, 3, 4)]
+    assert clone.grid.units.get(2) is None
+    assert [(r.x, r.y, r.owner) for r in clone.grid.resources] == [(3, 1, "player"), (8, 8, None)]
+    assert [(obs.x, obs.y) for obs in clone.grid.live_obstacles] == [(9, 2)]
+    assert (clone.game_state.current_turn, clone.game_state.player_resources) == (4, 35)
+    assert clone.grid.hash == clone.grid.compute_hash() == engine.grid.hash
+    for name in ("terrain", "entity_ids", "owners"):
+        np.testing.assert_array_equal(getattr(clone.grid, name), getattr(engine.grid, name))
+    # New units get the ids after the last one issued, as they would have in the saved match
+    clone.grid.add_unit(Drone(1, 4, "player"))
+    assert clone.grid.units.get(5).x == 1
+
+@pytest.mark.parametrize("mapped", [False, True])
+def test_changes_after_restoring_leave_the_snapshot_alone(tmp_path, monkeypatch, mapped):
+    engine = _match()
+    snapshot = take_snapshot(engine)
+    if mapped:
+        # Map every array, so the restored layers are copy-on-write maps of the file
+        monkeypatch.setattr("game.snapshot.MAP_THRESHOLD", 1)
+        save_snapshot(tmp_path / "match.snap", snapshot)
+        snapshot = load_snapshot(tmp_path / "match.snap")
+    saved = {name: np.array(layer) for name, layer in snapshot.layers.items()}
+    columns = {name: np.array(column) for name, column in snapshot.columns.items()}
+    restore_snapshot(engine, snapshot)
+    grid = engine.grid
+    if mapped:
+        assert isinstance(grid.entity_ids, np.memmap)
+
+    dreadnought = grid.units.get(3)
+    grid.move_unit(dreadnought, 7, 8)
+    grid._begin_unit_change(dreadnought)
+    dreadnought.health = 1
+    grid._end_unit_change(dreadnought)
+    grid.units.get(0).owner = "ai"
+    for name, layer in snapshot.layers.items():
+        np.testing.assert_array_equal(layer, saved[name])
+    for name, column in snapshot.columns.items():
+        np.testing.assert_array_equal(column, columns[name])
+
+    restore_snapshot(engine, snapshot)
+    assert (grid.units.get(3).x, grid.units.get(3).y, grid.units.get(3).health) == (7, 7, 77)
+    assert grid.units.get(0).owner == "player"
+    assert grid.hash == grid.compute_hash()
+    if mapped:
+        assert (load_snapshot(tmp_path / "match.snap").layers["entity_ids"] == saved["entity_ids"]).all()
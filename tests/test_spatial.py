@@ -0,0 +1,30 @@
+from game.spatial import SpatialIndex
+from game.units import Corvette
+
+def _units(cells, owner="ai"):
+    units = []
+    for unit_id, (x, y) in enumerate(cells):
+        unit = Corvette(x, y, owner)
+        unit.unit_id = unit_id
+        units.append(unit)
+    return units
+
+def test_query_returns_units_in_id_order_whatever_the_insertion_order():
+    units = _units([(3, 3), (4, 3), (3, 4), (12, 3), (2, 3)])
+    forwards, backwards = SpatialIndex(bucket_size=8), SpatialIndex(bucket_size=8)
+    for unit in units:
+        forwards.insert(unit)
+    for unit in reversed(units):
+        backwards.insert(unit)
+    expected = [0, 1, 2, 4]  # (12, 3) is 9 steps from (3, 3)
+    assert [unit.unit_id for unit in forwards.query(3, 3, 2)] == expected
+    assert [unit.unit_id for unit in backwards.query(3, 3, 2)] == expected
+
+def test_moved_unit_is_found_only_at_its_new_cell():
+    index = SpatialIndex(bucket_size=4)
+    unit, = _units([(1, 1)])
+    index.insert(unit)
+    unit.x, unit.y = 9, 9
+    index.move(unit)
+    assert index.query(1, 1, 2) == []
+    assert index.query(9, 9, 0) == [unit]
@@ -0,0 +1,44 @@
+from conftest import walled_engine
+from game.units import Dreadnought, Drone, Mech
+
+def _add_units(grid):
+    units = [Mech(2, 1, "player"), Dreadnought(3, 1, "ai"), Drone(4, 1, "player")]
+    for unit in units:
+        assert grid.add_unit(unit)
+    return units
+
+def test_swap_remove_keeps_ids_rows_and_cells_in_step():
+    grid = walled_engine(6, []).grid
+    mech, dreadnought, drone = _add_units(grid)
+    mech.health = 0
+    assert grid.remove_dead_units()
+
+    # The last row, the Drone's, moved into the Mech's
+    assert grid.units.rows[mech.unit_id] is None
+    assert grid.units.get(mech.unit_id) is None
+    assert grid.units.rows[drone.unit_id] == 2
+    assert grid.units.views[2] is drone
+    assert (drone.x, drone.y, drone.owner, drone.health) == (4, 1, "player", 40)
+    assert (mech.x, mech.y, mech.health) == (2, 1, 0)  # Answered from its last values
+    assert grid.get_unit_at(2, 1) is None
+    for row, unit in enumerate(grid.units):
+        assert grid.units.rows[unit.unit_id] == row
+        assert grid.units.get(unit.unit_id) is unit
+        assert grid.entities[int(grid.entity_ids[unit.y, unit.x])] is unit
+    assert grid.units.owned_by("player") == [grid.units.get(0), drone]
+
+    # Ids are never reused, so a new unit doesn't take the Mech's
+    mech = Mech(2, 1, "player")
+    grid.add_unit(mech)
+    assert mech.unit_id == 5
+    assert grid.get_unit_at(2, 1) is mech
+    assert grid.units.get(dreadnought.unit_id) is dreadnought
+
+def test_owner_change_moves_the_unit_between_owner_lists():
+    grid = walled_engine(6, []).grid
+    mech, dreadnought, drone = _add_units(grid)
+    mech.owner = "ai"
+    assert mech.owner == "ai"
+    assert grid.units.column("owner")[grid.units.rows[mech.unit_id]] == 2
+    assert mech not in grid.units.owned_by("player")
+    assert grid.units.owned_by("ai")[-1] is mech
@@ -0,0 +1,62 @@
+import pytest
+from conftest import walled_engine
+from game.engine import greedy_player_policy
+from game.search import SearchAI
+from game.snapshot import engine_from_snapshot, load_snapshot, restore_snapshot, save_snapshot, take_snapshot
+from game.zobrist import UNIT_FEATURE, zobrist_key
+
+def test_keys_and_hashes_are_the_same_in_every_process():
+    # (UNIT_FEATURE, unit 0, cell 6, health 60, no flags): the player's Corvette at (1, 1) on a 5x5 map
+    assert zobrist_key(UNIT_FEATURE, 0, 6, 60, 0) == 4871137006544159165
+    grid = walled_engine(5, []).grid
+    assert grid.hash == 1294207567177047690
+    grid.move_unit(grid.units.owned_by("player")[0], 2, 1)
+    assert grid.hash == 15078270450181848919
+
+def test_move_orders_reach_the_same_hash_and_undo_restores_it():
+    grid = walled_engine(5, []).grid
+    player, ai = grid.units.owned_by("player")[0], grid.units.owned_by("ai")[0]
+    before = grid.hash
+    grid.journal = []
+    grid.move_unit(player, 2, 1)
+    grid.move_unit(ai, 3, 2)
+    after = grid.hash
+    grid.undo(0)
+    assert grid.hash == before
+    grid.move_unit(ai, 3, 2)
+    grid.move_unit(player, 2, 1)
+    assert grid.hash == after
+    grid.undo(0)
+    assert grid.hash == before == grid.compute_hash()
+
+@pytest.mark.parametrize("seed", range(4))
+def test_incremental_hash_matches_recompute(scenario, seed):
+    match = scenario(seed, 12, 12)
+    grid = match.grid
+    for _ in match.changes(60, batch=1):
+        assert grid.hash == grid.compute_hash()
+
+def test_hash_follows_a_match_with_combat_and_the_search_ai(tmp_path):
+    engine = walled_engine(8, [(3, 3), (4, 4)])
+    grid = engine.grid
+    start = take_snapshot(engine)
+    engine.ai_search = SearchAI(20)
+    for _ in range(10):
+        greedy_player_policy(engine)
+        assert grid.hash == grid.compute_hash()
+        engine.end_player_turn()
+        engine.ai_turn()
+        assert grid.hash == grid.compute_hash()
+        engine.check_win_condition()
+        if engine.game_over:
+            break
+
+    end = take_snapshot(engine)
+    end_hash = grid.hash
+    restore_snapshot(engine, start)
+    assert grid.hash == grid.compute_hash() == start.state["hash"]
+    restore_snapshot(engine, end)
+    assert grid.hash == grid.compute_hash() == end_hash
+    save_snapshot(tmp_path / "end.snap", end)
+    clone = engine_from_snapshot(load_snapshot(tmp_path / "end.snap"))
+    assert clone.grid.hash == clone.grid.compute_hash() == end_hash